@@ -5,7 +5,7 @@ import re # importing re(regex for cleaning)
 import unicodedata # to clean the Unicode data
 from langchain_text_splitters import CharacterTextSplitter
 
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings # for AI model object and embeddings
+from langchain_openai import ChatOpenAI # for AI model object
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser # parsing the Pydantic models using langchain parsers
 
@@ -15,6 +15,10 @@ from langchain_core.documents import Document # for the chunking model
 
 import time # for latency calculations
 
+from GenAIRequests.telemetry import StageTimer
+from GenAIRequests.RAG_Requests import retrieve_documents, embeddings_model
+from GenAIRequests.cassette import cassette_http_client
+
 
 # 1. Load PDF with PyPDF
 
@@ -126,7 +130,7 @@ print("Total chunks:", len(documents))
 
 # Embedding and storing, i.e. Creating the vector store using FAISS
 
-vectorstore = FAISS.from_documents(documents=documents, embedding=OpenAIEmbeddings(model= "text-embedding-3-small",api_key=API_KEY))
+vectorstore = FAISS.from_documents(documents=documents, embedding=embeddings_model())
 
 retriever = vectorstore.as_retriever() # setup retriever
 
@@ -137,7 +141,8 @@ parser = PydanticOutputParser(pydantic_object=QuizResponse)
 llm = ChatOpenAI(
     model="gpt-4.1-mini",
     temperature=0.3,
-    api_key=API_KEY
+    api_key=API_KEY,
+    http_client=cassette_http_client()
 )
 
 # Defining the prompt using ChatPromptTemplate to use variables inside the prompt
@@ -156,13 +161,15 @@ Total marks: {total_marks}
 """)
 
 
-def generate_quiz_rag_plus_llm(request, retriever):
+def generate_quiz_rag_plus_llm(request, retriever, timer: StageTimer = None):
     """This function implements the RAG functionality to generate the quiz taking the QuizRequest and retriever"""
+    timer = timer or StageTimer()
 
     # Retrieving relevant chunks
-    docs = retriever.invoke(request.topic)
+    docs = retrieve_documents(retriever, request.topic, timer)
 
     # Combining retrieved context
+    prompt_start = time.perf_counter()
     context = "\n\n".join(
         f"(Page {d.metadata['page']}) {d.page_content}"
         for d in docs
@@ -177,6 +184,7 @@ def generate_quiz_rag_plus_llm(request, retriever):
         total_marks=request.total_marks,
         format_instructions=parser.get_format_instructions(),
     )
+    timer.add("prompt_assembly", (time.perf_counter() - prompt_start) * 1000)
 
     start = time.perf_counter()
 
@@ -186,23 +194,34 @@ def generate_quiz_rag_plus_llm(request, retriever):
 
     end = time.perf_counter()
     latency = end -  start
+    timer.add("llm", latency * 1000)
+
+    with timer.span("parsing"):
+        quiz = parser.parse(response.content)
 
     cost_info = {
+        "model_name": llm.model_name,
         "prompt_tokens": cb.prompt_tokens,
         "completion_tokens": cb.completion_tokens,
         "total_tokens": cb.total_tokens,
         "cost_usd": f"{cb.total_cost:.6f}",
-        "Latency (time taken)": f"{latency:.2f}"
+        "Latency (time taken)": f"{latency:.2f}",
+        "latency_ms": round(latency * 1000, 3),  # unrounded numeric latency for the telemetry table
+        "cached_tokens": getattr(cb, "prompt_tokens_cached", 0),
+        "stages": timer.as_dict()
     }
 
     # returning the parsed response
-    return parser.parse(response.content), cost_info
+    return quiz, cost_info
 
 
-def generate_quiz_rag_only(request, retriever):
+def generate_quiz_rag_only(request, retriever, timer: StageTimer = None):
     """This function instructs the prompt to use the RAG only"""
+    timer = timer or StageTimer()
     query = request.model_dump_json()
-    docs = retriever.invoke(query)
+    docs = retrieve_documents(retriever, query, timer)
+
+    prompt_start = time.perf_counter()
     context = "\n\n".join([doc.page_content for doc in docs])
 
     # Augmenting the context in the prompt
@@ -224,6 +243,7 @@ def generate_quiz_rag_only(request, retriever):
 
     {parser.get_format_instructions()}
     """
+    timer.add("prompt_assembly", (time.perf_counter() - prompt_start) * 1000)
     start = time.perf_counter()
 
     # Tracking the cost and generating the quiz using context with in the prompt
@@ -232,16 +252,24 @@ def generate_quiz_rag_only(request, retriever):
 
     end = time.perf_counter()
     latency = end - start
+    timer.add("llm", latency * 1000)
+
+    with timer.span("parsing"):
+        quiz = parser.parse(response.content) # parsing the response to get the correct structure
 
     cost_info = {
+        "model_name": llm.model_name,
         "prompt_tokens": cb.prompt_tokens,
         "completion_tokens": cb.completion_tokens,
         "total_tokens": cb.total_tokens,
         "cost_usd": f"{cb.total_cost :.6f}",
-        "Latency (time taken)": f"{latency:.2f}"
+        "Latency (time taken)": f"{latency:.2f}",
+        "latency_ms": round(latency * 1000, 3),  # unrounded numeric latency for the telemetry table
+        "cached_tokens": getattr(cb, "prompt_tokens_cached", 0),
+        "stages": timer.as_dict()
     }
 
-    return parser.parse(response.content), cost_info # parsing the response to get the correct structure
+    return quiz, cost_info
 
 
 # the dunder main
@@ -261,6 +289,14 @@ if __name__ == "__main__":
 
     quiz, costs = generate_quiz_rag_plus_llm(quiz_request, retriever)
 
+    # Recording the call in the telemetry table like the generation routes do
+    import uuid
+    from app import create_app
+    from routes.metrics import record_llm_call
+
+    with create_app().app_context():
+        record_llm_call(uuid.uuid4().hex, "quiz_rag_pdf", costs, costs["stages"])
+
     print(f"model: {llm.model_name}")
     print(costs)
     print(quiz.title)
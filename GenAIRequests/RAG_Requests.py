@@ -16,36 +16,55 @@ from langchain_community.vectorstores import FAISS
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from GenAIRequests.quiz_ai_requests import QuizRequest, QuizResponse, MODEL_PRICING
 from langchain_community.callbacks import get_openai_callback
+from GenAIRequests.telemetry import StageTimer
+from GenAIRequests.cassette import cassette_http_client, cassette_api_key, cassette_enabled
 import time
 
 
 load_dotenv()
 
-API_KEY = os.getenv("OPENAI_API_KEY")
+API_KEY = cassette_api_key(os.getenv("OPENAI_API_KEY"))
 
 
-def setup_rag_components(model_name: str = "gpt-4.1-mini", temperature: float = 0.3):
+def embeddings_model():
+    """This function returns the embeddings model used for the vector stores. With a cassette on or a local stand-in
+    server in OPENAI_BASE_URL, the texts are sent as they are instead of being tokenized first, as the tokenizer
+    download would need the network"""
+    offline = cassette_enabled() or bool(os.getenv("OPENAI_BASE_URL"))
+    return OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        api_key=API_KEY,
+        http_client=cassette_http_client(),
+        check_embedding_ctx_length=not offline
+    )
+
+
+def setup_rag_components(model_name: str = "gpt-4.1-mini", temperature: float = 0.3, timer: StageTimer = None):
     """This function sets up the basic RAG components to be used in the subsequent requests"""
+    timer = timer or StageTimer()
     # Get the directory of the current file
     current_dir = os.path.dirname(os.path.abspath(__file__))
     file_path = os.path.join(current_dir, "AND_Logic.txt")
 
     # 1. Load
-    loader = TextLoader(file_path)
-    docs = loader.load()
+    with timer.span("document_load"):
+        loader = TextLoader(file_path)
+        docs = loader.load()
     print(f"Loaded {len(docs)} documents!")
 
     # 2. Split
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=50)
-    chunks = text_splitter.split_documents(docs)
+    with timer.span("chunking"):
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=50)
+        chunks = text_splitter.split_documents(docs)
     print(f"Document split into {len(chunks)} chunks!")
 
     # 3. Embed & 4. Store
     print("Creating vector store")
-    vectorstore = FAISS.from_documents(documents=chunks, embedding=OpenAIEmbeddings(model= "text-embedding-3-small",api_key=API_KEY))
+    with timer.span("index_embedding"):
+        vectorstore = FAISS.from_documents(documents=chunks, embedding=embeddings_model())
     print("Vector store created successfully")
 
-    model = ChatOpenAI(model=model_name, api_key=API_KEY, temperature=temperature)
+    model = ChatOpenAI(model=model_name, api_key=API_KEY, temperature=temperature, http_client=cassette_http_client())
     print(f"model: {model.model_name}")
     # setup retriever
     retriever = vectorstore.as_retriever()
@@ -53,12 +72,44 @@ def setup_rag_components(model_name: str = "gpt-4.1-mini", temperature: float =
     return retriever, model
 
 
-def generate_quiz_with_rag(req, retriever, model):
+def callback_cost(cb, model_name):
+    """This function returns the cost tracked by a get_openai_callback, calculating it manually if LangChain callback
+    doesn't support the model (e.g. gpt-4o-mini)"""
+    total_cost = cb.total_cost
+    if total_cost == 0 and cb.total_tokens > 0:
+        pricing_key = model_name if model_name in MODEL_PRICING else "gpt-4.1-mini"
+        if pricing_key in MODEL_PRICING:
+            input_cost = (cb.prompt_tokens * MODEL_PRICING[pricing_key]["input"] / 1000)
+            output_cost = (cb.completion_tokens * MODEL_PRICING[pricing_key]["output"] / 1000)
+            total_cost = input_cost + output_cost
+
+    return total_cost
+
+
+def retrieve_documents(retriever, query, timer):
+    """This function runs the retriever, timing the query embedding and the vector search as separate stages when the
+    retriever is a plain similarity search over a vector store"""
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None or vectorstore.embeddings is None or retriever.search_type != "similarity":
+        with timer.span("retrieval"):
+            return retriever.invoke(query)
+
+    # Doing the two halves of retriever.invoke() ourselves
+    with timer.span("embedding"):
+        query_vector = vectorstore.embeddings.embed_query(query)
+    with timer.span("retrieval"):
+        return vectorstore.similarity_search_by_vector(query_vector, **retriever.search_kwargs)
+
+
+def generate_quiz_with_rag(req, retriever, model, timer: StageTimer = None):
     """Using the function defined above, this function creates a quiz."""
+    timer = timer or StageTimer()
     # Retrieving the context to be used in the prompt for RAG, but first converting the whole request to JSON object so
     # that it can be passed as a whole to the retriever object
     query = req.model_dump_json()
-    docs = retriever.invoke(query)
+    docs = retrieve_documents(retriever, query, timer)
+
+    prompt_start = time.perf_counter()
     context = "\n\n".join([doc.page_content for doc in docs])
 
     # Augmenting the context in the prompt
@@ -71,6 +122,7 @@ def generate_quiz_with_rag(req, retriever, model):
     
     Generate exactly {req.num_questions} questions. The total marks for the quiz should be {req.total_marks}.
     """
+    timer.add("prompt_assembly", (time.perf_counter() - prompt_start) * 1000)
 
     start = time.perf_counter()
 
@@ -81,15 +133,9 @@ def generate_quiz_with_rag(req, retriever, model):
     end = time.perf_counter()
 
     latency = end - start
+    timer.add("llm", latency * 1000)
 
-    # Calculate cost manually if LangChain callback doesn't support the model (e.g. gpt-4o-mini)
-    total_cost = cb.total_cost
-    if total_cost == 0 and cb.total_tokens > 0:
-        pricing_key = model.model_name if model.model_name in MODEL_PRICING else "gpt-4.1-mini"
-        if pricing_key in MODEL_PRICING:
-            input_cost = (cb.prompt_tokens * MODEL_PRICING[pricing_key]["input"] / 1000)
-            output_cost = (cb.completion_tokens * MODEL_PRICING[pricing_key]["output"] / 1000)
-            total_cost = input_cost + output_cost
+    total_cost = callback_cost(cb, model.model_name)
 
     cost_info = {
         "model_name": model.model_name,
@@ -97,7 +143,10 @@ def generate_quiz_with_rag(req, retriever, model):
         "completion_tokens": cb.completion_tokens,
         "total_tokens": cb.total_tokens,
         "cost_usd": f"{total_cost :.6f}",
-        "Latency (time taken)": f"{latency :.2f}"
+        "Latency (time taken)": f"{latency :.2f}",
+        "latency_ms": round(latency * 1000, 3),  # unrounded numeric latency for the telemetry table
+        "cached_tokens": getattr(cb, "prompt_tokens_cached", 0),
+        "stages": timer.as_dict()
     }
 
     return response, cost_info
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+import httpx
+
+# Record/replay ("cassette") layer for every OpenAI call. It sits at the HTTP transport level, underneath the OpenAI
+# SDK, ChatOpenAI and OpenAIEmbeddings, so everything above it (parsing, validation, DB persistence) runs unchanged.
+#
+#   OPENAI_CASSETTE_MODE     off (default) | record | replay
+#   OPENAI_CASSETTE_DIR      where the fixture files live, GenAIRequests/cassettes by default
+#   OPENAI_CASSETTE_LATENCY  synthetic latency on replay: 0 (default), "recorded", a fixed number of ms or "min-max" ms
+
+DEFAULT_CASSETTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes")
+
+# Any non-empty key will do on replay as the requests never leave the machine
+REPLAY_API_KEY = "sk-cassette-replay"
+
+
+def cassette_mode() -> str:
+    return os.getenv("OPENAI_CASSETTE_MODE", "off").lower()
+
+
+def cassette_enabled() -> bool:
+    return cassette_mode() in ("record", "replay")
+
+
+def request_key(request: httpx.Request) -> str:
+    """This function returns a stable key for a request made of its method, path and JSON body. The host and the
+    headers (API key, SDK version, retry count...) are left out so a fixture replays against any base URL"""
+    body = request.read() or b""
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":")).encode()
+    except ValueError:
+        # Not JSON, hashing the raw bytes with the random boundary of a multipart body (e.g. a file upload) left out
+        _, _, boundary = request.headers.get("content-type", "").partition("boundary=")
+        if boundary:
+            body = body.replace(boundary.encode(), b"")
+
+    digest = hashlib.sha256(request.method.encode() + b" " + request.url.path.encode() + b"\n" + body).hexdigest()
+    return digest[:32]
+
+
+def request_body(request: httpx.Request):
+    """This function returns the body of a request for its fixture, parsed when it is JSON and as text otherwise (e.g.
+    a multipart file upload)"""
+    if not request.content:
+        return None
+    try:
+        return json.loads(request.content)
+    except ValueError:
+        return request.content.decode("utf-8", errors="replace")
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """This class is an httpx transport which either records the real responses of the wrapped transport into one
+    JSON fixture file per request, or replays them from those files without touching the network"""
+
+    def __init__(self, mode: str, directory: str = DEFAULT_CASSETTE_DIR, latency: Optional[str] = None,
+                 wrapped: Optional[httpx.BaseTransport] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode '{mode}', expected 'record' or 'replay'")
+
+        self.mode = mode
+        self.directory = directory
+        self.latency = latency or "0"
+        self.wrapped = wrapped or httpx.HTTPTransport(retries=2)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _fixture_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _synthetic_delay(self, key: str, recorded_ms: float) -> float:
+        """This function returns the replay delay in seconds. Random ranges are seeded with the request key so the
+        same request always gets the same delay"""
+        if self.latency == "recorded":
+            return recorded_ms / 1000
+        if "-" in self.latency:
+            low, high = (float(x) for x in self.latency.split("-", 1))
+            return random.Random(key).uniform(low, high) / 1000
+        return float(self.latency) / 1000
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = request_key(request)
+        path = self._fixture_path(key)
+
+        if self.mode == "replay":
+            if not os.path.exists(path):
+                # A 404 isn't retried by the SDK, so a missing fixture fails fast with a readable message
+                return httpx.Response(404, json={"error": {
+                    "message": f"No cassette recorded for {request.method} {request.url.path} (key {key})",
+                    "type": "cassette_miss"
+                }}, request=request)
+
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+
+            time.sleep(self._synthetic_delay(key, entry.get("duration_ms", 0)))
+            body = entry["response"]["body"]
+            content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+            return httpx.Response(entry["response"]["status_code"], headers={"content-type": entry["response"]["content_type"]},
+                                  content=content, request=request)
+
+        start = time.perf_counter()
+        response = self.wrapped.handle_request(request)
+        response.read()
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        # Only successes are recorded, a rate limit or a server error would otherwise replay forever
+        if not response.is_success:
+            return response
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = response.text
+
+        entry = {
+            "request": {
+                "method": request.method,
+                "path": request.url.path,
+                "body": request_body(request)
+            },
+            "response": {
+                "status_code": response.status_code,
+                "content_type": response.headers.get("content-type", "application/json"),
+                "body": body
+            },
+            "duration_ms": round(duration_ms, 3)
+        }
+
+        # Writing to a temporary file first so a concurrent replay never reads half a fixture
+        with self._lock:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, indent=2)
+            os.replace(tmp_path, path)
+
+        return response
+
+    def close(self):
+        self.wrapped.close()
+
+
+def cassette_http_client() -> Optional[httpx.Client]:
+    """This function returns an httpx client using the cassette transport when OPENAI_CASSETTE_MODE is record or
+    replay, and None otherwise so the SDKs keep their own default client"""
+    if not cassette_enabled():
+        return None
+
+    transport = CassetteTransport(
+        cassette_mode(),
+        os.getenv("OPENAI_CASSETTE_DIR", DEFAULT_CASSETTE_DIR),
+        os.getenv("OPENAI_CASSETTE_LATENCY")
+    )
+    return httpx.Client(transport=transport, timeout=httpx.Timeout(600, connect=5))
+
+
+def cassette_api_key(api_key: Optional[str]) -> Optional[str]:
+    """This function returns the real API key, or a placeholder when replaying without one"""
+    if not api_key and cassette_mode() == "replay":
+        return REPLAY_API_KEY
+    return api_key
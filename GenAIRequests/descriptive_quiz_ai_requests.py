@@ -6,6 +6,8 @@ from pydantic import BaseModel, Field
 from typing import List
 import time
 
+from GenAIRequests.cassette import cassette_http_client, cassette_api_key
+
 # Pydantic model for a descriptive question
 class DescriptiveQuestion(BaseModel):
     question: str
@@ -29,8 +31,8 @@ class DescriptiveQuizResponse(BaseModel):
 # Setting up the client for OpenAI requests
 
 load_dotenv()
-API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=API_KEY)
+API_KEY = cassette_api_key(os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=API_KEY, http_client=cassette_http_client()) # records/replays the calls when a cassette is on
 
 SYSTEM_ROLE = "You are a teacher of Bachelor Level Digital Logic Design"
 
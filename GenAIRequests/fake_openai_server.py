@@ -0,0 +1,297 @@
+import argparse
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI API which speaks just enough of the Responses, Chat Completions and Embeddings
+# endpoints for the quiz generation pipeline. Structured outputs are filled in from the JSON schema sent with the
+# request, embeddings are deterministic pseudo-random unit vectors, and every endpoint sleeps for a latency drawn from
+# a configurable distribution:
+#
+#   constant:800           always 800 ms
+#   uniform:200-1500       uniformly between 200 and 1500 ms
+#   lognormal:800,0.5      log-normal with an 800 ms median and sigma 0.5 (long right tail like the real API)
+#
+# output_token_ms adds a generation time per output token on top of it, so a call returning more (e.g. the grades of a
+# batch of answers) takes longer like it does on the real API.
+
+
+def parse_latency(spec: str):
+    """This function turns a latency spec into a function returning a delay in seconds"""
+    kind, _, params = spec.partition(":")
+    if kind == "constant":
+        value = float(params or 0)
+        return lambda: value / 1000
+    if kind == "uniform":
+        low, high = (float(x) for x in params.split("-"))
+        return lambda: random.uniform(low, high) / 1000
+    if kind == "lognormal":
+        median, sigma = (float(x) for x in params.split(","))
+        return lambda: random.lognormvariate(math.log(median), sigma) / 1000
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _resolve(schema: dict, defs: dict) -> dict:
+    if "$ref" in schema:
+        return defs[schema["$ref"].split("/")[-1]]
+    if "anyOf" in schema:
+        return _resolve(next(s for s in schema["anyOf"] if s.get("type") != "null"), defs)
+    return schema
+
+
+def fake_instance(schema: dict, defs: dict, hints: dict, name: str = "value", index: int = 1):
+    """This function builds a value matching a JSON schema. hints carries the numbers read from the prompt, so a quiz
+    gets the requested number of questions and total marks"""
+    schema = _resolve(schema, defs)
+    kind = schema.get("type")
+
+    if kind == "object":
+        value = {prop: fake_instance(sub, defs, hints, prop, index) for prop, sub in schema.get("properties", {}).items()}
+        # Keeping MCQs consistent: the correct answer has to be one of the options
+        if isinstance(value.get("options"), list) and value["options"] and "correct_answer" in value:
+            value["correct_answer"] = value["options"][0]
+        return value
+    if kind == "array":
+        counts = {"questions": hints["num_questions"], "options": 4, "grades": len(hints["answer_ids"])}
+        count = counts.get(name, 2)
+        return [fake_instance(schema.get("items", {}), defs, hints, name, i + 1) for i in range(count)]
+    if kind == "integer":
+        if name == "answer_id":
+            return hints["answer_ids"][index - 1]
+        if name == "marks_awarded":
+            return index % (hints["marks"] + 1)
+        return hints["total_marks"] if name == "total_marks" else 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return index == 1
+    if name == "question":
+        return f"Sample question {index} about {hints['topic']}?"
+    return f"Sample {name.replace('_', ' ')} {index}"
+
+
+def prompt_hints(text: str) -> dict:
+    """This function reads the quiz parameters, or the answers to grade, out of the prompt text"""
+    def number(pattern, default):
+        match = re.search(pattern, text, re.IGNORECASE)
+        return int(match.group(1)) if match else default
+
+    topic = re.search(r"Topic:\s*([^\n]+)", text)
+    numbered_lines = len(re.findall(r"^\s*\d+\.", text, re.MULTILINE)) # a quiz text handed over for structuring
+    return {
+        "num_questions": number(r"Number\s+of\s+Questions:\s*(\d+)", numbered_lines or 3),
+        "total_marks": number(r"Total\s+Marks:\s*(\d+)", 10),
+        "topic": topic.group(1).strip() if topic else "the topic",
+        "answer_ids": [int(answer_id) for answer_id in re.findall(r"^Answer id (\d+):", text, re.MULTILINE)],
+        "marks": number(r"(?m)^\s*Marks:\s*(\d+)", 1),
+    }
+
+
+def fake_embedding(text, dimensions: int):
+    """This function returns a deterministic unit vector for a text (or a list of token ids)"""
+    seed = hashlib.sha256(json.dumps(text).encode()).digest()
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+
+        routes = {
+            "/v1/responses": ("responses", self.handle_responses),
+            "/v1/chat/completions": ("chat", self.handle_chat_completions),
+            "/v1/embeddings": ("embeddings", self.handle_embeddings),
+        }
+        if path not in routes:
+            return self._send(404, {"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}})
+
+        endpoint, handler = routes[path]
+        time.sleep(self.server.latency[endpoint]())
+        self.server.count(endpoint)
+
+        if random.random() < self.server.error_rate:
+            return self._send(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+        payload = handler(body)
+        usage = payload.get("usage", {})
+        time.sleep(usage.get("output_tokens", usage.get("completion_tokens", 0)) * self.server.output_token_ms / 1000)
+        return self._send(200, payload)
+
+    def handle_responses(self, body: dict) -> dict:
+        messages = body.get("input", [])
+        prompt = messages if isinstance(messages, str) else "\n".join(str(m.get("content", "")) for m in messages)
+        text_format = body.get("text", {}).get("format", {})
+
+        if text_format.get("type") == "json_schema":
+            schema = text_format["schema"]
+            text = json.dumps(fake_instance(schema, schema.get("$defs", {}), prompt_hints(prompt)))
+        else:
+            text = "This is a fake response."
+
+        input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "status": "completed",
+            "model": body.get("model", "gpt-4.1-mini"),
+            "output": [{
+                "type": "message",
+                "id": f"msg_{uuid.uuid4().hex}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}]
+            }],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens
+            }
+        }
+
+    def handle_chat_completions(self, body: dict) -> dict:
+        prompt = "\n".join(
+            m["content"] if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+            for m in body.get("messages", [])
+        )
+        hints = prompt_hints(prompt)
+        message = {"role": "assistant", "content": None}
+        response_format = body.get("response_format") or {}
+
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            message["content"] = json.dumps(fake_instance(schema, schema.get("$defs", {}), hints))
+        elif body.get("tools"):
+            function = body["tools"][0]["function"]
+            schema = function["parameters"]
+            message["tool_calls"] = [{
+                "id": f"call_{uuid.uuid4().hex[:24]}",
+                "type": "function",
+                "function": {"name": function["name"],
+                             "arguments": json.dumps(fake_instance(schema, schema.get("$defs", {}), hints))}
+            }]
+        else:
+            message["content"] = "\n".join(
+                f"{i}. Sample question {i} about {hints['topic']}?\n   A) a  B) b  C) c  D) d\n   Answer: A"
+                for i in range(1, hints["num_questions"] + 1)
+            )
+
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(message["content"] or json.dumps(message.get("tool_calls")))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4.1-mini"),
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+
+    def handle_embeddings(self, body: dict) -> dict:
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        dimensions = body.get("dimensions") or self.server.dimensions
+
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_embedding(text, dimensions)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(struct.pack(f"<{dimensions}f", *vector)).decode()
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+
+        tokens = sum(len(t) if isinstance(t, list) else estimate_tokens(t) for t in inputs)
+        return {"object": "list", "data": data, "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """This class is the threaded HTTP server holding the latency distributions and the request counters"""
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), latency="constant:0", responses_latency=None, chat_latency=None,
+                 embeddings_latency=None, error_rate=0.0, dimensions=1536, verbose=False, output_token_ms=0.0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = {
+            "responses": parse_latency(responses_latency or latency),
+            "chat": parse_latency(chat_latency or latency),
+            "embeddings": parse_latency(embeddings_latency or "constant:0"),
+        }
+        self.error_rate = error_rate
+        self.output_token_ms = output_token_ms
+        self.dimensions = dimensions
+        self.verbose = verbose
+        self.counts = {"responses": 0, "chat": 0, "embeddings": 0}
+        self._lock = threading.Lock()
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.counts[endpoint] += 1
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        """This function serves in a daemon thread and returns the server, for use inside benchmarks"""
+        threading.Thread(target=self.serve_forever, daemon=True, name="fake-openai").start()
+        return self
+
+
+# Running the server on its own, point the app to it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local fake OpenAI API server")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", default="lognormal:800,0.4", help="default latency of the LLM endpoints")
+    parser.add_argument("--responses-latency")
+    parser.add_argument("--chat-latency")
+    parser.add_argument("--embeddings-latency", default="constant:50")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--output-token-ms", type=float, default=0.0, help="generation time per output token")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(("127.0.0.1", args.port), args.latency, args.responses_latency, args.chat_latency,
+                              args.embeddings_latency, args.error_rate, verbose=args.verbose,
+                              output_token_ms=args.output_token_ms)
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    server.serve_forever()
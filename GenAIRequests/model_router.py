@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable, Optional, Tuple, Any
+
+from GenAIRequests.quiz_ai_requests import MODEL_PRICING
+from GenAIRequests.telemetry import percentile, cost_info_metrics
+
+
+class ModelStats:
+    """This class keeps a rolling window of the latest latency and cost observations of a single model"""
+
+    def __init__(self, window: int = 100):
+        self.latencies = deque(maxlen=window)
+        self.costs = deque(maxlen=window)
+
+    def record(self, latency_s: float, cost_usd: float):
+        self.latencies.append(latency_s)
+        self.costs.append(cost_usd)
+
+    @property
+    def samples(self) -> int:
+        return len(self.latencies)
+
+    @property
+    def p50(self) -> Optional[float]:
+        return percentile(self.latencies, 50)
+
+    @property
+    def p95(self) -> Optional[float]:
+        return percentile(self.latencies, 95)
+
+    @property
+    def avg_cost(self) -> Optional[float]:
+        return sum(self.costs) / len(self.costs) if self.costs else None
+
+
+class ModelRouter:
+    """This class picks the model for a generation request based on the latency and cost observed for every model in
+    MODEL_PRICING, and can hedge a slow request by firing a backup call once the primary passes its p95 latency"""
+
+    # Token counts used to estimate the cost of a model that has not been observed yet
+    expected_input_tokens = 500
+    expected_output_tokens = 800
+
+    def __init__(self, models: Optional[Iterable[str]] = None, pricing: Optional[dict] = None, window: int = 100,
+                 min_samples: int = 5, hedge_workers: int = 8):
+        self.pricing = pricing if pricing is not None else MODEL_PRICING
+        self.models = list(models) if models is not None else list(self.pricing)
+        self.window = window
+        self.min_samples = min_samples  # observations needed before the p95 of a model is trusted for hedging
+        self.stats = {name: ModelStats(window) for name in self.models}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="model-router")
+
+    def record(self, cost_info: dict, model_name: Optional[str] = None):
+        """This function adds the latency and cost of a finished call to the rolling stats of its model"""
+        metrics = cost_info_metrics(cost_info)
+        name = model_name or metrics["model_name"]
+
+        with self._lock:
+            if name not in self.stats:
+                self.stats[name] = ModelStats(self.window)
+            self.stats[name].record(metrics["latency_s"], metrics["cost_usd"])
+
+    def estimated_cost(self, model_name: str) -> float:
+        """This function returns the observed average cost of a model or, without observations, a pricing estimate"""
+        observed = self.stats[model_name].avg_cost if model_name in self.stats else None
+        if observed is not None:
+            return observed
+
+        prices = self.pricing.get(model_name, {"input": 0, "output": 0})
+        return (self.expected_input_tokens * prices["input"] + self.expected_output_tokens * prices["output"]) / 1000
+
+    def choose(self, max_latency_s: Optional[float] = None, max_cost_usd: Optional[float] = None,
+               exclude: Iterable[str] = ()) -> str:
+        """This function returns the cheapest model whose p95 latency and average cost fit the SLO. Models without
+        observations are assumed to fit the latency SLO until they have been measured. If nothing fits the SLO the model
+        with the lowest p95 latency is returned as the best effort"""
+        with self._lock:
+            candidates = [name for name in self.models if name not in exclude] or list(self.models)
+            snapshot = {name: (self.stats[name].p95, self.stats[name].p50) for name in candidates}
+
+        fitting = []
+        for name in candidates:
+            p95, p50 = snapshot[name]
+            if max_latency_s is not None and p95 is not None and p95 > max_latency_s:
+                continue
+            if max_cost_usd is not None and self.estimated_cost(name) > max_cost_usd:
+                continue
+            fitting.append(name)
+
+        if fitting:
+            # Cheapest first, the faster median breaks the ties
+            return min(fitting, key=lambda n: (self.estimated_cost(n), snapshot[n][1] or 0))
+
+        return min(candidates, key=lambda n: snapshot[n][0] if snapshot[n][0] is not None else float("inf"))
+
+    def call(self, call_fn: Callable[[str], Tuple[Any, dict]], max_latency_s: Optional[float] = None,
+             max_cost_usd: Optional[float] = None, hedge: bool = False) -> Tuple[Any, dict]:
+        """This function routes a call. call_fn takes a model name and returns (result, cost_info) the same way
+        generate_quiz does. With hedge=True a backup call is fired on another model once the primary runs longer than
+        its p95, and whichever finishes first wins"""
+        primary = self.choose(max_latency_s, max_cost_usd)
+
+        def timed_call(model_name):
+            result, cost_info = call_fn(model_name)
+            self.record(cost_info, model_name)
+            return model_name, result, cost_info
+
+        with self._lock:
+            hedge_after = self.stats[primary].p95 if self.stats[primary].samples >= self.min_samples else None
+
+        if not hedge or hedge_after is None:
+            model_name, result, cost_info = timed_call(primary)
+            return result, dict(cost_info, routed_model=model_name, hedged=False)
+
+        # The hedge clock starts when the primary call does, not when it is queued behind other calls of the executor
+        started = threading.Event()
+
+        def primary_call():
+            started.set()
+            return timed_call(primary)
+
+        start = time.perf_counter()
+        futures = [self._executor.submit(primary_call)]
+        if not started.wait(hedge_after) and futures[0].cancel():
+            # Every worker is busy, a backup would queue as well: the primary runs on this thread without a hedge
+            model_name, result, cost_info = timed_call(primary)
+            return result, dict(cost_info, routed_model=model_name, hedged=False,
+                                routed_latency_s=round(time.perf_counter() - start, 2))
+        done, _ = wait(futures, timeout=hedge_after)
+
+        if not done:
+            # choose() falls back to the excluded models when nothing else is left, there is no backup then
+            backup = self.choose(max_latency_s, max_cost_usd, exclude={primary})
+            if backup != primary:
+                futures.append(self._executor.submit(timed_call, backup))
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+
+        # Preferring a successful call, the losing call keeps running in the background and is still recorded
+        winner = next((f for f in done if f.exception() is None), None)
+        if winner is None:
+            pending = [f for f in futures if f not in done]
+            if not pending:
+                raise next(iter(done)).exception()
+            winner = pending[0]
+            winner.result()  # waiting on the remaining call, raising its error if it fails as well
+
+        model_name, result, cost_info = winner.result()
+        return result, dict(cost_info, routed_model=model_name, hedged=len(futures) > 1,
+                            routed_latency_s=round(time.perf_counter() - start, 2))
+
+    def snapshot(self) -> dict:
+        """This function returns the rolling p50/p95 latency and average cost of every model"""
+        with self._lock:
+            return {
+                name: {
+                    "samples": s.samples,
+                    "p50_latency_s": s.p50,
+                    "p95_latency_s": s.p95,
+                    "avg_cost_usd": s.avg_cost,
+                    "estimated_cost_usd": self.estimated_cost(name) if s.avg_cost is None else s.avg_cost,
+                }
+                for name, s in self.stats.items()
+            }
+
+
+# Exercising the router against local fake backends with controllable latency
+if __name__ == "__main__":
+    import random
+
+    fake_latency = {"gpt-4o-mini": 0.05, "gpt-5-mini": 0.30, "gpt-4.1-mini": 0.10}
+
+    def fake_backend(model_name):
+        """A stand-in for generate_quiz which sleeps for the configured latency and returns a matching cost_info"""
+        latency = fake_latency[model_name] * random.uniform(0.8, 1.6)
+        time.sleep(latency)
+        return f"quiz from {model_name}", {
+            "model_name": model_name,
+            "input_tokens": 400,
+            "output_tokens": 700,
+            "total_tokens": 1100,
+            "cost_usd": f"{(400 * MODEL_PRICING[model_name]['input'] + 700 * MODEL_PRICING[model_name]['output']) / 1000:.6f}",
+            "Latency (time taken)": f"{latency:.2f}",
+        }
+
+    router = ModelRouter()
+    for _ in range(30):
+        router.call(fake_backend)
+    print(router.snapshot())
+
+    # Making the cheapest model slow and checking that the router moves away from it under a latency SLO
+    fake_latency["gpt-4o-mini"] = 0.5
+    for _ in range(30):
+        _, info = router.call(fake_backend, max_latency_s=0.25, hedge=True)
+    print(info)
+    print(router.snapshot())
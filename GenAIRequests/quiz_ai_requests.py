@@ -2,9 +2,12 @@ import os
 from dotenv import load_dotenv
 from openai import OpenAI
 from pydantic import BaseModel, Field
-from typing import List, Tuple
+from typing import List, Tuple, Optional
 import time # for latency calculations
 
+from GenAIRequests.telemetry import StageTimer
+from GenAIRequests.cassette import cassette_http_client, cassette_api_key
+
 MODEL_PRICING = {
     "gpt-4o-mini": {
         "input": 0.00015,     # USD per 1K tokens
@@ -46,15 +49,19 @@ class QuizResponse(BaseModel):
 # Setting up the client for OpenAI requests
 
 load_dotenv()
-API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=API_KEY)
+API_KEY = cassette_api_key(os.getenv("OPENAI_API_KEY"))
+client = OpenAI(api_key=API_KEY, http_client=cassette_http_client()) # records/replays the calls when a cassette is on
 
 SYSTEM_ROLE = "You are a teacher of Bachelor Level Digital Logic Design"
 
 
-def generate_quiz(request: QuizRequest, model_name: str = "gpt-4.1-mini", temperature: float = 0.3) -> Tuple[QuizResponse, dict]:
-    """This function generates a structured quiz using Pydantic models and OpenAI requests"""
+def generate_quiz(request: QuizRequest, model_name: str = "gpt-4.1-mini", temperature: float = 0.3,
+                  timer: Optional[StageTimer] = None) -> Tuple[QuizResponse, dict]:
+    """This function generates a structured quiz using Pydantic models and OpenAI requests. The optional timer collects
+    the duration of every stage so a caller can add its own stages to the same breakdown"""
+    timer = timer or StageTimer()
 
+    prompt_start = time.perf_counter()
     user_prompt = f"""
     Generate a multiple-choice quiz.
     Topic: {request.topic}
@@ -62,6 +69,7 @@ def generate_quiz(request: QuizRequest, model_name: str = "gpt-4.1-mini", temper
     Number of Questions: {request.num_questions}
 
     """
+    timer.add("prompt_assembly", (time.perf_counter() - prompt_start) * 1000)
 
     start = time.perf_counter() # determining the starting time of the request
 
@@ -75,6 +83,7 @@ def generate_quiz(request: QuizRequest, model_name: str = "gpt-4.1-mini", temper
     )
 
     end = time.perf_counter()  # determining the ending time of the request
+    timer.add("llm", (end - start) * 1000) # the SDK parses and validates the structured output as part of the call
 
     # Calculating the costs and latency
     usage = response.usage
@@ -87,12 +96,16 @@ def generate_quiz(request: QuizRequest, model_name: str = "gpt-4.1-mini", temper
 
     # Latency and Cost Calculations output
     cost_info = {
-        "model_name": response.model,
+        "model_name": model_name,  # the model asked for, the telemetry and the router group the calls by it
+        "response_model": response.model,  # the dated snapshot which answered, e.g. gpt-4.1-mini-2025-04-14
         "input_tokens": usage.input_tokens,
         "output_tokens": usage.output_tokens,
         "total_tokens": usage.total_tokens,
         "cost_usd": f"{total_cost:.6f}",
-        "Latency (time taken)": f"{latency:.2f}"
+        "Latency (time taken)": f"{latency:.2f}",
+        "latency_ms": round(latency * 1000, 3),  # unrounded numeric latency for the telemetry table
+        "cached_tokens": getattr(getattr(usage, "input_tokens_details", None), "cached_tokens", 0) or 0,
+        "stages": timer.as_dict()
     }
 
     return response.output_parsed, cost_info # Ensuring the Python object returned is created by our Pydantic schema
@@ -0,0 +1,74 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+
+class StageTimer:
+    """This class collects how long every named stage (retrieval, embedding, prompt assembly, LLM calls, parsing,
+    persistence...) of one generation request takes. A stage that runs more than once is summed"""
+
+    def __init__(self):
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        """This function times the block it wraps and adds its duration to the stage called name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def add(self, name: str, duration_ms: float):
+        """This function adds an already measured duration to the stage called name"""
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + duration_ms
+
+    def merge(self, spans: dict):
+        """This function adds the stages of another timer, e.g. the one of the call which won a hedged request"""
+        for name, duration_ms in spans.items():
+            self.add(name, duration_ms)
+
+    def as_dict(self) -> dict:
+        """This function returns the stage durations in milliseconds, in the order the stages first ran"""
+        with self._lock:
+            return {name: round(duration, 3) for name, duration in self.spans.items()}
+
+
+def percentile(values: Iterable[float], pct: float) -> Optional[float]:
+    """This function returns the pct-th percentile (0-100) of the values using linear interpolation between the closest
+    ranks, or None when there are no values"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+
+    rank = (len(ordered) - 1) * pct / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    if lower == upper:
+        return ordered[int(rank)]
+
+    # Interpolating between the two neighbouring values
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def cost_info_metrics(cost_info: dict) -> dict:
+    """This function converts a cost_info dict produced by the GenAIRequests files into plain numbers. The generators
+    store cost and latency as formatted strings and name the token counts differently (input/output for the Responses
+    API and prompt/completion for LangChain), so both spellings are accepted here"""
+    input_tokens = cost_info.get("input_tokens", cost_info.get("prompt_tokens")) or 0
+    output_tokens = cost_info.get("output_tokens", cost_info.get("completion_tokens")) or 0
+    latency_ms = cost_info.get("latency_ms")
+
+    return {
+        "model_name": cost_info.get("model_name"),
+        "input_tokens": int(input_tokens),
+        "output_tokens": int(output_tokens),
+        "total_tokens": int(cost_info.get("total_tokens") or input_tokens + output_tokens),
+        "cached_tokens": int(cost_info.get("cached_tokens") or 0),
+        "cost_usd": float(cost_info.get("cost_usd") or 0),
+        "latency_s": latency_ms / 1000 if latency_ms is not None else float(cost_info.get("Latency (time taken)") or 0),
+    }
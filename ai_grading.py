@@ -0,0 +1,275 @@
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import groupby
+from operator import attrgetter
+from typing import Callable, List, Optional
+
+import click
+from flask.cli import with_appcontext
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from sqlalchemy import bindparam, select, update
+
+from data_models import db, Question, StudentAnswer, utc_now
+from grading import MCQ
+from pre_grading import MODES as PRE_GRADING_MODES, pre_grader
+from GenAIRequests.answer_grading_ai_requests import grade_answers
+from routes.metrics import record_llm_call
+
+# AI grading of the descriptive answers. Grading one answer per LLM call would cost one round trip and one copy of the
+# question, its model answer and the instructions for every answer of the class, so the pipeline:
+#
+#   - when pre-grading is asked for, first gives 0 locally to the blank answers, and to the clearly unrelated ones in
+#     the similarity modes (pre_grading.py), the others are sent to the LLM
+#   - groups the other answers by question and packs up to batch_size of them (and max_batch_chars of text) into
+#     one structured output call returning a grade and a feedback per answer id
+#     (GenAIRequests/answer_grading_ai_requests.py)
+#   - builds the rubric prompt of a question once and puts it first in the prompt of each of its batches, so the
+#     batches of a question share OpenAI's prompt cache
+#   - runs the calls on `concurrency` threads under a requests and tokens per minute limit (RateLimiter), retrying the
+#     rate limited and failed calls with an exponential backoff
+#   - writes the grades of a batch back as soon as it returns, with one executemany UPDATE and one commit, from the
+#     calling thread only (the LLM threads never touch the database)
+#
+# It is resumable: an answer is graded when marks_awarded is set, so an interrupted run loses at most the batches in
+# flight and the next run only sends the answers still ungraded. An answer the model didn't return a grade for stays
+# ungraded as well. The answers graded by a teacher in the meantime are never overwritten.
+#
+# It is run by POST /student_answers/grading/descriptive and by the CLI:
+#   flask --app app grade-descriptive [--quiz-id 3 | --assignment-id 2] [--batch-size 25] [--concurrency 8]
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+DEFAULT_BATCH_SIZE = 25
+MAX_BATCH_CHARS = 12000
+DEFAULT_CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 200000
+OUTPUT_TOKENS_PER_ANSWER = 60  # feedback and marks of one answer, for the token budget of a call
+MAX_ATTEMPTS = 4
+PRE_GRADED_FEEDBACK = {
+    "blank": "Graded automatically: the answer is blank.",
+    "unrelated": "Graded automatically: the answer doesn't seem to address the question, to be reviewed.",
+}
+
+RETRIED_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class RateLimiter:
+    """This class holds two token buckets refilled every minute, one of requests and one of LLM tokens, and makes a
+    call wait until both have room for it"""
+
+    def __init__(self, requests_per_minute: int = REQUESTS_PER_MINUTE, tokens_per_minute: int = TOKENS_PER_MINUTE):
+        self.capacity = {"requests": float(requests_per_minute), "tokens": float(tokens_per_minute)}
+        self.available = dict(self.capacity)
+        self.waited_s = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int):
+        """This function blocks until one request and the tokens (capped at the bucket size) are available"""
+        needed = {"requests": 1.0, "tokens": float(min(tokens, self.capacity["tokens"]))}
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                for bucket, capacity in self.capacity.items():
+                    self.available[bucket] = min(capacity,
+                                                 self.available[bucket] + capacity * (now - self._updated) / 60)
+                self._updated = now
+                missing = max((needed[b] - self.available[b]) / self.capacity[b] * 60 for b in needed)
+                if missing <= 0:
+                    for bucket in needed:
+                        self.available[bucket] -= needed[bucket]
+                    return
+                self.waited_s += missing
+            time.sleep(missing)
+
+
+limiter = RateLimiter()
+
+
+class Batch:
+    """This class is a group of ungraded answers to the same question sent in one call"""
+
+    def __init__(self, question, answers: list):
+        self.question = question  # (id, question_text, marks, reference_answer)
+        self.answers = answers  # [(answer id, answer text)]
+
+    @property
+    def estimated_tokens(self) -> int:
+        text = len(self.question.question_text or "") + len(self.question.reference_answer or "")
+        text += sum(len(answer_text or "") for _, answer_text in self.answers)
+        return text // 4 + 200 + OUTPUT_TOKENS_PER_ANSWER * len(self.answers)
+
+
+def ungraded_answers(quiz_id: Optional[int] = None, assignment_id: Optional[int] = None):
+    """This function returns the query of the descriptive answers waiting for a grade, by question"""
+    query = (select(StudentAnswer.id, StudentAnswer.question_id, StudentAnswer.answer_text)
+             .join(Question, Question.id == StudentAnswer.question_id)
+             .where(Question.question_type != MCQ, StudentAnswer.answer_text.isnot(None),
+                    StudentAnswer.marks_awarded.is_(None), StudentAnswer.evaluated_by_teacher.isnot(True)))
+    if quiz_id is not None:
+        query = query.where(StudentAnswer.quiz_id == quiz_id)
+    if assignment_id is not None:
+        query = query.where(StudentAnswer.assignment_id == assignment_id)
+    return query.order_by(StudentAnswer.question_id, StudentAnswer.id)
+
+
+def load_ungraded(quiz_id: Optional[int] = None, assignment_id: Optional[int] = None) -> tuple:
+    """This function reads the ungraded answers and their questions (two queries) and returns (answers, {question id:
+    question})"""
+    answers = db.session.execute(ungraded_answers(quiz_id, assignment_id)).all()
+    questions = {q.id: q for q in db.session.execute(
+        select(Question.id, Question.question_text, Question.marks, Question.reference_answer)
+        .where(Question.id.in_({answer.question_id for answer in answers}))
+    ).all()} if answers else {}
+    return answers, questions
+
+
+def pending_batches(quiz_id: Optional[int] = None, assignment_id: Optional[int] = None,
+                    batch_size: int = DEFAULT_BATCH_SIZE, max_batch_chars: int = MAX_BATCH_CHARS) -> List[Batch]:
+    """This function packs every ungraded answer into batches"""
+    return pack_batches(*load_ungraded(quiz_id, assignment_id), batch_size, max_batch_chars)
+
+
+def pack_batches(answers: list, questions: dict, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_batch_chars: int = MAX_BATCH_CHARS) -> List[Batch]:
+    """This function packs the answers into batches of the same question"""
+    batches = []
+    for question_id, group in groupby(sorted(answers, key=attrgetter("question_id")), key=attrgetter("question_id")):
+        current, chars = [], 0
+        for answer in group:
+            text = answer.answer_text or ""
+            if current and (len(current) >= batch_size or chars + len(text) > max_batch_chars):
+                batches.append(Batch(questions[question_id], current))
+                current, chars = [], 0
+            current.append((answer.id, text))
+            chars += len(text)
+        batches.append(Batch(questions[question_id], current))
+    return batches
+
+
+def _grade_batch(batch: Batch, model_name: str, rate_limiter: RateLimiter, grader: Callable):
+    """This function makes the call of a batch under the rate limit, retrying the rate limited and failed calls"""
+    question = batch.question
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        rate_limiter.acquire(batch.estimated_tokens)
+        try:
+            return grader(question.id, question.question_text, question.marks or 0, question.reference_answer,
+                          batch.answers, model_name)
+        except RETRIED_ERRORS:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            time.sleep(min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0))
+
+
+def write_grades(batch: Batch, grades) -> int:
+    """This function writes the grades returned for a batch with one executemany UPDATE and returns how many answers
+    were graded. Grades for answers outside of the batch are ignored and the marks are kept within the question's"""
+    in_batch = {answer_id for answer_id, _ in batch.answers}
+    marks = batch.question.marks or 0
+    rows = {}
+    for grade in grades.grades:
+        if grade.answer_id in in_batch:
+            rows[grade.answer_id] = {"answer_id": grade.answer_id, "marks": max(0, min(marks, grade.marks_awarded)),
+                                     "feedback": grade.feedback}
+    return _update_answers(list(rows.values()), evaluated_by_ai=True)
+
+
+def write_pre_grades(zeros: dict) -> int:
+    """This function writes the 0 of the {answer id: reason} given by the pre-grader with one executemany UPDATE,
+    marking the answers as graded locally for the teacher's review"""
+    return _update_answers([{"answer_id": answer_id, "marks": 0, "feedback": PRE_GRADED_FEEDBACK[reason]}
+                            for answer_id, reason in zeros.items()], evaluated_by_ai=False)
+
+
+def _update_answers(rows: list, evaluated_by_ai: bool) -> int:
+    if not rows:
+        return 0
+    now = utc_now()
+    answers = StudentAnswer.__table__
+    return db.session.execute(
+        update(answers)
+        .where(answers.c.id == bindparam("answer_id"), answers.c.evaluated_by_teacher.isnot(True))
+        .values(marks_awarded=bindparam("marks"), feedback=bindparam("feedback"), evaluated_by_ai=evaluated_by_ai,
+                graded_locally=not evaluated_by_ai, updated_at=now),
+        rows
+    ).rowcount
+
+
+def grade_descriptive_answers(quiz_id: Optional[int] = None, assignment_id: Optional[int] = None,
+                              model_name: str = DEFAULT_MODEL, batch_size: int = DEFAULT_BATCH_SIZE,
+                              concurrency: int = DEFAULT_CONCURRENCY, rate_limiter: Optional[RateLimiter] = None,
+                              grader: Callable = grade_answers, batches: Optional[List[Batch]] = None,
+                              pre_grading: Optional[str] = None) -> dict:
+    """This function grades the ungraded descriptive answers of a quiz, an assignment or everything, committing every
+    batch as soon as it is graded, and returns the figures of the run. The answers are pre-graded locally first, in the
+    pre_grading mode (PRE_GRADING, off by default), unless the batches to grade are given"""
+    rate_limiter = rate_limiter or limiter
+    pre_graded = llm_calls_avoided = 0
+    if batches is None:
+        answers, questions = load_ungraded(quiz_id, assignment_id)
+        zeros, ambiguous = pre_grader(pre_grading).triage(answers, questions)
+        if zeros:
+            pre_graded = write_pre_grades(zeros)
+            db.session.commit()
+        batches = pack_batches(ambiguous, questions, batch_size)
+        llm_calls_avoided = len(pack_batches(answers, questions, batch_size)) - len(batches)
+
+    request_id = uuid.uuid4().hex
+    summary = {"pre_graded": pre_graded, "llm_calls_avoided": llm_calls_avoided, "batches": len(batches),
+               "answers": sum(len(b.answers) for b in batches), "graded": 0, "failed_batches": 0, "cost_usd": 0.0,
+               "cached_tokens": 0}
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="ai-grading")
+    try:
+        futures = {pool.submit(_grade_batch, batch, model_name, rate_limiter, grader): batch for batch in batches}
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                grades, cost_info = future.result()
+                if grades is None:
+                    # A refusal or an output which didn't parse, the call was still made and billed
+                    summary["cost_usd"] += float(cost_info["cost_usd"])
+                    record_llm_call(request_id, "grading", cost_info, stages=cost_info.get("stages"))
+                    raise ValueError("the model returned no parsable grades")
+            except Exception as e:
+                # The answers of the batch stay ungraded for the next run
+                summary["failed_batches"] += 1
+                print(f"Grading a batch of question {batch.question.id} failed: {e}")
+                continue
+            summary["graded"] += write_grades(batch, grades)
+            db.session.commit()
+            summary["cost_usd"] += float(cost_info["cost_usd"])
+            summary["cached_tokens"] += cost_info["cached_tokens"]
+            record_llm_call(request_id, "grading", cost_info, stages=cost_info.get("stages"))
+    finally:
+        # On an interruption the batches not started yet are dropped, the graded ones are already committed
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    summary["cost_usd"] = round(summary["cost_usd"], 6)
+    summary["rate_limited_s"] = round(rate_limiter.waited_s, 2)
+    return summary
+
+
+@click.command("grade-descriptive")
+@click.option("--quiz-id", type=int, default=None, help="Only grade the answers of this quiz.")
+@click.option("--assignment-id", type=int, default=None, help="Only grade the answers of this assignment.")
+@click.option("--model", "model_name", default=DEFAULT_MODEL, show_default=True)
+@click.option("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, show_default=True, help="Answers per LLM call.")
+@click.option("--concurrency", type=int, default=DEFAULT_CONCURRENCY, show_default=True, help="LLM calls in flight.")
+@click.option("--pre-grading", type=click.Choice(PRE_GRADING_MODES), default=None,
+              help="Local 0 for the blank (and unrelated) answers, PRE_GRADING or off by default.")
+@with_appcontext
+def grade_descriptive_command(quiz_id, assignment_id, model_name, batch_size, concurrency, pre_grading):
+    """Grades the ungraded descriptive answers with batched LLM calls, run it again to resume."""
+    try:
+        pre_grader(pre_grading)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    summary = grade_descriptive_answers(quiz_id, assignment_id, model_name, batch_size, concurrency,
+                                        pre_grading=pre_grading)
+    click.echo(f"Pre-graded {summary['pre_graded']} answers locally ({summary['llm_calls_avoided']} LLM calls "
+               f"avoided). Graded {summary['graded']} of {summary['answers']} answers in {summary['batches']} calls "
+               f"({summary['failed_batches']} failed), ${summary['cost_usd']:.4f}.")
@@ -1,7 +1,15 @@
 from flask import Flask, render_template, Blueprint
 import os
 from datetime import datetime, timezone
-from data_models import db, Course, User, Program, Assignment, Quiz, UserRole, StudentAnswer
+from data_models import db, Course, User, Program, Assignment, Quiz
+from migrations import upgrade
+from loader_profiles import with_profile
+from dashboard import dashboard_snapshot, EVENT_STYLES
+import response_cache
+import write_behind
+from grading import grade_mcq_command
+from ai_grading import grade_descriptive_command
+from similarity import find_similar_answers_command
 
 # Importing the Blueprints
 from routes.assignments import assignments_bp
@@ -12,6 +20,8 @@ from routes.programs import programs_bp
 from routes.questions import questions_bp
 from routes.question_options import question_options_bp
 from routes.student_answers import student_answers_bp
+from routes.metrics import metrics_bp
+from routes.search import search_bp
 
 # UI Blueprint
 ui_bp = Blueprint("ui", __name__)
@@ -42,93 +52,36 @@ def time_ago(dt):
 
 @ui_bp.route("/")
 def index():
-    active_courses = Course.query.count()
-    total_students = User.query.filter_by(role=UserRole.student).count()
-    quizzes_generated = Quiz.query.count()
+    # The counters and the activity feed are kept current by database triggers, see dashboard.py
+    counters, events = dashboard_snapshot(limit=5)
 
-    # Fetch recent activities
-    activities = []
-    
-    # Recent Quizzes
-    recent_quizzes = Quiz.query.order_by(Quiz.created_at.desc()).limit(5).all()
-    for q in recent_quizzes:
-        activities.append({
-            'title': f"New Quiz Generated: {q.title}",
-            'time': time_ago(q.created_at),
-            'timestamp': q.created_at,
-            'type': 'AI',
-            'badge_class': 'bg-info text-dark'
-        })
-        
-    # Recent Courses
-    recent_courses = Course.query.order_by(Course.created_at.desc()).limit(5).all()
-    for c in recent_courses:
-        activities.append({
-            'title': f"Course Created: {c.name}",
-            'time': time_ago(c.created_at),
-            'timestamp': c.created_at,
-            'type': 'System',
-            'badge_class': 'bg-secondary'
-        })
-        
-    # Recent Users
-    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    for u in recent_users:
-        activities.append({
-            'title': f"New {u.role.value.capitalize()}: {u.name}",
-            'time': time_ago(u.created_at),
-            'timestamp': u.created_at,
-            'type': 'User',
-            'badge_class': 'bg-success'
-        })
-
-    # Recent Submissions
-    recent_submissions = StudentAnswer.query.order_by(StudentAnswer.submitted_at.desc()).limit(5).all()
-    for s in recent_submissions:
-        # Avoid potential N+1 or None issues
-        quiz_title = "Assignment"
-        if s.question and s.question.quiz:
-            quiz_title = s.question.quiz.title
-        
-        activities.append({
-            'title': f"New Submission for {quiz_title}",
-            'time': time_ago(s.submitted_at),
-            'timestamp': s.submitted_at,
-            'type': 'User',
-            'badge_class': 'bg-success'
-        })
-
-    # Sort activities by timestamp descending
-    def get_timestamp(x):
-        ts = x['timestamp']
-        if ts is None:
-            return datetime.min.replace(tzinfo=timezone.utc)
-        if ts.tzinfo is None:
-            return ts.replace(tzinfo=timezone.utc)
-        return ts
-
-    activities.sort(key=get_timestamp, reverse=True)
-    recent_activities = activities[:5]
+    recent_activities = [{
+        'title': event.title,
+        'time': time_ago(event.created_at),
+        'timestamp': event.created_at,
+        'type': EVENT_STYLES[event.kind][0],
+        'badge_class': EVENT_STYLES[event.kind][1]
+    } for event in events]
 
     return render_template("index.html", 
-                         active_courses=active_courses, 
-                         total_students=total_students, 
-                         quizzes_generated=quizzes_generated,
+                         active_courses=counters.get("courses", 0), 
+                         total_students=counters.get("students", 0), 
+                         quizzes_generated=counters.get("quizzes", 0),
                          recent_activities=recent_activities)
 
 @ui_bp.route("/ui/courses")
 def courses_page():
-    courses = Course.query.all()
+    courses = with_profile(Course.query, "ui.courses").all()
     return render_template("courses.html", courses=courses)
 
 @ui_bp.route("/ui/users")
 def users_page():
-    users = User.query.all()
+    users = with_profile(User.query, "ui.users").all()
     return render_template("users.html", users=users)
 
 @ui_bp.route("/ui/programs")
 def programs_page():
-    programs = Program.query.all()
+    programs = with_profile(Program.query, "ui.programs").all()
     return render_template("programs.html", programs=programs)
 
 @ui_bp.route("/ui/assignments")
@@ -146,21 +99,32 @@ def generate_quiz_page():
     return render_template("generate_quiz.html")
 
 #Creating the flask app object
-def create_app():
+def create_app(migrate=True):
     """This function creates a Flask app which registers the Blueprints from the routes as well as configuring the
-    database paths"""
+    database paths. Pending schema migrations are applied unless migrate is False"""
     app = Flask(__name__)
 
     # Finds the absolute path to our project folder
     basedir = os.path.abspath(os.path.dirname(__file__))
     # The database connection set up which tells that we are using SQLite and base folder has been joined with the subfolder lms.db
-    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(basedir, 'data/lms.db')}"
+    # DATABASE_URL can point the app to another database, e.g. a throwaway copy for the benchmarks
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(basedir, 'data/lms.db')}")
     # Disabling SQLAlchemy’s event system that tracks object changes.
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'super-secret-key-for-dev'
 
     db.init_app(app)  # Link the database and the app. This is the reason we need to import db from models
 
+    # Upgrading the database schema (tables, indexes) in place, see migrations.py
+    if migrate:
+        with app.app_context():
+            upgrade(db.engine)
+
+    # Caching the responses of the read-heavy GET endpoints, invalidated by the writes to their tables
+    response_cache.init_app(app)
+    # Logging the answer submissions and writing them in batches in the background when WRITE_BEHIND is on
+    write_behind.init_app(app)
+
     # Registering the Blueprints
     app.register_blueprint(ui_bp)
     app.register_blueprint(users_bp, url_prefix="/users")
@@ -171,12 +135,17 @@ def create_app():
     app.register_blueprint(questions_bp, url_prefix="/questions")
     app.register_blueprint(question_options_bp, url_prefix="/question_options")
     app.register_blueprint(student_answers_bp, url_prefix="/student_answers")
+    app.register_blueprint(metrics_bp, url_prefix="/metrics")
+    app.register_blueprint(search_bp, url_prefix="/search")
+
+    # flask --app app grade-mcq, grade-descriptive and find-similar-answers
+    app.cli.add_command(grade_mcq_command)
+    app.cli.add_command(grade_descriptive_command)
+    app.cli.add_command(find_similar_answers_command)
 
     return app
 
 
 if __name__ == "__main__":
-    app = create_app()
-    """with app.app_context():
-            db.create_all()""" # Creating all the database tables defined by our models.
+    app = create_app() # creates or upgrades the database tables through the migrations
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,105 @@
+from typing import List, Optional
+
+from sqlalchemy import and_, func, insert, select
+
+from data_models import db, Question, QuestionOption, StudentAnswer
+
+# Submission of a whole attempt of a quiz or an assignment in one request. Every answer of the attempt is checked
+# against the database in a single query (the questions have to belong to the quiz or assignment, the selected options
+# to their question), then all the answers are inserted in the same transaction:
+#
+#   - the first answer is inserted on its own with an attempt_number computed by the INSERT itself (the latest attempt
+#     of the student + 1). The INSERT takes SQLite's write lock, so a concurrent submission of the same student waits
+#     and then numbers its attempt after this one
+#   - the other answers are sent as one batched (executemany) INSERT with that attempt_number
+#
+# Nothing is committed here, the caller owns the transaction and its rollback, like in quiz_persistence.py.
+#
+# An answer is passed as a plain dict: {"question_id": 3, "selected_option_id": 11} or {"question_id": 4,
+# "answer_text": "..."}
+
+
+class AttemptError(ValueError):
+    """This class is raised for an attempt with missing fields or answers to questions which aren't part of the quiz or
+    assignment, or to options which aren't part of the question"""
+
+
+def _ids(values) -> str:
+    return ", ".join(str(value) for value in sorted(values))
+
+
+def validate_attempt(answers: List[dict], quiz_id: Optional[int] = None, assignment_id: Optional[int] = None):
+    """This function checks every answer of an attempt with one query and raises an AttemptError describing all the
+    invalid ones"""
+    if (quiz_id is None) == (assignment_id is None):
+        raise AttemptError("Exactly one of quiz_id and assignment_id is required.")
+    if not isinstance(quiz_id if quiz_id is not None else assignment_id, int):
+        raise AttemptError("quiz_id and assignment_id must be integers.")
+    if not isinstance(answers, list) or not answers:
+        raise AttemptError("answers must be a non empty list.")
+    if any(not isinstance(answer, dict) or not isinstance(answer.get("question_id"), int)
+           or not isinstance(answer.get("selected_option_id", 0), (int, type(None))) for answer in answers):
+        raise AttemptError("Every answer needs an integer question_id, and selected_option_id has to be an integer.")
+
+    question_ids = [answer["question_id"] for answer in answers]
+    if len(set(question_ids)) != len(question_ids):
+        raise AttemptError("A question can only be answered once per attempt.")
+    option_ids = {answer["selected_option_id"] for answer in answers if answer.get("selected_option_id") is not None}
+
+    # The questions of the attempt which belong to the quiz/assignment, with the selected options belonging to them
+    parent = Question.quiz_id == quiz_id if quiz_id is not None else Question.assignment_id == assignment_id
+    rows = db.session.execute(
+        select(Question.id, QuestionOption.id)
+        .outerjoin(QuestionOption, and_(QuestionOption.question_id == Question.id, QuestionOption.id.in_(option_ids)))
+        .where(Question.id.in_(question_ids), parent)
+    ).all()
+    valid_questions = {question_id for question_id, _ in rows}
+    valid_options = {(question_id, option_id) for question_id, option_id in rows if option_id is not None}
+
+    problems = []
+    missing = set(question_ids) - valid_questions
+    if missing:
+        problems.append(f"questions {_ids(missing)} are not part of the "
+                        f"{'quiz' if quiz_id is not None else 'assignment'}")
+    wrong_options = {answer["selected_option_id"] for answer in answers
+                     if answer.get("selected_option_id") is not None and answer["question_id"] in valid_questions
+                     and (answer["question_id"], answer["selected_option_id"]) not in valid_options}
+    if wrong_options:
+        problems.append(f"options {_ids(wrong_options)} are not options of their question")
+    if problems:
+        raise AttemptError(f"Invalid answers: {'; '.join(problems)}.")
+
+
+def insert_attempt(student_id: int, answers: List[dict], quiz_id: Optional[int] = None,
+                   assignment_id: Optional[int] = None) -> tuple:
+    """This function inserts the answers of an attempt (already validated) as the next attempt of the student and
+    returns (attempt number, answer ids in the order of the answers)"""
+    parent = (StudentAnswer.quiz_id == quiz_id if quiz_id is not None
+              else StudentAnswer.assignment_id == assignment_id)
+    next_attempt = (select(func.coalesce(func.max(StudentAnswer.attempt_number), 0) + 1)
+                    .where(StudentAnswer.student_id == student_id, parent)
+                    .scalar_subquery())
+
+    # Every row carries the same keys so SQLAlchemy can send them as one executemany batch
+    rows = [{
+        "student_id": student_id,
+        "quiz_id": quiz_id,
+        "assignment_id": assignment_id,
+        "question_id": answer["question_id"],
+        "selected_option_id": answer.get("selected_option_id"),
+        "answer_text": answer.get("answer_text"),
+    } for answer in answers]
+
+    first_id, attempt_number = db.session.execute(
+        insert(StudentAnswer).values(**rows[0], attempt_number=next_attempt)
+        .returning(StudentAnswer.id, StudentAnswer.attempt_number)
+    ).one()
+
+    answer_ids = [first_id]
+    if len(rows) > 1:
+        answer_ids += db.session.execute(
+            insert(StudentAnswer).returning(StudentAnswer.id, sort_by_parameter_order=True),
+            [{**row, "attempt_number": attempt_number} for row in rows[1:]]
+        ).scalars().all()
+
+    return attempt_number, answer_ids
@@ -0,0 +1,91 @@
+"""Benchmark of the AI grading of a class's descriptive answers against the local fake OpenAI server, on a throwaway
+copy of the database. A class of students answers every descriptive question of a new assignment, then the answers are
+graded one answer per call on one thread (on a sample, projected to the class) and with the batched, concurrent
+pipeline of ai_grading.py. Prints the answers graded per second, the LLM calls, the tokens and the cost of each:
+
+    python -m benchmarks.bench_ai_grading
+    python -m benchmarks.bench_ai_grading --students 300 --questions 4 --latency lognormal:800,0.4 --output-token-ms 10
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_utils import use_database_copy
+from GenAIRequests.fake_openai_server import FakeOpenAIServer
+
+ANSWER = ("A {n} input NAND gate outputs 0 only when all of its inputs are 1, it is the complement of the AND gate and "
+          "any other gate can be built from NAND gates alone.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=4)
+    parser.add_argument("--latency", default="lognormal:800,0.4", help="LLM latency distribution of the fake server")
+    parser.add_argument("--output-token-ms", type=float, default=10.0, help="generation time per output token")
+    parser.add_argument("--baseline-sample", type=int, default=40, help="answers graded one per call")
+    parser.add_argument("--batch-size", type=int, default=25)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency, output_token_ms=args.output_token_ms).start()
+
+    # Pointing the OpenAI clients and the database before the app is imported
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    use_database_copy()
+
+    from sqlalchemy import insert
+
+    from app import create_app
+    from data_models import db, Assignment, StudentAnswer, User, UserRole
+    from quiz_persistence import insert_questions
+    from ai_grading import grade_descriptive_answers, pending_batches, RateLimiter
+
+    app = create_app()
+    with app.app_context():
+        assignment = Assignment(title="AI grading benchmark", total_marks=5 * args.questions, course_id=1)
+        db.session.add(assignment)
+        db.session.flush()
+        question_ids = insert_questions([{
+            "question_text": f"Explain the behaviour of a NAND gate ({n}).", "question_type": "descriptive",
+            "marks": 5, "reference_answer": ANSWER.format(n=2)
+        } for n in range(args.questions)], assignment_id=assignment.id)
+        students = [User(name=f"Student {n}", email=f"ai-grading-bench-{n}@example.com", password="x",
+                         role=UserRole.student) for n in range(args.students)]
+        db.session.add_all(students)
+        db.session.flush()
+        db.session.execute(insert(StudentAnswer), [{
+            "question_id": question_id, "student_id": student.id, "assignment_id": assignment.id,
+            "answer_text": ANSWER.format(n=2 + student.id % 3), "attempt_number": 1
+        } for student in students for question_id in question_ids])
+        db.session.commit()
+        assignment_id = assignment.id
+        total = args.students * args.questions
+    print(f"{total} answers to {args.questions} questions, fake LLM latency {args.latency} "
+          f"+ {args.output_token_ms} ms per output token")
+
+    def run(name, batch_size, concurrency, sample=None):
+        with app.app_context():
+            db.session.query(StudentAnswer).filter_by(assignment_id=assignment_id).update(
+                {"marks_awarded": None, "feedback": None, "evaluated_by_ai": False})
+            db.session.commit()
+            batches = pending_batches(assignment_id=assignment_id, batch_size=batch_size)[:sample]
+            calls = dict(fake.counts)
+            start = time.perf_counter()
+            summary = grade_descriptive_answers(assignment_id=assignment_id, batch_size=batch_size,
+                                                concurrency=concurrency, rate_limiter=RateLimiter(), batches=batches)
+            elapsed = time.perf_counter() - start
+        throughput = summary["graded"] / elapsed
+        print(f"\n== {name}: {throughput:,.1f} answers/s ==")
+        print(f"  {summary['graded']} answers graded with {fake.counts['responses'] - calls['responses']} LLM calls "
+              f"in {elapsed:.1f} s, ${summary['cost_usd']:.4f}")
+        if sample:
+            print(f"  projected for the class: {total / throughput / 60:.1f} min, "
+                  f"${summary['cost_usd'] / summary['graded'] * total:.4f}")
+        else:
+            print(f"  ${summary['cost_usd'] / summary['graded'] * 1000:.4f} per 1000 answers, "
+                  f"{summary['failed_batches']} failed batches")
+
+    run("one answer per call, one at a time", 1, 1, sample=args.baseline_sample)
+    run(f"batches of {args.batch_size}, {args.concurrency} calls in flight", args.batch_size, args.concurrency)
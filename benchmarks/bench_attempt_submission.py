@@ -0,0 +1,89 @@
+"""Benchmark of the submission of a quiz by a whole class, on a throwaway copy of the database: every student answers
+every question of a new quiz, either one POST /student_answers/ per answer (one commit each) or one
+POST /student_answers/attempts per student (attempts.py). Prints the answers stored per second, the commits and the
+latency of a whole submission:
+
+    python -m benchmarks.bench_attempt_submission
+    python -m benchmarks.bench_attempt_submission --students 300 --questions 40
+"""
+import argparse
+import os
+import random
+import time
+
+from sqlalchemy import event
+
+from benchmarks.bench_utils import use_database_copy, summarise
+
+
+def per_answer(client, student_id, quiz_id, answers):
+    for answer in answers:
+        client.post("/student_answers/", json={"student_id": student_id, "quiz_id": quiz_id, **answer})
+
+
+def whole_attempt(client, student_id, quiz_id, answers):
+    client.post("/student_answers/attempts", json={"student_id": student_id, "quiz_id": quiz_id, "answers": answers})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=40)
+    args = parser.parse_args()
+
+    use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"
+
+    from app import create_app
+    from data_models import db, User, UserRole, StudentAnswer
+    from quiz_persistence import insert_quiz
+
+    app = create_app()
+    client = app.test_client()
+    rng = random.Random(7)
+
+    with app.app_context():
+        # One quiz per run so both runs start from attempt 1
+        quizzes = []
+        for run in range(2):
+            quiz_id, question_ids = insert_quiz(f"Submission benchmark {run}", args.questions, 1, 1, [{
+                "question_text": f"Question {n}?", "question_type": "multiple_choice", "marks": 1,
+                "options": [{"option_text": f"Option {k}", "is_correct": k == 0} for k in range(4)]
+            } for n in range(args.questions)])
+            quizzes.append(quiz_id)
+
+        students = [User(name=f"Student {n}", email=f"submission-bench-{n}@example.com", password="x",
+                         role=UserRole.student) for n in range(args.students)]
+        db.session.add_all(students)
+        db.session.commit()
+        student_ids = [student.id for student in students]
+
+        commits = [0]
+        event.listen(db.engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+
+    for quiz_id, (name, submit) in zip(quizzes, (("one POST per answer", per_answer),
+                                                 ("one POST per attempt", whole_attempt))):
+        with app.app_context():
+            options = db.session.execute(db.text(
+                "SELECT questions.id, min(question_options.id) FROM questions JOIN question_options "
+                "ON question_options.question_id = questions.id WHERE quiz_id = :quiz GROUP BY questions.id"
+            ), {"quiz": quiz_id}).all()
+        answers = [{"question_id": question_id, "selected_option_id": option_id + rng.randrange(4)}
+                   for question_id, option_id in options]
+
+        commits[0] = 0
+        latencies = []
+        start = time.perf_counter()
+        for student_id in student_ids:
+            submission_start = time.perf_counter()
+            submit(client, student_id, quiz_id, answers)
+            latencies.append((time.perf_counter() - submission_start) * 1000)
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            stored = db.session.query(StudentAnswer).filter_by(quiz_id=quiz_id).count()
+        latency = summarise(latencies)
+        print(f"\n== {name}: {stored / elapsed:,.0f} answers/s ==")
+        print(f"  {stored} answers stored with {commits[0]} commits in {elapsed:.2f} s")
+        print(f"  submission of {args.questions} answers  p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms")
@@ -0,0 +1,83 @@
+"""Benchmark of the conditional GETs (conditional.py) with polling clients on a large seeded copy of the database. Every
+client polls its course roster, the quizzes of its course, a quiz and a question over and over while a small share of
+writes changes some of them. The same polls are run downloading the full responses every time and revalidating with
+the ETag of the previous response (If-None-Match). The response cache is off, to measure the conditional GETs alone:
+
+    python -m benchmarks.bench_conditional_get
+    python -m benchmarks.bench_conditional_get --clients 200 --rounds 20 --write-ratio 0.05
+"""
+import argparse
+import os
+import random
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database, summarise
+
+
+def run(client, polls, rounds, write_ratio, revalidate, seed=5):
+    """This function polls every url of every client for the given rounds and returns the number of requests per
+    second, the bytes of body received, the number of 304s and the latencies of the polls"""
+    rng = random.Random(seed)  # the same polls and writes for both runs
+    etags, latencies = {}, []
+    requests = body_bytes = not_modified = 0
+    start = time.perf_counter()
+
+    for n in range(rounds):
+        for urls in polls:
+            for url in urls:
+                if rng.random() < write_ratio:
+                    # A change to the polled resource, e.g. a teacher renaming the quiz
+                    quiz_id = urls[2].rsplit("/", 1)[1]
+                    client.put(f"/quizzes/{quiz_id}", json={"title": f"Renamed quiz {n}"})
+
+                headers = {"If-None-Match": etags[url]} if revalidate and url in etags else {}
+                poll_start = time.perf_counter()
+                response = client.get(url, headers=headers)
+                latencies.append((time.perf_counter() - poll_start) * 1000)
+
+                requests += 1
+                body_bytes += len(response.data)
+                not_modified += response.status_code == 304
+                if response.headers.get("ETag"):
+                    etags[url] = response.headers["ETag"]
+
+    return requests / (time.perf_counter() - start), body_bytes, not_modified, requests, summarise(latencies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=10, help="number of times every client polls its urls")
+    parser.add_argument("--write-ratio", type=float, default=0.01, help="share of the polls preceded by a write")
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"
+
+    from app import create_app
+    from data_models import db, Quiz
+
+    app = create_app()
+    print(f"seeded {seed_large_database(path, args.scale)}")
+
+    with app.app_context():
+        rng = random.Random(3)
+        quizzes = rng.sample(db.session.query(Quiz.id, Quiz.course_id).filter(Quiz.question_count > 0).all(),
+                             args.clients)
+        polls = []
+        for quiz_id, course_id in quizzes:
+            question_id = db.session.execute(db.text("SELECT min(id) FROM questions WHERE quiz_id = :id"),
+                                             {"id": quiz_id}).scalar()
+            polls.append([f"/courses/{course_id}", f"/quizzes/course/{course_id}", f"/quizzes/{quiz_id}",
+                          f"/questions/{question_id}"])
+
+    client = app.test_client()
+    for revalidate in (False, True):
+        throughput, body_bytes, not_modified, requests, latency = run(client, polls, args.rounds, args.write_ratio,
+                                                                       revalidate)
+        print(f"\n== {'If-None-Match' if revalidate else 'full download'}: {throughput:,.0f} requests/s ==")
+        print(f"  body received  {body_bytes / requests:,.0f} bytes/request")
+        print(f"  304 responses  {not_modified / requests:.0%}")
+        print(f"  latency        p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms")
@@ -0,0 +1,97 @@
+"""Benchmark of the denormalized counter columns of counters.py on a large seeded copy of the database: the COUNT
+queries the stats endpoints used to run against the counter columns, the cost the triggers add to the inserts, and
+the time of a full reconciliation:
+
+    python -m benchmarks.bench_counters
+    python -m benchmarks.bench_counters --scale 2 --runs 100
+"""
+import argparse
+import os
+import random
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database, summarise
+
+
+def latencies(fn, runs):
+    """This function returns the latency in milliseconds of `runs` calls of fn"""
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        results.append((time.perf_counter() - start) * 1000)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+
+    from sqlalchemy import func, select
+
+    from app import create_app
+    from data_models import (db, Course, Program, Quiz, Assignment, Question, QuestionOption, StudentAnswer,
+                             teacher_course, student_course)
+    from counters import reconcile
+
+    app = create_app()
+    print(f"seeded {seed_large_database(path, args.scale)}")
+    rng = random.Random(7)
+
+    with app.app_context():
+        course_ids = [c for (c,) in db.session.query(Course.id)]
+        question_ids = [q for (q,) in db.session.query(Question.id)]
+
+        def count_for_course(column):
+            return select(func.count()).where(column == Course.id).scalar_subquery()
+
+        # Course stats: four COUNT subqueries against four counter columns
+        counted = lambda: db.session.query(
+            Course.name, count_for_course(teacher_course.c.course_id), count_for_course(student_course.c.course_id),
+            count_for_course(Quiz.course_id), count_for_course(Assignment.course_id)
+        ).filter(Course.id == rng.choice(course_ids)).first()
+        stored = lambda: db.session.query(
+            Course.name, Course.teacher_count, Course.student_count, Course.quiz_count, Course.assignment_count
+        ).filter(Course.id == rng.choice(course_ids)).first()
+        print(f"\ncourse stats    COUNT subqueries {summarise(latencies(counted, args.runs))}")
+        print(f"                counter columns  {summarise(latencies(stored, args.runs))}")
+
+        # Programs with their course counts: a grouped subquery against a column
+        course_counts = db.session.query(Course.program_id, func.count(Course.id).label("n")) \
+            .group_by(Course.program_id).subquery()
+        counted = lambda: db.session.query(Program.id, func.coalesce(course_counts.c.n, 0)) \
+            .outerjoin(course_counts, course_counts.c.program_id == Program.id).all()
+        stored = lambda: db.session.query(Program.id, Program.course_count).all()
+        print(f"program counts  grouped COUNT    {summarise(latencies(counted, args.runs))}")
+        print(f"                counter column   {summarise(latencies(stored, args.runs))}")
+
+        # A page of questions with their option and answer counts
+        options = select(func.count(QuestionOption.id)).where(QuestionOption.question_id == Question.id).scalar_subquery()
+        answers = select(func.count(StudentAnswer.id)).where(StudentAnswer.question_id == Question.id).scalar_subquery()
+        counted = lambda: db.session.query(Question.id, options, answers).order_by(Question.id).limit(1000).all()
+        stored = lambda: db.session.query(Question.id, Question.option_count, Question.answer_count) \
+            .order_by(Question.id).limit(1000).all()
+        print(f"1000 questions  COUNT subqueries {summarise(latencies(counted, args.runs))}")
+        print(f"                counter columns  {summarise(latencies(stored, args.runs))}")
+
+        # Write cost: the same batch of answers inserted with and without the counter triggers
+        batch = [{"question_id": rng.choice(question_ids), "student_id": 1, "answer_text": "x"} for _ in range(20000)]
+        with db.engine.begin() as conn:
+            start = time.perf_counter()
+            conn.execute(StudentAnswer.__table__.insert(), batch)
+            with_triggers = time.perf_counter() - start
+            conn.exec_driver_sql("DROP TRIGGER student_answers_answer_count_ai")
+            start = time.perf_counter()
+            conn.execute(StudentAnswer.__table__.insert(), batch)
+            without = time.perf_counter() - start
+        print(f"\n20k answer inserts {with_triggers * 1000:.0f} ms with the counter trigger, {without * 1000:.0f} ms without")
+
+        with db.engine.begin() as conn:
+            start = time.perf_counter()
+            drift = reconcile(conn)
+            print(f"reconcile {time.perf_counter() - start:.2f}s, repaired {drift} (the answers inserted without trigger)")
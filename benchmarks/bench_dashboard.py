@@ -0,0 +1,65 @@
+"""Benchmark of the home page on a large seeded copy of the database: the queries the dashboard used to run (three
+COUNTs and the latest rows of four tables) against the trigger-maintained counters and activity feed of dashboard.py,
+and GET / end to end:
+
+    python -m benchmarks.bench_dashboard
+    python -m benchmarks.bench_dashboard --scale 2 --runs 100
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database, summarise
+
+
+def latencies(fn, runs):
+    """This function returns the latency in milliseconds of `runs` calls of fn"""
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        results.append((time.perf_counter() - start) * 1000)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+
+    from sqlalchemy.orm import joinedload
+
+    from app import create_app
+    from data_models import db, Course, User, UserRole, Quiz, Question, StudentAnswer
+    from dashboard import dashboard_snapshot
+
+    app = create_app()
+    start = time.perf_counter()
+    print(f"seeded {seed_large_database(path, args.scale)} in {time.perf_counter() - start:.1f}s (triggers included)")
+
+    def computed():
+        # What the home page used to query on every hit
+        Course.query.count()
+        User.query.filter_by(role=UserRole.student).count()
+        Quiz.query.count()
+        Quiz.query.order_by(Quiz.created_at.desc()).limit(5).all()
+        Course.query.order_by(Course.created_at.desc()).limit(5).all()
+        User.query.order_by(User.created_at.desc()).limit(5).all()
+        StudentAnswer.query.options(joinedload(StudentAnswer.question).joinedload(Question.quiz)) \
+            .order_by(StudentAnswer.submitted_at.desc()).limit(5).all()
+        db.session.expunge_all()
+
+    def maintained():
+        dashboard_snapshot(limit=5)
+        db.session.expunge_all()
+
+    with app.app_context():
+        print(f"counts + latest rows   {summarise(latencies(computed, args.runs))}")
+        print(f"counters + feed        {summarise(latencies(maintained, args.runs))}")
+
+    client = app.test_client()
+    print(f"GET /                  {summarise(latencies(lambda: client.get('/'), args.runs))}")
@@ -0,0 +1,83 @@
+"""Offline benchmark of the whole /quizzes/generate-ai pipeline (generation, parsing, DB persistence) on recorded
+OpenAI cassettes.
+
+Record the fixtures once, with a real OPENAI_API_KEY and network access:
+    python -m benchmarks.bench_generation_pipeline --mode record --runs 1
+
+Then replay them anywhere, offline:
+    python -m benchmarks.bench_generation_pipeline --mode replay --runs 50 --latency recorded
+    python -m benchmarks.bench_generation_pipeline --mode replay --runs 50 --latency 0 --profile
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import time
+from collections import defaultdict
+
+from benchmarks.bench_utils import use_database_copy, summarise
+
+# The request bodies have to be identical between recording and replaying for the fixtures to match
+CONFIGURATIONS = {
+    "plain": {"topic": "logic gates", "num_questions": 5, "total_marks": 10, "model_name": "gpt-4.1-mini",
+              "temperature": 0.3, "use_rag": False},
+    "rag": {"topic": "logic gates", "num_questions": 5, "total_marks": 10, "model_name": "gpt-4.1-mini",
+            "temperature": 0.3, "use_rag": True},
+}
+
+
+def run(client, payload, runs):
+    """This function posts the payload `runs` times and returns the request latencies and the stage durations"""
+    latencies = []
+    stages = defaultdict(list)
+    errors = 0
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = client.post("/quizzes/generate-ai", json=payload)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        body = response.get_json() or {}
+        if response.status_code != 200 or "db_error" in body:
+            errors += 1
+            print(f"  error {response.status_code}: {body.get('error') or body.get('db_error')}")
+            continue
+        for stage, duration in body["costs"].get("stages", {}).items():
+            stages[stage].append(duration)
+
+    return latencies, stages, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["record", "replay"], default="replay")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--latency", default="0", help='replay latency: 0, "recorded", ms or "min-max" ms')
+    parser.add_argument("--config", choices=list(CONFIGURATIONS), action="append")
+    parser.add_argument("--profile", action="store_true", help="print the top functions by cumulative time")
+    args = parser.parse_args()
+
+    # The cassette and the database have to be configured before the app and the GenAIRequests modules are imported
+    os.environ["OPENAI_CASSETTE_MODE"] = args.mode
+    os.environ["OPENAI_CASSETTE_LATENCY"] = args.latency
+    use_database_copy()
+
+    from app import create_app
+
+    client = create_app().test_client()
+    profiler = cProfile.Profile() if args.profile else None
+
+    for name in args.config or list(CONFIGURATIONS):
+        print(f"\n== {name} ({args.mode}, {args.runs} runs, latency {args.latency}) ==")
+        if profiler:
+            profiler.enable()
+        latencies, stages, errors = run(client, CONFIGURATIONS[name], args.runs)
+        if profiler:
+            profiler.disable()
+
+        print(f"request: {summarise(latencies)} errors: {errors}")
+        for stage, durations in stages.items():
+            print(f"  {stage:<16} {summarise(durations)}")
+
+    if profiler:
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
@@ -0,0 +1,87 @@
+"""Benchmark of the per-endpoint latency before and after the index migration, on a large seeded copy of the database.
+
+The copy is migrated up to version 1 (tables only), seeded, measured, then upgraded to the latest version (indexes)
+and measured again:
+
+    python -m benchmarks.bench_indexes
+    python -m benchmarks.bench_indexes --scale 0.5 --runs 20
+"""
+import argparse
+import os
+import random
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database, summarise
+
+# Endpoints hitting the indexed foreign keys and filters, {} is replaced by a random id of the given table
+ENDPOINTS = [
+    ("/questions/?quiz_id={}", "quizzes"),
+    ("/quizzes/course/{}", "courses"),
+    ("/assignments/course/{}", "courses"),
+    ("/courses/{}/stats", "courses"),
+    ("/question_options/question/{}", "questions"),
+    ("/student_answers/student/{}", "students"),
+    ("/student_answers/question/{}", "questions"),
+]
+
+
+def measure(client, id_pools, runs, seed=7):
+    """This function calls every endpoint `runs` times with random ids and returns the latency summary per endpoint"""
+    rng = random.Random(seed)  # the same ids before and after the migration
+    results = {}
+    for path, pool in ENDPOINTS:
+        latencies = []
+        for _ in range(runs):
+            url = path.format(rng.choice(id_pools[pool]))
+            start = time.perf_counter()
+            client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[path] = summarise(latencies)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--runs", type=int, default=30)
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"  # measuring the queries, the data is seeded behind the cache's back
+
+    from app import create_app
+    from data_models import db, Quiz, Course, Question, User, UserRole
+    from migrations import upgrade, MIGRATIONS
+
+    app = create_app(migrate=False)
+    with app.app_context():
+        # Starting from a copy without any of the indexes, whatever state data/lms.db is in
+        with db.engine.begin() as conn:
+            indexes = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%' "
+                                           "AND tbl_name NOT LIKE 'llm_%'").fetchall()
+            for (name,) in indexes:
+                conn.exec_driver_sql(f"DROP INDEX {name}")
+            conn.exec_driver_sql("PRAGMA user_version = 0")
+        upgrade(db.engine, target=1)
+        db.engine.dispose()
+
+        print(f"seeded {seed_large_database(path, args.scale)}")
+        id_pools = {
+            "quizzes": [q for (q,) in db.session.query(Quiz.id)],
+            "courses": [c for (c,) in db.session.query(Course.id)],
+            "questions": [q for (q,) in db.session.query(Question.id)],
+            "students": [u for (u,) in db.session.query(User.id).filter(User.role == UserRole.student)],
+        }
+        client = app.test_client()
+
+        before = measure(client, id_pools, args.runs)
+        upgrade(db.engine)
+        after = measure(client, id_pools, args.runs)
+
+    print(f"\n{'endpoint':<34} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10} {'speed-up':>9}")
+    for endpoint, _ in ENDPOINTS:
+        b, a = before[endpoint], after[endpoint]
+        print(f"{endpoint:<34} {b['p50_ms']:>11.2f} {a['p50_ms']:>10.2f} {b['p95_ms']:>11.2f} {a['p95_ms']:>10.2f} "
+              f"{b['p50_ms'] / a['p50_ms']:>8.1f}x")
+    print(f"\nschema version {MIGRATIONS[-1][0]}")
@@ -0,0 +1,80 @@
+"""Benchmark of the MCQ auto-grading on a large seeded copy of the database (scale 10 = 2 million answers). Grades a
+sample of the ungraded answers the per-row way (loading every answer with its question and option through the ORM and
+setting its marks in Python), then every ungraded answer with the set-based UPDATE of grading.py, and one quiz on its
+own. Prints the answers graded per second of each:
+
+    python -m benchmarks.bench_mcq_grading
+    python -m benchmarks.bench_mcq_grading --scale 20 --python-sample 50000
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database
+
+
+def ungrade(path):
+    """This function clears every grade so each run starts from ungraded answers"""
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE student_answers SET marks_awarded = NULL, evaluated_by_teacher = 0")
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=10.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--python-sample", type=int, default=20000, help="answers graded the per-row way")
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+
+    from app import create_app
+    from data_models import db, StudentAnswer, Question
+    from grading import grade_mcq_answers, ungraded_mcq_count, MCQ
+
+    app = create_app()
+    print(f"seeded {seed_large_database(path, args.scale)}")
+    ungrade(path)
+
+    with app.app_context():
+        total = ungraded_mcq_count()
+        print(f"{total:,} ungraded MCQ answers")
+
+        # Per row: what grading in Python would cost
+        start = time.perf_counter()
+        answers = (StudentAnswer.query.join(Question, Question.id == StudentAnswer.question_id)
+                   .filter(Question.question_type == MCQ, StudentAnswer.marks_awarded.is_(None))
+                   .limit(args.python_sample).all())
+        for answer in answers:
+            correct = answer.selected_option is not None and answer.selected_option.is_correct
+            answer.marks_awarded = answer.question.marks if correct else 0
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+        print(f"\n== per row in Python: {len(answers) / elapsed:,.0f} answers/s ==")
+        print(f"  {len(answers):,} answers in {elapsed:.2f} s, {total / (len(answers) / elapsed) / 60:.1f} min "
+              f"projected for all of them")
+        db.session.remove()
+
+    ungrade(path)
+    with app.app_context():
+        start = time.perf_counter()
+        graded = grade_mcq_answers()
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+        print(f"\n== set-based UPDATE: {graded / elapsed:,.0f} answers/s ==")
+        print(f"  {graded:,} answers in {elapsed:.2f} s, {ungraded_mcq_count()} left ungraded")
+
+    ungrade(path)
+    with app.app_context():
+        quiz_id, answers = db.session.execute(
+            db.select(StudentAnswer.quiz_id, db.func.count()).where(StudentAnswer.quiz_id.isnot(None))
+            .group_by(StudentAnswer.quiz_id).order_by(db.func.count().desc()).limit(1)
+        ).one()
+        start = time.perf_counter()
+        graded = grade_mcq_answers(quiz_id)
+        db.session.commit()
+        elapsed = time.perf_counter() - start
+        print(f"\n== one quiz: {graded:,} answers of quiz {quiz_id} in {elapsed * 1000:.0f} ms ==")
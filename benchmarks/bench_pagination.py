@@ -0,0 +1,61 @@
+"""Benchmark of the keyset pagination on a large seeded copy of the database: the latency of the first page against a
+page deep into the table, and the time and peak Python memory of a full NDJSON export.
+
+    python -m benchmarks.bench_pagination
+    python -m benchmarks.bench_pagination --scale 2 --limit 500
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database, summarise
+
+ENDPOINTS = ["/student_answers/", "/question_options/", "/questions/", "/users/"]
+
+
+def page_latencies(client, url, limit, pages):
+    """This function walks `pages` pages of an endpoint and returns the latency of every page"""
+    latencies, cursor = [], None
+    for _ in range(pages):
+        start = time.perf_counter()
+        response = client.get(url, query_string={"limit": limit, **({"cursor": cursor} if cursor else {})})
+        latencies.append((time.perf_counter() - start) * 1000)
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=200, help="pages walked per endpoint")
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"  # measuring the queries, the data is seeded behind the cache's back
+
+    from app import create_app
+
+    app = create_app()
+    print(f"seeded {seed_large_database(path, args.scale)}")
+    client = app.test_client()
+
+    for url in ENDPOINTS:
+        latencies = page_latencies(client, url, args.limit, args.pages)
+        tenth = max(len(latencies) // 10, 1)
+        print(f"\n== {url} ({len(latencies)} pages of {args.limit}) ==")
+        print(f"  first pages {summarise(latencies[:tenth])}")
+        print(f"  last pages  {summarise(latencies[-tenth:])}")
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(url, query_string={"stream": 1})
+        rows = sum(1 for _ in response.response)  # consuming the stream chunk by chunk
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  stream      {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), peak {peak / 2**20:.1f} MiB")
@@ -0,0 +1,113 @@
+"""Benchmark of the local pre-grading of descriptive answers (pre_grading.py) on a synthetic cohort: for every question
+some students paraphrase the model answer, some give half of it plus something else, some answer another question and
+a few leave it blank. Prints, for the lexical vectors (offline) and the embeddings (served by the local fake OpenAI
+server, whose vectors are random so only their timing means anything), the answers triaged per second and per batch,
+the share of answers given 0 locally, how many of them aren't wrong or blank answers, and the LLM calls the full
+grading pipeline makes with and without pre-grading. The synthetic correct answers are near-copies of the model
+answers, so the figures don't calibrate a threshold for real answers, only the cost of a given one:
+
+    python -m benchmarks.bench_pre_grading
+    python -m benchmarks.bench_pre_grading --students 2000 --questions 8 --threshold 0.05
+"""
+import argparse
+import os
+import random
+import time
+from collections import Counter, namedtuple
+
+from benchmarks.bench_utils import summarise
+from GenAIRequests.fake_openai_server import FakeOpenAIServer
+
+REFERENCES = [
+    "A NAND gate outputs 0 only when all of its inputs are 1, it is an AND gate followed by a NOT gate and every other "
+    "gate can be built from NAND gates alone, which makes it a universal gate.",
+    "A multiplexer selects one of its data inputs and forwards it to the single output, the select lines carry the "
+    "binary number of the chosen input so 2 select lines choose among 4 inputs.",
+    "A flip-flop is an edge triggered storage element which keeps one bit, it samples its input on the clock edge "
+    "while a latch is level sensitive and follows its input while enabled.",
+    "Karnaugh maps simplify boolean expressions by grouping adjacent cells holding 1 in groups of powers of two, each "
+    "group becomes one product term with the variables that don't change inside it.",
+    "A half adder adds two bits and gives a sum and a carry, the sum is the XOR of the inputs and the carry is their "
+    "AND, a full adder also takes the carry in of the previous stage.",
+    "Two's complement represents negative numbers by inverting every bit of the positive number and adding 1, so the "
+    "same adder circuit subtracts by adding the complement.",
+]
+SYNONYMS = {"outputs": "gives", "inputs": "input signals", "built": "made", "selects": "picks", "single": "one",
+            "keeps": "stores", "simplify": "reduce", "adds": "sums", "represents": "encodes", "every": "each"}
+Answer = namedtuple("Answer", "id question_id answer_text")
+Question = namedtuple("Question", "id question_text marks reference_answer")
+
+
+def cohort(students, questions, rng):
+    """This function returns the synthetic answers and the kind of each (correct, partial, wrong or blank)"""
+    answers, kinds = [], {}
+    for student in range(students):
+        for question in range(questions):
+            reference = REFERENCES[question % len(REFERENCES)]
+            kind = rng.choices(("correct", "partial", "wrong", "blank"), (45, 25, 27, 3))[0]
+            if kind == "correct":
+                words = [SYNONYMS.get(w, w) if rng.random() < 0.3 else w for w in reference.split()]
+                text = " ".join(w for w in words if rng.random() > 0.05)
+            elif kind == "partial":
+                words = reference.split()
+                other = rng.choice([r for r in REFERENCES if r != reference])
+                text = " ".join(words[:len(words) // 2]) + " " + other[:60]
+            elif kind == "wrong":
+                text = rng.choice([r for r in REFERENCES if r != reference])
+            else:
+                text = ""
+            answer_id = len(answers) + 1
+            answers.append(Answer(answer_id, question + 1, text))
+            kinds[answer_id] = kind
+    return answers, kinds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--questions", type=int, default=6)
+    parser.add_argument("--batch-size", type=int, default=256, help="answers per pre-grading batch")
+    parser.add_argument("--threshold", type=float, default=0.10, help="zero threshold measured (not a shipped default)")
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(embeddings_latency="constant:50").start()
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+    from ai_grading import pack_batches
+    from pre_grading import PreGrader
+
+    rng = random.Random(11)
+    answers, kinds = cohort(args.students, args.questions, rng)
+    questions = {n + 1: Question(n + 1, f"Question {n + 1}", 5, REFERENCES[n % len(REFERENCES)])
+                 for n in range(args.questions)}
+    llm_calls = len(pack_batches(answers, questions))
+    print(f"{len(answers)} answers to {args.questions} questions: {dict(Counter(kinds.values()))}")
+    print(f"without pre-grading: {llm_calls} LLM calls (batches of 25)")
+
+    for mode in ("blank", "lexical", "embeddings"):
+        grader = PreGrader(mode, batch_size=args.batch_size,
+                           threshold=args.threshold if mode != "blank" else None)
+        batch_times = []
+        start = time.perf_counter()
+        grades, ambiguous = {}, []
+        for first in range(0, len(answers), args.batch_size):
+            batch_start = time.perf_counter()
+            batch_grades, batch_ambiguous = grader.triage(answers[first:first + args.batch_size], questions)
+            batch_times.append((time.perf_counter() - batch_start) * 1000)
+            grades.update(batch_grades)
+            ambiguous += batch_ambiguous
+        elapsed = time.perf_counter() - start
+
+        latency = summarise(batch_times)
+        print(f"\n== {mode}: {len(answers) / elapsed:,.0f} answers/s ==")
+        print(f"  batch of {args.batch_size}  p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms")
+        if mode == "embeddings":
+            continue  # the fake vectors are random, the grades mean nothing
+
+        # A 0 for a correct or partial answer is a wrong local grade
+        wrong = sum(1 for answer_id in grades if kinds[answer_id] in ("correct", "partial"))
+        calls = len(pack_batches(ambiguous, questions))
+        print(f"  given 0 locally {len(grades) / len(answers):.1%} ({grader.stats['blank']} blank, "
+              f"{grader.stats['unrelated']} unrelated), {wrong} of them correct or partial answers")
+        print(f"  LLM calls {calls} instead of {llm_calls}: {1 - calls / llm_calls:.1%} avoided")
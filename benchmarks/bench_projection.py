@@ -0,0 +1,70 @@
+"""Benchmark of full ORM entity hydration against the column projections of projection.py, on 100k+ row tables of a
+seeded copy of the database. Both read the same rows and build the same dictionaries:
+
+    python -m benchmarks.bench_projection
+    python -m benchmarks.bench_projection --scale 0.5 --fields id,marks_awarded
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database
+
+
+def rows_per_second(fn, runs):
+    """This function runs fn (which returns the number of rows it read) and returns the best rows/s of the runs"""
+    best = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        rows = fn()
+        best = max(best, rows / (time.perf_counter() - start))
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--fields", help="sparse fieldset for the answers, all the list fields by default")
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+
+    from app import create_app
+    from data_models import db, StudentAnswer, QuestionOption
+    from routes.student_answers import answer_fields
+    from routes.question_options import option_fields
+
+    app = create_app()
+    print(f"seeded {seed_large_database(path, args.scale)}")
+
+    answer_list = ["id", "question_id", "student_id", "selected_option_id", "answer_text", "marks_awarded",
+                   "evaluated_by_ai", "evaluated_by_teacher", "attempt_number", "submitted_at"]
+    cases = [
+        ("student_answers", StudentAnswer, answer_fields, args.fields.split(",") if args.fields else answer_list),
+        ("question_options", QuestionOption, option_fields,
+         ["id", "question_id", "option_text", "is_correct", "order_index"]),
+    ]
+
+    with app.app_context():
+        for table, model, projection, fields in cases:
+            def hydrated():
+                rows = [{name: getattr(obj, name) for name in fields} for obj in model.query.all()]
+                db.session.expunge_all()
+                return len(rows)
+
+            def projected():
+                return len([projection.serialize(row, fields) for row in projection.query(fields).all()])
+
+            orm = rows_per_second(hydrated, args.runs)
+            proj = rows_per_second(projected, args.runs)
+            print(f"{table:<17} fields={','.join(fields)}")
+            print(f"  ORM entities  {orm:>12,.0f} rows/s")
+            print(f"  projection    {proj:>12,.0f} rows/s  ({proj / orm:.1f}x)")
+
+        client = app.test_client()
+        start = time.perf_counter()
+        rows = sum(len(client.get("/student_answers/", query_string={"limit": 1000, "fields": args.fields or ""}).get_json())
+                   for _ in range(20))
+        print(f"\nGET /student_answers/?limit=1000  {rows / (time.perf_counter() - start):,.0f} rows/s over HTTP")
@@ -0,0 +1,84 @@
+"""Benchmark of an exam start on a large seeded copy of the database: a class of students all fetching the same quiz at
+once, from concurrent threads. Each student either loads the quiz the per-resource way (the questions of the quiz,
+then the options of every question) or fetches the cached delivery payload (quiz_delivery.py). Prints the students
+served per second, the requests and SQL queries per student and the latency of a whole quiz load:
+
+    python -m benchmarks.bench_quiz_delivery
+    python -m benchmarks.bench_quiz_delivery --students 1000 --threads 32
+"""
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database, summarise
+
+
+def per_resource(client, quiz_id):
+    """This function loads a quiz like a client without the delivery endpoint and returns the number of requests"""
+    questions = client.get(f"/questions/?quiz_id={quiz_id}&limit=1000").get_json()
+    for question in questions:
+        client.get(f"/question_options/question/{question['id']}")
+    return 1 + len(questions)
+
+
+def delivery(client, quiz_id):
+    client.get(f"/quizzes/{quiz_id}/delivery", headers={"Accept-Encoding": "gzip"})
+    return 1
+
+
+def exam_start(app, load, quiz_id, students, threads):
+    """This function has every student load the quiz and returns the students/s, requests and latencies"""
+    def student(_):
+        start = time.perf_counter()
+        requests = load(app.test_client(), quiz_id)
+        return requests, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(student, range(students)))
+    elapsed = time.perf_counter() - start
+    return students / elapsed, sum(r for r, _ in results), summarise([ms for _, ms in results])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"
+
+    from app import create_app
+    from data_models import db, Quiz
+    from quiz_delivery import delivery_cache
+
+    app = create_app()
+    print(f"seeded {seed_large_database(path, args.scale)}")
+
+    with app.app_context():
+        quiz_id, questions = db.session.query(Quiz.id, Quiz.question_count).order_by(Quiz.question_count.desc(),
+                                                                                     Quiz.id).first()
+        queries = [0]
+        lock = threading.Lock()
+
+        def count_query(*_):
+            with lock:
+                queries[0] += 1
+        event.listen(db.engine, "before_cursor_execute", count_query)
+    print(f"quiz {quiz_id} with {questions} questions, {args.students} students on {args.threads} threads")
+
+    for name, load in (("per resource", per_resource), ("delivery", delivery)):
+        queries[0] = 0
+        delivery_cache.clear()
+        throughput, requests, latency = exam_start(app, load, quiz_id, args.students, args.threads)
+        print(f"\n== {name}: {throughput:,.0f} students/s ==")
+        print(f"  {requests / args.students:.1f} requests and {queries[0] / args.students:.1f} queries per student")
+        print(f"  quiz load  p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms")
+    print(f"\ndelivery payloads built: {delivery_cache.builds}")
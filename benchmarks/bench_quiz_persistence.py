@@ -0,0 +1,79 @@
+"""Benchmark of saving a generated quiz: the previous ORM loop (flush after the quiz and after every question) against
+the batched inserts of quiz_persistence, on a throwaway copy of the database.
+
+    python -m benchmarks.bench_quiz_persistence
+    python -m benchmarks.bench_quiz_persistence --questions 50 --options 4 --runs 50
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_utils import use_database_copy, summarise
+
+
+def generated_quiz(num_questions, num_options):
+    """This function builds a QuizResponse-shaped dict like the one returned by the generators"""
+    return {
+        "title": "Benchmark quiz",
+        "total_marks": num_questions,
+        "questions": [{
+            "question": f"Benchmark question {i}?",
+            "options": [f"Option {j}" for j in range(num_options)],
+            "correct_answer": "Option 0"
+        } for i in range(num_questions)]
+    }
+
+
+def save_per_row(result):
+    """This function is the previous save block of generate_ai_quiz, one flush per question to learn its id"""
+    new_quiz = Quiz(title=result["title"], total_marks=result["total_marks"], course_id=1, created_by=1)
+    db.session.add(new_quiz)
+    db.session.flush()
+
+    for q_data in result["questions"]:
+        new_question = Question(quiz_id=new_quiz.id, question_text=q_data["question"],
+                                question_type="multiple_choice", marks=1, created_by=1)
+        db.session.add(new_question)
+        db.session.flush()
+
+        correct_ans = q_data["correct_answer"].strip().lower()
+        for opt_text in q_data["options"]:
+            db.session.add(QuestionOption(question_id=new_question.id, option_text=opt_text,
+                                          is_correct=opt_text.strip().lower() == correct_ans))
+    db.session.commit()
+
+
+def save_bulk(result):
+    """This function saves the quiz through the batched inserts of quiz_persistence"""
+    insert_quiz(result["title"], result["total_marks"], 1, 1, generated_mcq_rows(result["questions"]))
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=30)
+    args = parser.parse_args()
+
+    use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+
+    from app import create_app
+    from data_models import db, Quiz, Question, QuestionOption
+    from quiz_persistence import insert_quiz, generated_mcq_rows
+
+    result = generated_quiz(args.questions, args.options)
+    rows_per_quiz = 1 + args.questions * (1 + args.options)
+
+    with create_app().app_context():
+        for name, save in (("per-row flush", save_per_row), ("bulk insert", save_bulk)):
+            save(result)  # warm-up
+            latencies = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                save(result)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+            rows_per_s = rows_per_quiz * len(latencies) / (sum(latencies) / 1000)
+            print(f"{name:<14} {rows_per_quiz} rows/quiz  {rows_per_s:,.0f} rows/s  {summarise(latencies)}")
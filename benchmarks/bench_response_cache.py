@@ -0,0 +1,78 @@
+"""Benchmark of the response cache (response_cache.py) on a large seeded copy of the database: the same read-heavy
+workload, with a small share of writes invalidating the cache as it goes, run with the cache off, with the memory
+store and with the disk store. Prints the throughput of every run and the hit ratio and latencies per endpoint:
+
+    python -m benchmarks.bench_response_cache
+    python -m benchmarks.bench_response_cache --requests 20000 --write-ratio 0.05
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database
+
+# Read endpoints of the workload, {} is replaced by a random id of the given pool
+READS = [
+    ("/courses/{}", "courses"),
+    ("/courses/{}/stats", "courses"),
+    ("/quizzes/{}", "quizzes"),
+    ("/quizzes/course/{}", "courses"),
+    ("/questions/{}", "questions"),
+    ("/questions/?quiz_id={}", "quizzes"),
+    ("/programs/program-course-counts", None),
+]
+
+
+def run(client, pools, requests, write_ratio, seed=11):
+    """This function sends the workload and returns the number of requests per second"""
+    rng = random.Random(seed)  # the same workload for every store
+    start = time.perf_counter()
+    for n in range(requests):
+        if rng.random() < write_ratio:
+            if rng.random() < 0.5:
+                client.put(f"/quizzes/{rng.choice(pools['quizzes'])}", json={"title": f"Renamed quiz {n}"})
+            else:
+                client.post("/student_answers/", json={"question_id": rng.choice(pools["questions"]),
+                                                        "student_id": 1, "answer_text": "benchmark"})
+            continue
+        path, pool = rng.choice(READS)
+        client.get(path.format(rng.choice(pools[pool])) if pool else path)
+    return requests / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 200k answers")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--write-ratio", type=float, default=0.01)
+    parser.add_argument("--hot", type=int, default=100, help="number of distinct ids read per pool")
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="lms-cache-"), "response_cache.db")
+
+    import response_cache
+    from app import create_app
+    from data_models import db, Course, Quiz, Question
+
+    seeded = False
+    for store in ("off", "memory", "disk"):
+        os.environ["RESPONSE_CACHE"] = store
+        app = create_app()
+        if not seeded:
+            print(f"seeded {seed_large_database(path, args.scale)}")
+            seeded = True
+        with app.app_context():
+            rng = random.Random(3)
+            pools = {name: rng.sample([i for (i,) in db.session.query(model.id)], args.hot)
+                     for name, model in (("courses", Course), ("quizzes", Quiz), ("questions", Question))}
+
+        response_cache.stats.reset()
+        throughput = run(app.test_client(), pools, args.requests, args.write_ratio)
+        print(f"\n== {store}: {throughput:,.0f} requests/s ==")
+        for row in response_cache.stats.summary():
+            print(f"  {row['endpoint']:<37} hit ratio {row['hit_ratio']:.2f}  "
+                  f"p50 hit {row['p50_hit_ms']} ms  p50 miss {row['p50_miss_ms']} ms")
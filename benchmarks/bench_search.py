@@ -0,0 +1,68 @@
+"""Benchmark of the full-text search indexes against the ilike('%keyword%') scans they replaced, on a large seeded
+copy of the database. Both sides find the ids of every question matching a keyword, then the /questions/search
+endpoint is timed end to end. Last, one call of the unified /search is compared with calling the search route of every
+entity in turn:
+
+    python -m benchmarks.bench_search
+    python -m benchmarks.bench_search --scale 2 --runs 50
+"""
+import argparse
+import os
+import time
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database, summarise
+
+# Seeded questions read "Seed question <id> about topic <1-500>?", from a few matches to none at all
+KEYWORDS = ["topic 123", "question 31337", "about", "zebra"]
+
+# The per-entity search routes the unified /search replaces, {} is the keyword
+ENTITY_SEARCHES = ["/questions/search?q={}", "/quizzes/search?keyword={}", "/assignments/search?keyword={}",
+                   "/courses/search?keyword={}", "/programs/search?keyword={}", "/users/search?q={}"]
+
+
+def latencies(fn, runs):
+    """This function returns the latency in milliseconds of `runs` calls of fn"""
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        results.append((time.perf_counter() - start) * 1000)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the seeded data set, 1 = 40k questions")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"  # measuring the queries, the data is seeded behind the cache's back
+
+    from app import create_app
+    from data_models import db, Question
+    from search_index import SEARCH_INDEXES, match_query
+
+    app = create_app()
+    print(f"seeded {seed_large_database(path, args.scale)}")
+    client = app.test_client()
+    index = SEARCH_INDEXES["questions"]
+
+    with app.app_context():
+        for keyword in KEYWORDS:
+            # ilike matches substrings, the index matches word prefixes, so the counts can differ a little
+            scan = lambda: db.session.query(Question.id).filter(Question.question_text.ilike(f"%{keyword}%")).all()
+            fts = lambda: db.session.execute(index.matching_ids(match_query(keyword))).all()
+            print(f"\n== {keyword!r}: {len(scan())} rows by ilike, {len(fts())} by the index ==")
+            print(f"  ilike scan     {summarise(latencies(scan, args.runs))}")
+            print(f"  FTS5 index     {summarise(latencies(fts, args.runs))}")
+            endpoint = lambda: client.get("/questions/search", query_string={"q": keyword})
+            print(f"  GET /questions/search (top 50, ranked, snippets) {summarise(latencies(endpoint, args.runs))}")
+
+    for keyword in ["seed 12", "topic 123"]:
+        sequential = lambda: [client.get(url.format(keyword)) for url in ENTITY_SEARCHES]
+        unified = lambda: client.get("/search", query_string={"q": keyword})
+        print(f"\n== every entity for {keyword!r}: {unified().get_json()['facets']} ==")
+        print(f"  {len(ENTITY_SEARCHES)} search routes  {summarise(latencies(sequential, args.runs))}")
+        print(f"  GET /search          {summarise(latencies(unified, args.runs))}")
@@ -0,0 +1,150 @@
+"""Benchmark of the near-duplicate detection of similarity.py on a throwaway copy of the database. Every size is one
+new question answered by that many students: most write their own answer, 2% belong to rings of 2 to 6 students who
+copy an answer with a few words changed or dropped. Prints, per size, the time to hash the answers and to search the
+clusters (first check), to check again after 1% more answers arrived (incremental), the copied answers found and the
+answers wrongly reported, and the projected time of comparing every pair of answers exactly:
+
+    python -m benchmarks.bench_similarity
+    python -m benchmarks.bench_similarity --sizes 10000 100000 --exact-sample 2000
+"""
+import argparse
+import itertools
+import os
+import random
+import re
+import time
+
+from benchmarks.bench_utils import use_database_copy
+
+VOCABULARY = [f"w{n}" for n in range(3000)]
+WEIGHTS = list(itertools.accumulate(1 / (rank + 10) for rank in range(len(VOCABULARY))))  # Zipf-like word frequencies
+RING_SHARE = 0.02
+
+
+def honest_answer(rng):
+    """This function returns an answer of 30 to 80 words drawn from the vocabulary"""
+    return " ".join(rng.choices(VOCABULARY, cum_weights=WEIGHTS, k=rng.randint(30, 80)))
+
+
+def shingle_set(text):
+    words = re.findall(r"\w+", text)
+    return set(zip(words, words[1:], words[2:]))
+
+
+def jaccard(first, second):
+    return len(first & second) / (len(first | second) or 1)
+
+
+def copied_answer(source, rng):
+    """This function returns a copy of an answer with up to 5% of its words changed and up to 5% dropped"""
+    words = []
+    changes, drops = rng.uniform(0, 0.05), rng.uniform(0, 0.05)
+    for word in source.split():
+        roll = rng.random()
+        if roll < drops:
+            continue
+        words.append(rng.choice(VOCABULARY) if roll < drops + changes else word)
+    return " ".join(words)
+
+
+def cohort(size, rng):
+    """This function returns the answers and the ring number of every copied answer (None for the honest ones)"""
+    answers, rings = [], []
+    while len(answers) < size:
+        if rng.random() < RING_SHARE / 4:  # rings hold 4 students on average
+            source = honest_answer(rng)
+            members = [source] + [copied_answer(source, rng) for _ in range(rng.randint(1, 5))]
+            answers += members
+            rings += [len(answers)] * len(members)
+        else:
+            answers.append(honest_answer(rng))
+            rings.append(None)
+    return answers[:size], rings[:size]
+
+
+def exact_pairs_seconds(answers, sample):
+    """This function times the exact Jaccard similarity of every pair of a sample and projects it to all the answers"""
+    shingles = [shingle_set(answer) for answer in answers[:sample]]
+    start = time.perf_counter()
+    for first, second in itertools.combinations(shingles, 2):
+        jaccard(first, second)
+    elapsed = time.perf_counter() - start
+    return elapsed * (len(answers) / sample) ** 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="answers to one question")
+    parser.add_argument("--exact-sample", type=int, default=2000, help="answers compared pairwise exactly")
+    args = parser.parse_args()
+
+    use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ["RESPONSE_CACHE"] = "off"
+
+    from sqlalchemy import insert
+
+    from app import create_app
+    from data_models import db, Assignment, StudentAnswer
+    from quiz_persistence import insert_questions
+    from similarity import SIMILARITY_THRESHOLD, index_answers, question_clusters
+
+    app = create_app()
+    rng = random.Random(50)
+    for size in args.sizes:
+        answers, rings = cohort(size, rng)
+        arriving = int(size * 0.01)
+        with app.app_context():
+            assignment = Assignment(title=f"Similarity benchmark {size}", total_marks=5, course_id=1)
+            db.session.add(assignment)
+            db.session.flush()
+            question_id = insert_questions([{"question_text": "Explain the NAND gate.", "question_type": "descriptive",
+                                             "marks": 5}], assignment_id=assignment.id)[0]
+
+            def add_answers(first, last):
+                """This function inserts the answers first to last - 1, student n answers answer n"""
+                result = db.session.execute(insert(StudentAnswer).returning(StudentAnswer.id,
+                                                                            sort_by_parameter_order=True), [{
+                    "question_id": question_id, "student_id": 100000 + n, "assignment_id": assignment.id,
+                    "answer_text": answers[n], "attempt_number": 1
+                } for n in range(first, last)])
+                db.session.commit()
+                return result.scalars().all()
+
+            def check():
+                """This function runs a check like find_similar_answers and returns its clusters and timings"""
+                start = time.perf_counter()
+                hashed = index_answers([question_id])
+                db.session.commit()
+                hashed_at = time.perf_counter()
+                clusters = question_clusters(question_id)
+                return clusters, hashed, hashed_at - start, time.perf_counter() - hashed_at
+
+            answer_ids = add_answers(0, size - arriving)
+            _, hashed, hash_seconds, search_seconds = check()
+            answer_ids += add_answers(size - arriving, size)
+            clusters, new, new_hash_seconds, new_search_seconds = check()
+
+        # The copied answers an exact comparison would report: at or above the threshold with one of their ring
+        ring_members = {}
+        for n, ring in enumerate(rings):
+            if ring is not None:
+                ring_members.setdefault(ring, []).append((n, shingle_set(answers[n])))
+        detectable = {answer_ids[n] for members in ring_members.values() for n, shingles in members
+                      if any(jaccard(shingles, mate) >= SIMILARITY_THRESHOLD for m, mate in members if m != n)}
+        clustered = {answer_id for cluster in clusters for answer_id in cluster["answer_ids"]}
+        copied = sum(1 for ring in rings if ring is not None)
+        honest_reported = sum(1 for answer_id, ring in zip(answer_ids, rings) if answer_id in clustered and ring is None)
+        exact_seconds = exact_pairs_seconds(answers, min(args.exact_sample, size))
+        first_seconds = hash_seconds + search_seconds
+
+        print(f"\n== {size:,} answers to one question, {copied} copied in rings of 2 to 6 ==")
+        print(f"  first check  {first_seconds:.2f} s ({hashed / first_seconds:,.0f} answers/s): hashing "
+              f"{hashed:,} answers {hash_seconds:.2f} s, search {search_seconds:.2f} s")
+        print(f"  incremental  {new_hash_seconds + new_search_seconds:.2f} s: hashing {new:,} new answers "
+              f"{new_hash_seconds:.2f} s, search {new_search_seconds:.2f} s")
+        print(f"  {len(clustered & detectable)} of the {len(detectable)} copied answers at or above "
+              f"{SIMILARITY_THRESHOLD} found ({len(clustered & detectable) / len(detectable):.1%}), "
+              f"{len(clustered - detectable)} answers below it reported ({honest_reported} honest)")
+        print(f"  exact pairwise comparison: {size * (size - 1) // 2:,} pairs, projected {exact_seconds:,.0f} s "
+              f"({exact_seconds / first_seconds:,.0f}x the first check)")
@@ -0,0 +1,114 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+
+from GenAIRequests.telemetry import percentile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LMS_DB = os.path.join(BASE_DIR, "data", "lms.db")
+
+
+def use_database_copy(source: str = LMS_DB) -> str:
+    """This function copies the database into a temporary folder and points DATABASE_URL to it so a benchmark never
+    writes to data/lms.db. It has to run before the app is imported"""
+    tmp_dir = tempfile.mkdtemp(prefix="lms-bench-")
+    path = os.path.join(tmp_dir, "lms.db")
+    if source:
+        shutil.copyfile(source, path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return path
+
+
+def summarise(latencies_ms) -> dict:
+    """This function returns the usual latency figures of a list of durations in milliseconds"""
+    return {
+        "n": len(latencies_ms),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3) if latencies_ms else None,
+        "p50_ms": round(percentile(latencies_ms, 50), 3) if latencies_ms else None,
+        "p95_ms": round(percentile(latencies_ms, 95), 3) if latencies_ms else None,
+        "p99_ms": round(percentile(latencies_ms, 99), 3) if latencies_ms else None,
+    }
+
+
+def seed_large_database(path: str, scale: float = 1.0, seed: int = 42) -> dict:
+    """This function fills the (already created) tables of the database at path with a large synthetic data set through
+    plain sqlite3 executemany, and returns the number of rows written per table. scale=1 means 5k users, 400 courses,
+    4k quizzes, 40k questions, 160k options and 200k answers"""
+    rng = random.Random(seed)
+    n_students, n_teachers = int(4500 * scale), int(400 * scale)
+    n_programs, n_courses = max(int(20 * scale), 1), max(int(400 * scale), 1)
+    n_quizzes, n_assignments = int(4000 * scale), int(2000 * scale)
+    n_questions, n_answers = int(40000 * scale), int(200000 * scale)
+
+    conn = sqlite3.connect(path)
+    user_offset = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+    ids = {table: conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+           for table in ("programs", "courses", "quizzes", "assignments", "questions", "question_options")}
+
+    teachers = range(user_offset + 1, user_offset + n_teachers + 1)
+    students = range(user_offset + n_teachers + 1, user_offset + n_teachers + n_students + 1)
+    conn.executemany(
+        "INSERT INTO users (id, name, password, email, role) VALUES (?, ?, 'x', ?, ?)",
+        [(uid, f"Seed User {uid}", f"seed{uid}@example.com", "teacher" if uid in teachers else "student")
+         for uid in range(user_offset + 1, students.stop)]
+    )
+
+    programs = range(ids["programs"] + 1, ids["programs"] + n_programs + 1)
+    conn.executemany("INSERT INTO programs (id, name, created_by) VALUES (?, ?, ?)",
+                     [(pid, f"Seed Program {pid}", rng.choice(teachers)) for pid in programs])
+
+    courses = range(ids["courses"] + 1, ids["courses"] + n_courses + 1)
+    conn.executemany("INSERT INTO courses (id, name, code, credit_hours, program_id, created_by) VALUES (?, ?, ?, 3, ?, ?)",
+                     [(cid, f"Seed Course {cid}", f"SEED-{cid}", rng.choice(programs), rng.choice(teachers))
+                      for cid in courses])
+    conn.executemany("INSERT OR IGNORE INTO teacher_course (teacher_id, course_id) VALUES (?, ?)",
+                     [(rng.choice(teachers), cid) for cid in courses for _ in range(2)])
+    conn.executemany("INSERT OR IGNORE INTO student_course (student_id, course_id) VALUES (?, ?)",
+                     [(sid, rng.choice(courses)) for sid in students for _ in range(4)])
+
+    quizzes = range(ids["quizzes"] + 1, ids["quizzes"] + n_quizzes + 1)
+    conn.executemany("INSERT INTO quizzes (id, title, total_marks, course_id, created_by) VALUES (?, ?, 10, ?, ?)",
+                     [(qid, f"Seed Quiz {qid}", rng.choice(courses), rng.choice(teachers)) for qid in quizzes])
+    assignments = range(ids["assignments"] + 1, ids["assignments"] + n_assignments + 1)
+    conn.executemany("INSERT INTO assignments (id, title, total_marks, course_id, created_by) VALUES (?, ?, 20, ?, ?)",
+                     [(aid, f"Seed Assignment {aid}", rng.choice(courses), rng.choice(teachers)) for aid in assignments])
+
+    questions = range(ids["questions"] + 1, ids["questions"] + n_questions + 1)
+    conn.executemany(
+        "INSERT INTO questions (id, quiz_id, assignment_id, created_by, question_text, question_type, marks) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(qid, quizzes[i % len(quizzes)] if i % 5 else None, None if i % 5 else rng.choice(assignments),
+          rng.choice(teachers), f"Seed question {qid} about topic {rng.randint(1, 500)}?",
+          "multiple_choice" if i % 5 else "descriptive", 1 if i % 5 else 5)
+         for i, qid in enumerate(questions)]
+    )
+    mcq = [qid for i, qid in enumerate(questions) if i % 5]
+    options = [(q, f"Option {k} of question {q}", k == 0, k) for q in mcq for k in range(4)]
+    conn.executemany("INSERT INTO question_options (question_id, option_text, is_correct, order_index) VALUES (?, ?, ?, ?)",
+                     options)
+    # The options were inserted in order, so the first option of the n-th MCQ has id first_option + 4n
+    first_option = {q: ids["question_options"] + 1 + n * 4 for n, q in enumerate(mcq)}
+
+    question_quiz = {qid: quizzes[i % len(quizzes)] if i % 5 else None for i, qid in enumerate(questions)}
+    question_assignment = dict(conn.execute("SELECT id, assignment_id FROM questions WHERE id >= ? AND quiz_id IS NULL",
+                                            (questions[0],)).fetchall())
+    answers = []
+    for _ in range(n_answers):
+        question_id = rng.choice(questions)
+        quiz_id = question_quiz[question_id]
+        option_id = first_option[question_id] + rng.randint(0, 3) if quiz_id else None
+        answers.append((question_id, rng.choice(students), quiz_id, question_assignment.get(question_id), option_id,
+                        None if quiz_id else "Seed descriptive answer", rng.randint(0, 1)))
+    conn.executemany("INSERT INTO student_answers (question_id, student_id, quiz_id, assignment_id, selected_option_id, "
+                     "answer_text, marks_awarded, attempt_number) VALUES (?, ?, ?, ?, ?, ?, ?, 1)", answers)
+    # Plain SQL doesn't set the updated_at the ORM sets on insert
+    for table in ("users", "programs", "courses", "quizzes", "assignments", "questions", "question_options",
+                  "student_answers"):
+        conn.execute(f"UPDATE {table} SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+    conn.commit()
+    conn.close()
+
+    return {"users": n_students + n_teachers, "courses": n_courses, "quizzes": n_quizzes, "questions": n_questions,
+            "question_options": len(options), "student_answers": n_answers}
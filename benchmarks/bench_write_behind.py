@@ -0,0 +1,111 @@
+"""Benchmark of a quiz deadline spike on a throwaway copy of the database: a class of students submitting their whole
+attempt at the same moment, from concurrent threads, once with every submission written to SQLite in the request and
+once with WRITE_BEHIND on (write_behind.py). Prints the submissions acknowledged per second, the latency of the
+acknowledgement, the commits and, for the write-behind run, the time the writer needed to drain the queue:
+
+    python -m benchmarks.bench_write_behind
+    python -m benchmarks.bench_write_behind --students 2000 --questions 20 --threads 12
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from benchmarks.bench_utils import use_database_copy, summarise
+
+
+def deadline_spike(app, quiz_id, student_ids, answers, threads):
+    """This function has every student submit their attempt and returns the submissions/s, the latencies and the status
+    codes of the responses"""
+    def student(student_id):
+        start = time.perf_counter()
+        response = app.test_client().post("/student_answers/attempts", json={
+            "student_id": student_id, "quiz_id": quiz_id, "answers": answers})
+        return response.status_code, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(student, student_ids))
+    elapsed = time.perf_counter() - start
+    return len(student_ids) / elapsed, summarise([ms for _, ms in results]), Counter(code for code, _ in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"
+    os.environ["WRITE_BEHIND"] = "off"
+
+    from app import create_app
+    from data_models import db, User, UserRole, StudentAnswer
+    from quiz_persistence import insert_quiz
+    from write_behind import WriteBehindBuffer
+
+    app = create_app()
+    rng = random.Random(7)
+
+    with app.app_context():
+        # One quiz per run so both runs store the same attempts
+        quizzes = []
+        for run in range(2):
+            quiz_id, _ = insert_quiz(f"Write-behind benchmark {run}", args.questions, 1, 1, [{
+                "question_text": f"Question {n}?", "question_type": "multiple_choice", "marks": 1,
+                "options": [{"option_text": f"Option {k}", "is_correct": k == 0} for k in range(4)]
+            } for n in range(args.questions)])
+            quizzes.append(quiz_id)
+
+        students = [User(name=f"Student {n}", email=f"write-behind-bench-{n}@example.com", password="x",
+                         role=UserRole.student) for n in range(args.students)]
+        db.session.add_all(students)
+        db.session.commit()
+        student_ids = [student.id for student in students]
+
+        commits = [0]
+        lock = threading.Lock()
+
+        def count_commit(_):
+            with lock:
+                commits[0] += 1
+        event.listen(db.engine, "commit", count_commit)
+
+    for quiz_id, name in zip(quizzes, ("written in the request", "write-behind")):
+        if name == "write-behind":
+            # Started here rather than by create_app so both runs share the app, its engine and the commit counter
+            app.extensions["write_behind"] = WriteBehindBuffer(
+                app, os.path.join(tempfile.mkdtemp(prefix="lms-bench-"), "submissions.log"))
+
+        with app.app_context():
+            options = db.session.execute(db.text(
+                "SELECT questions.id, min(question_options.id) FROM questions JOIN question_options "
+                "ON question_options.question_id = questions.id WHERE quiz_id = :quiz GROUP BY questions.id"
+            ), {"quiz": quiz_id}).all()
+        answers = [{"question_id": question_id, "selected_option_id": option_id + rng.randrange(4)}
+                   for question_id, option_id in options]
+
+        commits[0] = 0
+        throughput, latency, codes = deadline_spike(app, quiz_id, student_ids, answers, args.threads)
+        print(f"\n== {name}: {throughput:,.0f} submissions/s acknowledged (responses {dict(sorted(codes.items()))}) ==")
+        print(f"  acknowledgement  p50 {latency['p50_ms']} ms  p95 {latency['p95_ms']} ms")
+
+        if name == "write-behind":
+            buffer = app.extensions["write_behind"]
+            start = time.perf_counter()
+            buffer.flush()
+            print(f"  queue drained {(time.perf_counter() - start) * 1000:.0f} ms after the last acknowledgement, "
+                  f"in {buffer.stats['batches']} batches")
+
+        with app.app_context():
+            stored = db.session.query(StudentAnswer).filter_by(quiz_id=quiz_id).count()
+        print(f"  {stored} answers stored with {commits[0]} commits")
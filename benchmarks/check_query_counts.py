@@ -0,0 +1,87 @@
+"""Check that the list endpoints run a constant number of SQL queries whatever the number of rows they return.
+
+Every endpoint is called on a seeded copy of the database, the data set is then doubled and the endpoint called again:
+the number of queries has to be the same both times (an N+1 shows up as a count growing with the rows). Exits with
+status 1 when an endpoint isn't constant, so it can run in CI:
+
+    python -m benchmarks.check_query_counts
+
+tests/test_query_counts.py runs the same measure under pytest and also checks the number of queries of every endpoint.
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import event
+
+from benchmarks.bench_utils import use_database_copy, seed_large_database
+
+# The seeded data sets stay below 500 rows per list, the IN (...) batch size of selectinload, so a constant endpoint
+# really runs the same queries on both of them
+ENDPOINTS = [
+    "/courses/",
+    "/programs/",
+    "/programs/program-course-counts",
+    "/users/",
+    "/users/?role=student",
+    "/users/search?q=e",
+    "/questions/?type=descriptive",
+    "/",
+    "/ui/courses",
+    "/ui/users",
+    "/ui/programs",
+]
+DEFAULT_SCALE = 0.02  # size of each seeded batch
+
+
+class QueryCounter:
+    """This class counts the SQL statements sent by an engine while it is enabled"""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def measure(self, client, url):
+        self.count = 0
+        response = client.get(url)
+        return self.count, response.status_code
+
+
+def measure_endpoints(app, path: str, scale: float) -> dict:
+    """This function seeds the database at path twice and returns {url: [(queries, status) on 1x data, on 2x data]}"""
+    client = app.test_client()
+    results = {}
+    with app.app_context():
+        from data_models import db
+        counter = QueryCounter(db.engine)
+        for seed in (1, 2):
+            seed_large_database(path, scale, seed=seed)
+            for url in ENDPOINTS:
+                results.setdefault(url, []).append(counter.measure(client, url))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=DEFAULT_SCALE, help="size of each seeded batch")
+    args = parser.parse_args()
+
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"  # measuring the queries, the data is seeded behind the cache's back
+
+    from app import create_app
+
+    results = measure_endpoints(create_app(), path, args.scale)
+
+    failures = 0
+    print(f"{'endpoint':<34} {'queries (1x data)':>18} {'queries (2x data)':>18}")
+    for url, ((small, status_small), (large, status_large)) in results.items():
+        ok = small == large and status_small == status_large == 200
+        failures += not ok
+        print(f"{url:<34} {small:>18} {large:>18}  {'ok' if ok else 'NOT CONSTANT' if small != large else 'HTTP ERROR'}")
+
+    sys.exit(1 if failures else 0)
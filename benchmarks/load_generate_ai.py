@@ -0,0 +1,97 @@
+"""End-to-end load test of /quizzes/generate-ai against the local fake OpenAI server.
+
+Starts the fake server and the app (threaded werkzeug server, throwaway database copy) in this process, then drives
+the plain and RAG generation paths at increasing concurrency and reports throughput, latency percentiles and the error
+rate for every configuration:
+
+    python -m benchmarks.load_generate_ai
+    python -m benchmarks.load_generate_ai --concurrency 1 4 16 64 --requests 200 --latency lognormal:1200,0.6
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench_utils import use_database_copy, summarise
+from GenAIRequests.fake_openai_server import FakeOpenAIServer
+
+PAYLOADS = {
+    "plain": {"topic": "logic gates", "num_questions": 5, "total_marks": 10, "model_name": "gpt-4.1-mini",
+              "use_rag": False},
+    "rag": {"topic": "logic gates", "num_questions": 5, "total_marks": 10, "model_name": "gpt-4.1-mini",
+            "use_rag": True},
+}
+
+
+def post(url, payload):
+    """This function sends one generation request and returns (latency in ms, ok)"""
+    data = json.dumps(payload).encode()
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="POST")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=300) as resp:
+            body = json.loads(resp.read())
+            ok = resp.status == 200 and "db_error" not in body
+    except (urllib.error.URLError, TimeoutError, ValueError):
+        ok = False
+    return (time.perf_counter() - start) * 1000, ok
+
+
+def run_level(url, payload, concurrency, total):
+    """This function fires `total` requests with `concurrency` in flight and returns the figures for that level"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: post(url, payload), range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, ok in results if ok]
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "error_rate": round(errors / total, 4),
+        **summarise(latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=0, help="requests per level, 4 x concurrency by default")
+    parser.add_argument("--latency", default="lognormal:800,0.4", help="LLM latency distribution of the fake server")
+    parser.add_argument("--embeddings-latency", default="constant:50")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="failures injected by the fake server")
+    parser.add_argument("--mode", choices=list(PAYLOADS), action="append")
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(latency=args.latency, embeddings_latency=args.embeddings_latency,
+                            error_rate=args.error_rate).start()
+
+    # Pointing the OpenAI clients and the database before the app is imported
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    use_database_copy()
+
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # no access log line per request
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/quizzes/generate-ai"
+
+    print(f"fake OpenAI at {fake.base_url} with latency {args.latency}")
+    for mode in args.mode or list(PAYLOADS):
+        post(url, PAYLOADS[mode])  # warm-up, builds the RAG vector store once
+        print(f"\n== {mode} ==")
+        for concurrency in args.concurrency:
+            print(run_level(url, PAYLOADS[mode], concurrency, args.requests or concurrency * 4))
+
+    print(f"\nfake server calls: {fake.counts}")
+    server.shutdown()
@@ -0,0 +1,115 @@
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import func, select
+
+from data_models import db, utc_now
+from migrations import add_column, create_index
+
+# Conditional GETs for the polling clients. Every entity has an updated_at column, set on insert and on every change
+# made through the ORM (the before_update event of data_models.py) or by the counter triggers of counters.py. A view
+# declares the rows its response is built from:
+#
+#     @courses_bp.route("/<int:course_id>", methods=["GET"])
+#     @conditional(rows(Course, id="course_id"), User)
+#     def get_course(course_id): ...
+#
+# a model alone stands for its whole table, rows() for the rows whose columns equal view arguments. Before running the
+# view the count and the latest updated_at of every source are read (one aggregate per source, on the updated_at and
+# foreign key indexes), they give the ETag and Last-Modified of the response. A request whose If-None-Match matches,
+# or whose If-Modified-Since isn't older, gets a 304 without the view running, nothing is loaded or serialized.
+#
+# The count is part of the ETag because deleting a row doesn't move the latest updated_at. For the same reason
+# If-Modified-Since is only trusted for responses built from single rows (rows(Model, id=...)), a collection only
+# answers 304 to If-None-Match.
+
+# The tables with an updated_at column and the creation time their existing rows are backfilled with (options don't
+# keep theirs, they get the one of their question)
+TRACKED_TABLES = {
+    "users": "created_at",
+    "programs": "created_at",
+    "courses": "created_at",
+    "quizzes": "created_at",
+    "assignments": "created_at",
+    "questions": "created_at",
+    "question_options": "(SELECT created_at FROM questions WHERE questions.id = question_options.question_id)",
+    "student_answers": "submitted_at",
+}
+
+
+class rows:
+    """This class describes the rows of a model a response is built from, the ones whose columns equal the given view
+    arguments, e.g. rows(Quiz, course_id="course_id")"""
+
+    def __init__(self, model, **columns: str):
+        self.model = model
+        self.columns = columns
+        self.single_row = list(columns) == ["id"]
+
+    def state(self, view_args) -> tuple:
+        """This function returns the number of rows and their latest updated_at"""
+        if not self.columns:
+            # Read separately, SQLite then takes the latest updated_at from the end of its index instead of a scan
+            return (db.session.execute(select(func.count()).select_from(self.model)).scalar(),
+                    db.session.execute(select(func.max(self.model.updated_at))).scalar())
+
+        query = select(func.count(), func.max(self.model.updated_at))
+        for name, argument in self.columns.items():
+            query = query.where(getattr(self.model, name) == view_args[argument])
+        return tuple(db.session.execute(query).one())
+
+
+def conditional(*sources):
+    """This function returns a decorator adding an ETag and a Last-Modified header to the 200 responses of a GET view
+    and answering 304 Not Modified when the client already has the current version"""
+    sources = [source if isinstance(source, rows) else rows(source) for source in sources]
+    single_row = all(source.single_row for source in sources)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            states = [source.state(kwargs) for source in sources]
+            etag = hashlib.sha1(repr((request.full_path, states)).encode()).hexdigest()[:20]
+            # Last-Modified has a one second resolution, it is left out while a second change could still land in the
+            # same second and leave it unchanged
+            timestamps = [updated_at for _, updated_at in states if updated_at is not None]
+            last_modified = None
+            if timestamps and utc_now() - max(timestamps) >= timedelta(seconds=1):
+                last_modified = max(timestamps).replace(microsecond=0)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = (single_row and last_modified is not None and request.if_modified_since is not None
+                                and last_modified <= request.if_modified_since.replace(tzinfo=None))
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
+
+
+def create_updated_at_columns(conn):
+    """This function adds the updated_at columns and their indexes, backfilled with the creation time of the rows, and
+    recreates the counter triggers so that they touch the rows they count for, run by migration 7"""
+    from counters import COUNTERS, SQL_NOW  # counters.py imports migrations.py as well
+
+    for table, created in TRACKED_TABLES.items():
+        add_column(conn, table, "updated_at", "DATETIME")
+        conn.exec_driver_sql(f"UPDATE {table} SET updated_at = coalesce({created}, {SQL_NOW}) WHERE updated_at IS NULL")
+        create_index(conn, f"ix_{table}_updated_at", table, ["updated_at"])
+
+    for counter in COUNTERS:
+        counter.drop_triggers(conn)
+        counter.create_triggers(conn)
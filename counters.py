@@ -0,0 +1,121 @@
+import argparse
+
+from data_models import db
+from migrations import add_column
+
+# The updated_at written by the triggers, in the format SQLAlchemy stores the datetimes of the ORM ('.ffffff')
+SQL_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+# Denormalized counter columns: the number of children of a row stored on the row itself, so the stats and list
+# endpoints read a column instead of counting (or loading) the children on every request:
+#
+#   programs.course_count                          courses of the program
+#   courses.teacher_count, student_count           rows of teacher_course and student_course
+#   courses.quiz_count, assignment_count           quizzes and assignments of the course
+#   quizzes.question_count                         questions of the quiz
+#   questions.option_count, answer_count           options and student answers of the question
+#
+# SQLite triggers on the child tables keep them current on every insert, delete and change of the foreign key,
+# whichever code path writes the rows (ORM, the Core bulk inserts of quiz_persistence.py or plain SQL). An ORM object
+# loaded before a child was added sees the new count once it is expired, which every commit does. A changed count also
+# moves the updated_at of the row, the conditional GETs of conditional.py see it as a change of the row.
+#
+# reconcile() recomputes every counter from the child tables and repairs the rows which drifted (rows written while
+# the triggers didn't exist, edits made with the triggers dropped...). It runs in migration 6, which adds the columns,
+# and can be run on its own as a job: python counters.py [--check]
+
+
+class Counter:
+    """This class describes a counter column: the parent table and column, and the child table and its foreign key to
+    the parent"""
+
+    def __init__(self, table: str, column: str, child_table: str, foreign_key: str):
+        self.table = table
+        self.column = column
+        self.child_table = child_table
+        self.foreign_key = foreign_key
+
+    @property
+    def trigger_prefix(self) -> str:
+        return f"{self.child_table}_{self.column}"
+
+    def _adjust(self, row: str, delta: str) -> str:
+        return (f"UPDATE {self.table} SET {self.column} = {self.column} {delta} 1, updated_at = {SQL_NOW} "
+                f"WHERE id = {row}.{self.foreign_key};")
+
+    def create_triggers(self, conn):
+        """This function creates the insert, delete and update triggers of the counter on the child table"""
+        prefix = self.trigger_prefix
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {prefix}_ai AFTER INSERT ON {self.child_table} "
+                             f"BEGIN {self._adjust('new', '+')} END")
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {prefix}_ad AFTER DELETE ON {self.child_table} "
+                             f"BEGIN {self._adjust('old', '-')} END")
+        # Moving a child to another parent, e.g. a question moved to another quiz
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_au AFTER UPDATE OF {self.foreign_key} ON {self.child_table} "
+            f"WHEN old.{self.foreign_key} IS NOT new.{self.foreign_key} "
+            f"BEGIN {self._adjust('old', '-')} {self._adjust('new', '+')} END"
+        )
+
+    def drop_triggers(self, conn):
+        """This function drops the triggers of the counter, to recreate them after a change of their statements"""
+        for suffix in ("ai", "ad", "au"):
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {self.trigger_prefix}_{suffix}")
+
+    def reconcile(self, conn, check_only: bool = False) -> int:
+        """This function sets the counter of every row whose value differs from the actual count and returns the
+        number of rows which had drifted (only counts them when check_only)"""
+        actual = (f"(SELECT count(*) FROM {self.child_table} "
+                  f"WHERE {self.child_table}.{self.foreign_key} = {self.table}.id)")
+        if check_only:
+            return conn.exec_driver_sql(
+                f"SELECT count(*) FROM {self.table} WHERE {self.column} IS NOT {actual}").scalar()
+        return conn.exec_driver_sql(
+            f"UPDATE {self.table} SET {self.column} = {actual} WHERE {self.column} IS NOT {actual}").rowcount
+
+
+COUNTERS = [
+    Counter("programs", "course_count", "courses", "program_id"),
+    Counter("courses", "teacher_count", "teacher_course", "course_id"),
+    Counter("courses", "student_count", "student_course", "course_id"),
+    Counter("courses", "quiz_count", "quizzes", "course_id"),
+    Counter("courses", "assignment_count", "assignments", "course_id"),
+    Counter("quizzes", "question_count", "questions", "quiz_id"),
+    Counter("questions", "option_count", "question_options", "question_id"),
+    Counter("questions", "answer_count", "student_answers", "question_id"),
+]
+
+
+def reconcile(conn, check_only: bool = False) -> dict:
+    """This function reconciles every counter and returns the number of drifted rows per counter"""
+    return {f"{counter.table}.{counter.column}": counter.reconcile(conn, check_only) for counter in COUNTERS}
+
+
+def create_counter_columns(conn):
+    """This function adds the counter columns and their triggers and computes their values, run by migration 6"""
+    for counter in COUNTERS:
+        add_column(conn, counter.table, counter.column, "INTEGER NOT NULL DEFAULT 0")
+        counter.create_triggers(conn)
+    reconcile(conn)
+
+
+# Running the reconciliation as a job: python counters.py [--check], it also trims the dashboard's activity feed
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repair the denormalized counter columns and dashboard counters, trim the activity feed")
+    parser.add_argument("--check", action="store_true", help="only report the drifted rows, don't repair them")
+    args = parser.parse_args()
+
+    from app import create_app
+    from dashboard import reconcile_counters, trim_feed
+
+    app = create_app()
+    with app.app_context():
+        with db.engine.begin() as connection:
+            drift = reconcile(connection, check_only=args.check)
+            if not args.check:
+                drift.update({f"dashboard.{name}": values for name, values in reconcile_counters(connection).items()})
+                drift["dashboard.feed_trimmed"] = trim_feed(connection)
+
+    for name, rows in drift.items():
+        print(f"{name:<28} {rows or 'ok'}")
+    print("Counters checked" if args.check else "Counters reconciled")
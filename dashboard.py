@@ -0,0 +1,155 @@
+from sqlalchemy import text
+
+from data_models import db, ActivityEvent, DashboardCounter
+
+# Dashboard data of the home page, maintained by the database itself. SQLite triggers on the courses, quizzes and
+# users tables append an event to activity_events and adjust the dashboard_counters on every insert or delete,
+# whichever code path writes the row (ORM routes, the bulk inserts of quiz_persistence.py, the question import or plain
+# SQL). The home page then reads the counters and the latest events by primary key instead of counting the tables and
+# merging the latest rows of each of them.
+#
+# The submissions are the exception: an exam inserts an answer row per question and student, so instead of a trigger
+# on student_answers the code submitting them records one event per submission (a single answer or a whole attempt)
+# or, in the write-behind writer, per batch applied, with record_submission().
+#
+# The triggers are created by migration 5 (migrations.py), which also computes the counters and fills the feed with
+# the rows which existed before, migration 14 drops the per-answer and retention triggers it used to create.
+# reconcile_counters() recomputes the counters from the tables if they ever drift and trim_feed() drops the events
+# past FEED_RETENTION, both run by the reconciliation job: python counters.py
+
+# Number of events kept by trim_feed()
+FEED_RETENTION = 1000
+
+# Label and badge shown on the dashboard for every kind of event
+EVENT_STYLES = {
+    "quiz": ("AI", "bg-info text-dark"),
+    "course": ("System", "bg-secondary"),
+    "user": ("User", "bg-success"),
+    "submission": ("User", "bg-success"),
+}
+
+# How every counter is computed from scratch
+COUNTERS = {
+    "courses": "SELECT count(*) FROM courses",
+    "students": "SELECT count(*) FROM users WHERE role = 'student'",
+    "quizzes": "SELECT count(*) FROM quizzes",
+}
+
+# SQL of the title of the event of a new row, over new
+_EVENT_TITLES = {
+    "course": "'Course Created: ' || new.name",
+    "quiz": "'New Quiz Generated: ' || new.title",
+    "user": "'New ' || upper(substr(new.role, 1, 1)) || substr(new.role, 2) || ': ' || new.name",
+    "submission": "'New Submission for ' || coalesce((SELECT quizzes.title FROM questions JOIN quizzes "
+                  "ON quizzes.id = questions.quiz_id WHERE questions.id = new.question_id), 'Assignment')",
+}
+
+_TRIGGERS = {
+    "courses_dashboard_ai": "AFTER INSERT ON courses BEGIN {event} "
+                            "UPDATE dashboard_counters SET value = value + 1 WHERE name = 'courses'; END",
+    "courses_dashboard_ad": "AFTER DELETE ON courses BEGIN "
+                            "UPDATE dashboard_counters SET value = value - 1 WHERE name = 'courses'; END",
+    "quizzes_dashboard_ai": "AFTER INSERT ON quizzes BEGIN {event} "
+                            "UPDATE dashboard_counters SET value = value + 1 WHERE name = 'quizzes'; END",
+    "quizzes_dashboard_ad": "AFTER DELETE ON quizzes BEGIN "
+                            "UPDATE dashboard_counters SET value = value - 1 WHERE name = 'quizzes'; END",
+    "users_dashboard_ai": "AFTER INSERT ON users BEGIN {event} UPDATE dashboard_counters "
+                          "SET value = value + (new.role = 'student') WHERE name = 'students'; END",
+    "users_dashboard_ad": "AFTER DELETE ON users BEGIN UPDATE dashboard_counters "
+                          "SET value = value - (old.role = 'student') WHERE name = 'students'; END",
+    "users_dashboard_au": "AFTER UPDATE OF role ON users BEGIN UPDATE dashboard_counters "
+                          "SET value = value + (new.role = 'student') - (old.role = 'student') "
+                          "WHERE name = 'students'; END",
+}
+
+# Triggers created by earlier versions of migration 5 and dropped by migration 14
+_DROPPED_TRIGGERS = ("student_answers_dashboard_ai", "activity_events_retention")
+
+# The table, the kind of its events and the timestamp of its rows
+_EVENT_SOURCES = {
+    "courses": ("course", "created_at"),
+    "quizzes": ("quiz", "created_at"),
+    "users": ("user", "created_at"),
+    "student_answers": ("submission", "submitted_at"),
+}
+
+
+def _event_insert(kind: str, timestamp: str) -> str:
+    return (f"INSERT INTO activity_events (kind, title, entity_id, created_at) "
+            f"VALUES ('{kind}', {_EVENT_TITLES[kind]}, new.id, coalesce(new.{timestamp}, CURRENT_TIMESTAMP));")
+
+
+def reconcile_counters(conn) -> dict:
+    """This function recomputes every dashboard counter from its table and returns the counters which had drifted, as
+    {name: (stored value, actual value)}"""
+    drift = {}
+    for name, count_sql in COUNTERS.items():
+        actual = conn.exec_driver_sql(count_sql).scalar()
+        stored = conn.exec_driver_sql("SELECT value FROM dashboard_counters WHERE name = ?", (name,)).scalar()
+        if stored != actual:
+            drift[name] = (stored, actual)
+            conn.exec_driver_sql("INSERT OR REPLACE INTO dashboard_counters (name, value) VALUES (?, ?)", (name, actual))
+    return drift
+
+
+def trim_feed(conn) -> int:
+    """This function drops the events older than the latest FEED_RETENTION ones, a range delete on the primary key, and
+    returns the number of events dropped"""
+    return conn.exec_driver_sql(
+        f"DELETE FROM activity_events WHERE id <= (SELECT max(id) FROM activity_events) - {FEED_RETENTION}").rowcount
+
+
+def record_submission(answer_id: int):
+    """This function appends the event of a submission, given by the id of one of its answers, to the feed in the
+    current transaction. The caller commits"""
+    kind, timestamp = _EVENT_SOURCES["student_answers"]
+    db.session.execute(text(
+        f"INSERT INTO activity_events (kind, title, entity_id, created_at) "
+        f"SELECT '{kind}', {_EVENT_TITLES[kind].replace('new.', 'student_answers.')}, student_answers.id, "
+        f"coalesce(student_answers.{timestamp}, CURRENT_TIMESTAMP) FROM student_answers "
+        f"WHERE student_answers.id = :answer_id"
+    ), {"answer_id": answer_id})
+
+
+def _backfill_feed(conn):
+    # The latest rows of every table, oldest first so the ids of the events follow the time
+    selects = []
+    for table, (kind, timestamp) in _EVENT_SOURCES.items():
+        title = _EVENT_TITLES[kind].replace("new.", f"{table}.")
+        selects.append(f"SELECT * FROM (SELECT '{kind}' AS kind, {title} AS title, {table}.id AS entity_id, "
+                       f"{table}.{timestamp} AS created_at FROM {table} "
+                       f"ORDER BY {table}.{timestamp} DESC LIMIT {FEED_RETENTION})")
+    conn.exec_driver_sql(
+        f"INSERT INTO activity_events (kind, title, entity_id, created_at) SELECT * FROM "
+        f"(SELECT * FROM ({' UNION ALL '.join(selects)}) ORDER BY created_at DESC, entity_id DESC "
+        f"LIMIT {FEED_RETENTION}) ORDER BY created_at, entity_id"
+    )
+
+
+def create_dashboard_triggers(conn):
+    """This function creates the activity feed and counter triggers, computes the counters and fills an empty feed
+    with the latest existing rows, run by migration 5"""
+    db.metadata.create_all(conn, tables=[ActivityEvent.__table__, DashboardCounter.__table__], checkfirst=True)
+
+    if conn.exec_driver_sql("SELECT count(*) FROM activity_events").scalar() == 0:
+        _backfill_feed(conn)
+    reconcile_counters(conn)
+
+    events = {table: _event_insert(kind, timestamp) for table, (kind, timestamp) in _EVENT_SOURCES.items()}
+    for name, body in _TRIGGERS.items():
+        table = name.split("_dashboard_")[0]
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body.format(event=events.get(table, ''))}")
+
+
+def drop_submission_triggers(conn):
+    """This function drops the per-answer feed trigger and the per-insert retention trigger, run by migration 14"""
+    for name in _DROPPED_TRIGGERS:
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+    trim_feed(conn)
+
+
+def dashboard_snapshot(limit: int = 5):
+    """This function returns the dashboard counters as a dict and the latest `limit` activity events, newest first"""
+    counters = dict(db.session.query(DashboardCounter.name, DashboardCounter.value).all())
+    events = ActivityEvent.query.order_by(ActivityEvent.id.desc()).limit(limit).all()
+    return counters, events
@@ -1,9 +1,16 @@
 import enum
+from datetime import datetime, timezone
+
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import text
+from sqlalchemy import event, inspect, text
 
 db = SQLAlchemy()
 
+
+def utc_now():
+    """This function returns the current UTC time without a timezone, like the CURRENT_TIMESTAMP server defaults"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 # Class Model UserRole defined to set the roles allowed for users using the enum class
 class UserRole(enum.Enum):
     """This class defines the user roles allowed using the enum method from Enum class to ensure database integrity,avoid
@@ -22,6 +29,15 @@ class User(db.Model):
     email = db.Column(db.String(100), unique=True, nullable=False)
     role = db.Column(db.Enum(UserRole), nullable=False)
     created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    # Time of the last change of the row, kept current by the ORM events at the end of this module
+    updated_at = db.Column(db.DateTime, default=utc_now)
+
+    # Indexes for the role filter and the most recent users on the dashboard, created by the migrations in migrations.py
+    __table_args__ = (
+        db.Index("ix_users_role", "role"),
+        db.Index("ix_users_created_at", "created_at"),
+        db.Index("ix_users_updated_at", "updated_at"),
+    )
 
 
     # Adding the relationship to User class, all tables will be created by the User instance
@@ -56,6 +72,15 @@ class Program(db.Model):
     description = db.Column(db.Text)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    # Denormalized count kept current by database triggers, see counters.py
+    course_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    # Time of the last change of the row, kept current by the ORM events at the end of this module and the counter
+    # triggers
+    updated_at = db.Column(db.DateTime, default=utc_now)
+
+    __table_args__ = (
+        db.Index("ix_programs_updated_at", "updated_at"),
+    )
 
     # # Adding the relationship to Program class, all tables will be created by the User instance
     created_by_user = db.relationship("User", back_populates="programs_created")
@@ -84,6 +109,20 @@ class Course(db.Model):
     program_id = db.Column(db.Integer, db.ForeignKey('programs.id'))
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    # Denormalized counts kept current by database triggers, see counters.py
+    teacher_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    student_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    quiz_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    assignment_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    # Time of the last change of the row (enrolments included), kept current by the ORM events at the end of this
+    # module and the counter triggers
+    updated_at = db.Column(db.DateTime, default=utc_now)
+
+    __table_args__ = (
+        db.Index("ix_courses_program_id", "program_id"),
+        db.Index("ix_courses_created_at", "created_at"),
+        db.Index("ix_courses_updated_at", "updated_at"),
+    )
 
     # Defining relationships to the program and user classes
     program = db.relationship("Program", back_populates="courses")
@@ -109,7 +148,8 @@ teacher_course = db.Table(
     'teacher_course',
     db.Column('teacher_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('course_id', db.Integer, db.ForeignKey('courses.id'), primary_key=True),
-    db.Column('assigned_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    db.Column('assigned_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP')),
+    db.Index('ix_teacher_course_course_id', 'course_id') # the primary key only covers lookups by its first column
 )
 
 # Association Table student_course created to handle the many-to_many relationships between students, and the courses they take
@@ -117,7 +157,8 @@ student_course = db.Table(
     'student_course',
     db.Column('student_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('course_id', db.Integer, db.ForeignKey('courses.id'), primary_key=True),
-    db.Column('enrolled_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    db.Column('enrolled_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP')),
+    db.Index('ix_student_course_course_id', 'course_id')
 )
 
 # Association Table teacher_program created to handle the many-to-many relationships between teachers and programs
@@ -125,7 +166,8 @@ teacher_program = db.Table(
     'teacher_program',
     db.Column('teacher_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('program_id', db.Integer, db.ForeignKey('programs.id'), primary_key=True),
-    db.Column('assigned_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    db.Column('assigned_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP')),
+    db.Index('ix_teacher_program_program_id', 'program_id')
 )
 
 # Association Table student_program created to handle the many-to-many relationships between students and programs
@@ -133,7 +175,8 @@ student_program = db.Table(
     'student_program',
     db.Column('student_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
     db.Column('program_id', db.Integer, db.ForeignKey('programs.id'), primary_key=True),
-    db.Column('enrolled_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    db.Column('enrolled_at', db.DateTime, server_default=text('CURRENT_TIMESTAMP')),
+    db.Index('ix_student_program_program_id', 'program_id')
 )
 
 # Class model Quiz created and defined
@@ -148,6 +191,20 @@ class Quiz(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'))
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    # Denormalized count kept current by database triggers, see counters.py
+    question_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    # Bumped by database triggers on every change of the quiz, its questions or their options, see quiz_delivery.py
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    # Time of the last change of the row, kept current by the ORM events at the end of this module and the counter
+    # triggers
+    updated_at = db.Column(db.DateTime, default=utc_now)
+
+    __table_args__ = (
+        db.Index("ix_quizzes_course_id", "course_id"),
+        db.Index("ix_quizzes_created_by", "created_by"),
+        db.Index("ix_quizzes_created_at", "created_at"),
+        db.Index("ix_quizzes_updated_at", "updated_at"),
+    )
 
     # Relationships defined based on courses and teachers
     course = db.relationship("Course", back_populates="quizzes")
@@ -177,6 +234,14 @@ class Assignment(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'))
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    # Time of the last change of the row, kept current by the ORM events at the end of this module
+    updated_at = db.Column(db.DateTime, default=utc_now)
+
+    __table_args__ = (
+        db.Index("ix_assignments_course_id", "course_id"),
+        db.Index("ix_assignments_created_by", "created_by"),
+        db.Index("ix_assignments_updated_at", "updated_at"),
+    )
 
     # Relationships defined based on courses and teachers
     course = db.relationship("Course", back_populates="assignments")
@@ -207,6 +272,20 @@ class Question(db.Model):
     question_text = db.Column(db.Text, nullable=False) # db.Text used as it can be a large descriptive value
     question_type = db.Column(db.String(10))
     marks = db.Column(db.Integer)
+    reference_answer = db.Column(db.Text) # model answer of a descriptive question, the rubric of the AI grading
+    # Denormalized counts kept current by database triggers, see counters.py
+    option_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    answer_count = db.Column(db.Integer, nullable=False, default=0, server_default=text('0'))
+    # Time of the last change of the row, kept current by the ORM events at the end of this module and the counter
+    # triggers
+    updated_at = db.Column(db.DateTime, default=utc_now)
+
+    __table_args__ = (
+        db.Index("ix_questions_quiz_id", "quiz_id"),
+        db.Index("ix_questions_assignment_id", "assignment_id"),
+        db.Index("ix_questions_created_by", "created_by"),
+        db.Index("ix_questions_updated_at", "updated_at"),
+    )
 
     # Defining the relationships between users, quizzes, assignments with questions, answers and the options that can be answered
     created_by_user = db.relationship("User", back_populates="questions_created")
@@ -233,6 +312,13 @@ class QuestionOption(db.Model):
     option_text = db.Column(db.Text, nullable=False) # the text for the option
     is_correct = db.Column(db.Boolean, default=False) # whether correct option or not
     order_index = db.Column(db.Integer, default=0) # number of the option
+    updated_at = db.Column(db.DateTime, default=utc_now) # last change, kept current by the ORM events below
+
+    # The options of a question are always read together and in order
+    __table_args__ = (
+        db.Index("ix_question_options_question_id_order", "question_id", "order_index"),
+        db.Index("ix_question_options_updated_at", "updated_at"),
+    )
 
     question = db.relationship("Question", back_populates="options") # relationship defined for the Question Class
     student_answers = db.relationship("StudentAnswer", back_populates="selected_option")
@@ -255,13 +341,131 @@ class StudentAnswer(db.Model):
     marks_awarded = db.Column(db.Integer)
     evaluated_by_ai = db.Column(db.Boolean, default=False)
     evaluated_by_teacher = db.Column(db.Boolean, default=False)
+    graded_locally = db.Column(db.Boolean, default=False) # given 0 by the pre-grader (pre_grading.py), for review
 
     feedback = db.Column(db.Text)
     submitted_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
     attempt_number = db.Column(db.Integer, default=1)
+    updated_at = db.Column(db.DateTime, default=utc_now) # last change (grading...), kept current by the ORM events below
+
+    # Answers are looked up by student (and question/attempt within that), by question, by quiz and by recency
+    __table_args__ = (
+        db.Index("ix_student_answers_student_question", "student_id", "question_id", "attempt_number"),
+        db.Index("ix_student_answers_question_id", "question_id"),
+        db.Index("ix_student_answers_quiz_student", "quiz_id", "student_id"),
+        db.Index("ix_student_answers_assignment_id", "assignment_id"),
+        db.Index("ix_student_answers_submitted_at", "submitted_at"),
+        db.Index("ix_student_answers_updated_at", "updated_at"),
+    )
 
     # Relationships defined
     question = db.relationship("Question", back_populates="student_answers")
     student = db.relationship("User", back_populates="answers") # answers is an attribute on the User model
     selected_option = db.relationship("QuestionOption", back_populates="student_answers")
 
+
+
+# LLMCall Class defined to keep a compact numeric record of every AI quiz generation request for capacity planning
+class LLMCall(db.Model):
+    __tablename__ = 'llm_calls'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    request_id = db.Column(db.String(64), nullable=False, index=True) # ties the row to the HTTP request that made it
+    kind = db.Column(db.String(20), nullable=False) # 'quiz' (standard LLM), 'quiz_rag', 'quiz_rag_pdf' or 'grading'
+    model_name = db.Column(db.String(50), nullable=False)
+
+    input_tokens = db.Column(db.Integer, default=0)
+    output_tokens = db.Column(db.Integer, default=0)
+    total_tokens = db.Column(db.Integer, default=0)
+    cached_tokens = db.Column(db.Integer, default=0) # prompt tokens served from OpenAI's prompt cache
+    cost_usd = db.Column(db.Float, default=0.0)
+
+    latency_ms = db.Column(db.Float) # time spent in the LLM call(s) only
+    total_latency_ms = db.Column(db.Float) # time spent in the whole request
+    cache_hit = db.Column(db.Boolean, default=False) # whether the RAG components were reused from the cache
+    created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'), index=True)
+
+    stages = db.relationship("LLMCallStage", back_populates="call", cascade="all, delete-orphan")
+
+
+# LLMCallStage Class defined to store the duration of every stage of a generation request, one row per stage
+class LLMCallStage(db.Model):
+    __tablename__ = 'llm_call_stages'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    call_id = db.Column(db.Integer, db.ForeignKey('llm_calls.id'), nullable=False, index=True)
+    stage = db.Column(db.String(30), nullable=False)
+    duration_ms = db.Column(db.Float, nullable=False)
+
+    call = db.relationship("LLMCall", back_populates="stages")
+
+
+# ActivityEvent Class defined to store the activity feed of the dashboard, appended by database triggers on every new
+# course, quiz and user and by the code submitting the answers for every submission (see dashboard.py) so the home page
+# reads the latest events instead of merging the latest rows of every table
+class ActivityEvent(db.Model):
+    __tablename__ = 'activity_events'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    kind = db.Column(db.String(20), nullable=False) # 'course', 'quiz', 'user' or 'submission'
+    title = db.Column(db.String(300), nullable=False)
+    entity_id = db.Column(db.Integer) # id of the course, quiz, user or (first) answer the event is about
+    created_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+
+
+# DashboardCounter Class defined to keep the totals shown on the dashboard, one row per counter kept current by
+# database triggers (see dashboard.py)
+class DashboardCounter(db.Model):
+    __tablename__ = 'dashboard_counters'
+
+    name = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Submission Class defined to record the submissions applied by the write-behind writer (see write_behind.py), one row per
+# submission_id so that a submission retried by the client or replayed from the log is only applied once
+class Submission(db.Model):
+    __tablename__ = 'submissions'
+
+    submission_id = db.Column(db.String(64), primary_key=True)
+    seq = db.Column(db.Integer, nullable=False, index=True) # position of the submission in the log
+    kind = db.Column(db.String(10), nullable=False) # 'answer' or 'attempt'
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    status = db.Column(db.String(10), nullable=False) # 'applied' or 'failed'
+    attempt_number = db.Column(db.Integer)
+    answer_ids = db.Column(db.Text) # JSON list of the ids of the answers inserted
+    error = db.Column(db.Text) # why a failed submission couldn't be applied
+    applied_at = db.Column(db.DateTime, server_default=text('CURRENT_TIMESTAMP'))
+
+
+# AnswerSignature Class defined to keep the MinHash signature of every descriptive answer for the near-duplicate
+# detection (see similarity.py), one row per answer stored with the rows of its question so a question's signatures are
+# read together. It is filled as the answers are checked and its rows are removed by triggers when the answer text
+# changes or the answer is deleted
+class AnswerSignature(db.Model):
+    __tablename__ = 'answer_signatures'
+
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), primary_key=True)
+    answer_id = db.Column(db.Integer, db.ForeignKey('student_answers.id'), primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    signature = db.Column(db.LargeBinary) # the minimum hashes as uint32, NULL for an answer too short to compare
+
+    __table_args__ = {"sqlite_with_rowid": False}
+
+
+# QuizGeneration Class defined to keep the generation of the quiz delivery payloads (see quiz_delivery.py), a single row
+# bumped by a database trigger whenever a quiz is deleted, as a new quiz can be given the id of a deleted one
+class QuizGeneration(db.Model):
+    __tablename__ = 'quiz_generations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Keeping updated_at current on every change made through the ORM. before_update is also called for objects whose
+# only change is a many-to-many collection, so enrolling a student touches the program or course enrolled in. Objects
+# flushed without any net change keep their timestamp. The conditional GETs of conditional.py are built on it
+@event.listens_for(db.Model, "before_update", propagate=True)
+def _touch_updated_at(mapper, connection, target):
+    if "updated_at" in mapper.columns and inspect(target).session.is_modified(target):
+        target.updated_at = utc_now()
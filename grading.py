@@ -0,0 +1,88 @@
+from typing import Optional
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import and_, case, func, or_, select, update
+
+from data_models import db, Question, QuestionOption, StudentAnswer, utc_now
+
+# Auto-grading of the MCQ answers. Instead of loading the answers and grading them one by one in Python, every ungraded
+# answer of a quiz (or of all the quizzes and assignments) is graded by one set-based UPDATE ... FROM joining the
+# answer with its question and its selected option:
+#
+#   UPDATE student_answers SET marks_awarded = CASE WHEN question_options.is_correct
+#                                                       AND question_options.question_id = student_answers.question_id
+#                                                  THEN coalesce(questions.marks, 0) ELSE 0 END
+#   FROM questions, question_options
+#   WHERE questions.id = student_answers.question_id AND question_options.id = student_answers.selected_option_id
+#     AND questions.question_type = 'multiple_choice' AND student_answers.marks_awarded IS NULL ...
+#
+# An option of another question scores 0, even its correct one. A question without marks (they are optional) gives 0
+# too, a NULL would leave the answer ungraded and graded again on every run. An MCQ answer without a selected option
+# (a skipped question of an attempt) or whose option doesn't exist any more is given 0 by a second UPDATE. The
+# answers graded by a teacher (evaluated_by_teacher) are never changed, with regrade the other MCQ answers are graded
+# again, e.g. after the correct option of a question was fixed.
+#
+# Nothing is committed here, the caller owns the transaction like in attempts.py. It is run by
+# POST /student_answers/grading/mcq and by the CLI: flask --app app grade-mcq [--quiz-id 3] [--regrade]
+
+MCQ = "multiple_choice"
+
+
+def _answers_to_grade(quiz_id: Optional[int], regrade: bool) -> list:
+    """This function returns the conditions selecting the answers to grade"""
+    conditions = [StudentAnswer.evaluated_by_teacher.isnot(True)]
+    if not regrade:
+        conditions.append(StudentAnswer.marks_awarded.is_(None))
+    if quiz_id is not None:
+        conditions.append(StudentAnswer.quiz_id == quiz_id)
+    return conditions
+
+
+def grade_mcq_answers(quiz_id: Optional[int] = None, regrade: bool = False) -> int:
+    """This function grades the ungraded MCQ answers of a quiz (of every quiz and assignment if quiz_id is None) with
+    two UPDATE statements and returns the number of answers graded"""
+    now = utc_now()
+    conditions = _answers_to_grade(quiz_id, regrade)
+
+    # The answers with a selected option: full marks of the question (0 without marks) for a correct option of that
+    # question, 0 otherwise
+    correct = and_(QuestionOption.is_correct.is_(True), QuestionOption.question_id == StudentAnswer.question_id)
+    selected = db.session.execute(
+        update(StudentAnswer)
+        .values(marks_awarded=case((correct, func.coalesce(Question.marks, 0)), else_=0), updated_at=now)
+        .where(Question.id == StudentAnswer.question_id, QuestionOption.id == StudentAnswer.selected_option_id,
+               Question.question_type == MCQ, *conditions)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # The skipped MCQ questions and the options which don't exist
+    existing_option = select(QuestionOption.id).where(QuestionOption.id == StudentAnswer.selected_option_id).exists()
+    skipped = db.session.execute(
+        update(StudentAnswer)
+        .values(marks_awarded=0, updated_at=now)
+        .where(or_(StudentAnswer.selected_option_id.is_(None), ~existing_option),
+               StudentAnswer.question_id.in_(select(Question.id).where(Question.question_type == MCQ)), *conditions)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    return selected + skipped
+
+
+def ungraded_mcq_count(quiz_id: Optional[int] = None) -> int:
+    """This function returns the number of MCQ answers still waiting for a grade"""
+    query = (select(db.func.count()).select_from(StudentAnswer)
+             .join(Question, Question.id == StudentAnswer.question_id)
+             .where(Question.question_type == MCQ, *_answers_to_grade(quiz_id, False)))
+    return db.session.execute(query).scalar()
+
+
+@click.command("grade-mcq")
+@click.option("--quiz-id", type=int, default=None, help="Only grade the answers of this quiz.")
+@click.option("--regrade", is_flag=True, help="Grade again the MCQ answers already graded (not by a teacher).")
+@with_appcontext
+def grade_mcq_command(quiz_id, regrade):
+    """Grades the ungraded MCQ answers with one set-based UPDATE."""
+    graded = grade_mcq_answers(quiz_id, regrade)
+    db.session.commit()
+    click.echo(f"Graded {graded} MCQ answers{f' of quiz {quiz_id}' if quiz_id is not None else ''}.")
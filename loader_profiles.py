@@ -0,0 +1,37 @@
+from sqlalchemy.orm import selectinload
+
+from data_models import Course, Program, User
+
+# Loader profiles, one per list endpoint: the relationships the endpoint serializes for every row, loaded up front so
+# the endpoint runs a constant number of queries however many rows it returns. A collection gets selectinload (one
+# extra SELECT ... WHERE id IN (...) for all the rows), a many-to-one gets joinedload (a LEFT OUTER JOIN in the main
+# query). When an endpoint starts serializing another relationship, add it to its profile here.
+#
+# benchmarks/check_query_counts.py checks that the endpoints stay constant as the data grows.
+
+LOADER_PROFILES = {
+    "courses.list": (selectinload(Course.teachers), selectinload(Course.students)),
+    "programs.list": (selectinload(Program.teachers), selectinload(Program.students)),
+    "users.list": (selectinload(User.enrolled_programs), selectinload(User.teaching_programs)),
+    "users.search": (
+        selectinload(User.enrolled_courses),
+        selectinload(User.teaching_courses),
+        selectinload(User.enrolled_programs),
+        selectinload(User.teaching_programs),
+    ),
+
+    # UI pages rendering the same relationships from their templates
+    "ui.courses": (selectinload(Course.teachers),),
+    "ui.users": (
+        selectinload(User.enrolled_courses),
+        selectinload(User.teaching_courses),
+        selectinload(User.enrolled_programs),
+        selectinload(User.teaching_programs),
+    ),
+    "ui.programs": (selectinload(Program.courses),),
+}
+
+
+def with_profile(query, profile: str):
+    """This function applies the loader options of a profile to a query, e.g. with_profile(Course.query, 'courses.list')"""
+    return query.options(*LOADER_PROFILES[profile])
@@ -0,0 +1,171 @@
+import argparse
+
+from sqlalchemy import text
+
+from data_models import db
+from search_index import create_search_indexes, create_document_index
+from dashboard import create_dashboard_triggers, drop_submission_triggers
+from similarity import create_signature_triggers
+
+# Versioned schema migrations for the SQLite database. The schema version is kept in SQLite's own PRAGMA user_version
+# (0 for a database which has never been migrated) and every migration with a higher version number is applied in
+# order when the app starts, so an existing data/lms.db is upgraded in place.
+#
+# Every migration has to be idempotent: SQLite commits DDL as it goes, so a migration interrupted half way is simply
+# run again from the start next time. Use the helpers below (IF NOT EXISTS / column checks) rather than bare DDL.
+#
+# To add a migration append a (version, description, function) entry to MIGRATIONS with the next version number, the
+# function receives an open connection. Indexes and columns should also be declared on the models in data_models.py
+# so that a brand new database built by create_all ends up with the same schema.
+
+
+def table_exists(conn, table: str) -> bool:
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table}
+    ).first() is not None
+
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.exec_driver_sql(f"PRAGMA table_info({table})"))
+
+
+def add_column(conn, table: str, column: str, ddl: str):
+    """This function adds a column unless it is already there, ddl is its type and constraints e.g. 'INTEGER DEFAULT 0'"""
+    if not column_exists(conn, table, column):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def create_index(conn, name: str, table: str, columns: list, unique: bool = False):
+    conn.exec_driver_sql(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    )
+
+
+def _create_missing_tables(conn):
+    # Builds every table of the models which doesn't exist yet, existing tables are left untouched
+    db.metadata.create_all(conn, checkfirst=True)
+
+
+def _foreign_key_and_lookup_indexes(conn):
+    # Foreign keys and filters used by the routes, composite where the routes filter on several columns together
+    create_index(conn, "ix_users_role", "users", ["role"])
+    create_index(conn, "ix_users_created_at", "users", ["created_at"])
+    create_index(conn, "ix_courses_program_id", "courses", ["program_id"])
+    create_index(conn, "ix_courses_created_at", "courses", ["created_at"])
+    create_index(conn, "ix_teacher_course_course_id", "teacher_course", ["course_id"])
+    create_index(conn, "ix_student_course_course_id", "student_course", ["course_id"])
+    create_index(conn, "ix_teacher_program_program_id", "teacher_program", ["program_id"])
+    create_index(conn, "ix_student_program_program_id", "student_program", ["program_id"])
+    create_index(conn, "ix_quizzes_course_id", "quizzes", ["course_id"])
+    create_index(conn, "ix_quizzes_created_by", "quizzes", ["created_by"])
+    create_index(conn, "ix_quizzes_created_at", "quizzes", ["created_at"])
+    create_index(conn, "ix_assignments_course_id", "assignments", ["course_id"])
+    create_index(conn, "ix_assignments_created_by", "assignments", ["created_by"])
+    create_index(conn, "ix_questions_quiz_id", "questions", ["quiz_id"])
+    create_index(conn, "ix_questions_assignment_id", "questions", ["assignment_id"])
+    create_index(conn, "ix_questions_created_by", "questions", ["created_by"])
+    create_index(conn, "ix_question_options_question_id_order", "question_options", ["question_id", "order_index"])
+    create_index(conn, "ix_student_answers_student_question", "student_answers",
+                 ["student_id", "question_id", "attempt_number"])
+    create_index(conn, "ix_student_answers_question_id", "student_answers", ["question_id"])
+    create_index(conn, "ix_student_answers_quiz_student", "student_answers", ["quiz_id", "student_id"])
+    create_index(conn, "ix_student_answers_assignment_id", "student_answers", ["assignment_id"])
+    create_index(conn, "ix_student_answers_submitted_at", "student_answers", ["submitted_at"])
+    # Refreshing the planner statistics so the new indexes are picked up straight away
+    conn.exec_driver_sql("ANALYZE")
+
+
+def _denormalized_counters(conn):
+    # counters.py uses the helpers above, so it is imported here rather than at the top of the module
+    from counters import create_counter_columns
+    create_counter_columns(conn)
+
+
+def _updated_at_columns(conn):
+    # Same as above, conditional.py uses the helpers of this module
+    from conditional import create_updated_at_columns
+    create_updated_at_columns(conn)
+
+
+def _quiz_revisions(conn):
+    from quiz_delivery import create_revision_triggers
+    create_revision_triggers(conn)
+
+
+def _quiz_generations(conn):
+    from quiz_delivery import create_generation_trigger
+    create_generation_trigger(conn)
+
+
+def _reference_answers(conn):
+    add_column(conn, "questions", "reference_answer", "TEXT")
+
+
+def _graded_locally(conn):
+    add_column(conn, "student_answers", "graded_locally", "BOOLEAN DEFAULT 0")
+
+
+def _answer_signatures(conn):
+    _create_missing_tables(conn)
+    create_signature_triggers(conn)
+
+
+MIGRATIONS = [
+    (1, "create missing tables (baseline schema and LLM telemetry tables)", _create_missing_tables),
+    (2, "foreign key and lookup indexes", _foreign_key_and_lookup_indexes),
+    (3, "full-text search indexes and their sync triggers", create_search_indexes),
+    (4, "unified search documents index", create_document_index),
+    (5, "dashboard activity feed and counters", create_dashboard_triggers),
+    (6, "denormalized counter columns and their triggers", _denormalized_counters),
+    (7, "updated_at columns for the conditional GETs", _updated_at_columns),
+    (8, "quiz revisions for the cached delivery payloads", _quiz_revisions),
+    (9, "submissions table of the write-behind writer", _create_missing_tables),
+    (10, "reference answers of the descriptive questions", _reference_answers),
+    (11, "answer signatures of the near-duplicate detection and their triggers", _answer_signatures),
+    (12, "quiz generation of the cached delivery payloads", _quiz_generations),
+    (13, "answers graded locally by the pre-grader", _graded_locally),
+    (14, "one feed event per submission instead of per answer, feed retention moved to the reconciliation job",
+     drop_submission_triggers),
+]
+
+
+def current_version(conn) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar() or 0
+
+
+def upgrade(engine, target: int = None) -> list:
+    """This function applies every migration newer than the database's version (up to target) and returns the list of
+    versions applied"""
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+        print(f"Applied migration {number}: {description}")
+        applied.append(number)
+
+    return applied
+
+
+# Running the migrations without starting the app: python migrations.py [--status] [--target N]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade the database schema")
+    parser.add_argument("--status", action="store_true", help="only print the current and the latest version")
+    parser.add_argument("--target", type=int, help="stop at this version")
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app(migrate=False)
+    with app.app_context():
+        if args.status:
+            with db.engine.connect() as connection:
+                print(f"Database version {current_version(connection)}, latest {MIGRATIONS[-1][0]}")
+        else:
+            applied = upgrade(db.engine, args.target)
+            print("Database is up to date" if not applied else f"Upgraded to version {applied[-1]}")
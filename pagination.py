@@ -0,0 +1,150 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import request, Response, stream_with_context, url_for
+from sqlalchemy import String, literal, tuple_
+from sqlalchemy.engine import Row
+
+# Keyset (cursor) pagination for the collection endpoints. A page is read with
+#   WHERE (sort_column, id) > (last value, last id) ORDER BY sort_column, id LIMIT n
+# which walks the index from where the previous page stopped, so every page costs the same however far into the
+# table it is (OFFSET would scan and throw away all the previous rows).
+#
+# Query parameters understood by every paginated endpoint:
+#   limit   page size, DEFAULT_LIMIT by default and at most MAX_LIMIT
+#   cursor  the X-Next-Cursor header of the previous page, opaque to the client
+#   sort    id (default) or one of the endpoint's timestamp columns, prefixed with '-' for descending order
+#   stream  1 to get every matching row as a streamed NDJSON export (one JSON object per line) instead of a page
+#
+# A page keeps the JSON list body of the endpoint, the cursor of the next page comes in the X-Next-Cursor header (and a
+# Link rel="next" header) and is absent on the last page.
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_BATCH_SIZE = 500
+
+
+class PaginationError(ValueError):
+    """This class is raised for an invalid limit, sort or cursor parameter"""
+
+
+def _encode_cursor(sort: str, value, row_id: int) -> str:
+    payload = json.dumps([sort, value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, sort: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise PaginationError("Invalid cursor.")
+    if cursor_sort != sort:
+        raise PaginationError("The cursor belongs to a different sort order.")
+    return value, int(row_id)
+
+
+def _sort_value(value):
+    """This function turns a sort column value into the text stored by SQLite. The timestamps are written by the
+    CURRENT_TIMESTAMP server defaults ('YYYY-MM-DD HH:MM:SS'), comparing against that exact text keeps the index usable
+    and ties between rows created in the same second are broken by the id"""
+    if isinstance(value, datetime):
+        text = value.strftime("%Y-%m-%d %H:%M:%S")
+        return f"{text}.{value.microsecond:06d}" if value.microsecond else text
+    return value
+
+
+class PageRequest:
+    """This class holds the pagination parameters of the current request for a model and its sortable columns"""
+
+    def __init__(self, model, sortable: dict = None):
+        sortable = {"id": model.id, **(sortable or {})}
+
+        self.limit = request.args.get("limit", DEFAULT_LIMIT, type=int)
+        if not 1 <= self.limit <= MAX_LIMIT:
+            raise PaginationError(f"limit must be between 1 and {MAX_LIMIT}.")
+
+        self.sort = request.args.get("sort", "id")
+        self.descending = self.sort.startswith("-")
+        key = self.sort.lstrip("-")
+        if key not in sortable:
+            raise PaginationError(f"sort must be one of {', '.join(sorted(sortable))}, optionally prefixed with '-'.")
+
+        self.key = key
+        self.id_column = model.id
+        self.sort_column = sortable[key]
+        self.stream = request.args.get("stream", "").lower() in ("1", "true", "yes")
+        self.after = _decode_cursor(request.args["cursor"], self.sort) if request.args.get("cursor") else None
+
+    def apply(self, query, after=None, limit=None):
+        """This function adds the keyset condition, the order and the limit of a page to the query"""
+        after = after or self.after
+        if self.key == "id":
+            order = [self.id_column.desc() if self.descending else self.id_column]
+            if after:
+                query = query.filter(self.id_column < after[1] if self.descending else self.id_column > after[1])
+        else:
+            columns = tuple_(self.sort_column, self.id_column)
+            order = [self.sort_column, self.id_column]
+            if self.descending:
+                order = [column.desc() for column in order]
+            if after:
+                bound = tuple_(literal(after[0], String), literal(after[1]))
+                query = query.filter(columns < bound if self.descending else columns > bound)
+        return query.order_by(*order).limit(limit or self.limit)
+
+    def key_of(self, row) -> tuple:
+        """This function returns the (sort value, id) keyset position of a row: an ORM object, a Row starting with one or
+        a projected Row of columns (see projection.py)"""
+        obj = row[0] if isinstance(row, Row) and "id" not in row._fields else row
+        value = obj.id if self.key == "id" else _sort_value(getattr(obj, self.sort_column.key))
+        return value, obj.id
+
+    def cursor_of(self, row) -> str:
+        return _encode_cursor(self.sort, *self.key_of(row))
+
+
+def paginated_response(query, model, serialize, sortable: dict = None, empty=None):
+    """This function returns one page of the query as a JSON list with the X-Next-Cursor header, or the whole query as
+    an NDJSON stream when stream=1. serialize turns a row into a dict, empty is the response for an empty first page"""
+    try:
+        page = PageRequest(model, sortable)
+    except PaginationError as e:
+        return {"error": str(e)}, 400
+
+    if page.stream:
+        return _stream(query, page, serialize)
+
+    # Reading one row more than the page to know whether there is a next page
+    rows = page.apply(query, limit=page.limit + 1).all()
+    has_next = len(rows) > page.limit
+    rows = rows[:page.limit]
+
+    if not rows and page.after is None and empty is not None:
+        return empty
+
+    headers = {}
+    if has_next:
+        next_cursor = page.cursor_of(rows[-1])
+        args = {**request.args.to_dict(), "cursor": next_cursor}
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{url_for(request.endpoint, **(request.view_args or {}), **args)}>; rel="next"'
+
+    return [serialize(row) for row in rows], 200, headers
+
+
+def _stream(query, page: PageRequest, serialize) -> Response:
+    """This function streams every row of the query as NDJSON, reading it in keyset batches so that only one batch is
+    ever held in memory"""
+    def generate():
+        after = page.after
+        while True:
+            rows = page.apply(query, after=after, limit=STREAM_BATCH_SIZE).all()
+            for row in rows:
+                yield json.dumps(serialize(row), default=str) + "\n"
+            if len(rows) < STREAM_BATCH_SIZE:
+                return
+            after = page.key_of(rows[-1])
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
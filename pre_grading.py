@@ -0,0 +1,156 @@
+import os
+import re
+import time
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Local pre-grading of the descriptive answers before any LLM call (ai_grading.py). It is off unless asked for
+# (PRE_GRADING or the mode argument) and it only ever gives 0, never any other marks: a word overlap says nothing about
+# whether an answer is right (an answer saying the opposite of the model answer in its words overlaps it a lot, a
+# correct paraphrase hardly), so every answer with something in it which isn't clearly unrelated goes to the LLM.
+#
+#   off (default)  no pre-grading, every answer goes to the LLM
+#   blank          the blank answers get 0
+#   lexical        the blank answers get 0, and so do the answers whose cosine similarity with the model answer of
+#                  their question (questions.reference_answer) is at most the zero threshold, with hashed word and word
+#                  pair counts (log scaled) as vectors, no network at all
+#   embeddings     the same with OpenAI embeddings (text-embedding-3-small, see GenAIRequests/RAG_Requests.py). When
+#                  the embeddings can't be fetched the run carries on with the lexical vectors
+#
+# No zero threshold is shipped: the similarities of a cohort depend on its questions and on the vectors, and the
+# synthetic answers of benchmarks/bench_pre_grading.py are too close to the model answers to calibrate one. The lexical
+# and embeddings modes need it set with PRE_GRADING_THRESHOLD (or the threshold argument) once it has been checked
+# against the teacher's grades of a real cohort. A question without a reference answer is always left to the LLM.
+#
+# The answers graded locally are marked with graded_locally so a teacher can review them. In the similarity modes the
+# answers are handled in batches of BATCH_SIZE: one embedding request for the texts of the batch (embeddings mode),
+# then the similarities of the whole batch are one NumPy row-wise dot product with the (cached) vectors of the model
+# answers.
+
+BATCH_SIZE = 256
+LEXICAL_DIMENSIONS = 4096
+MODES = ("off", "blank", "lexical", "embeddings")
+SIMILARITY_MODES = ("lexical", "embeddings")
+DEFAULT_MODE = "off"
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("a an and are as at be by for from has in is it its of on or that the this to was were which "
+                       "with".split())
+
+
+def lexical_vectors(texts: List[str], dimensions: int = LEXICAL_DIMENSIONS) -> np.ndarray:
+    """This function returns the unit vectors of the texts made of their hashed words and word pairs"""
+    rows, columns = [], []
+    for row, text in enumerate(texts):
+        words = [word for word in _WORD.findall((text or "").lower()) if word not in _STOPWORDS]
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            rows.append(row)
+            columns.append(zlib.crc32(feature.encode()) % dimensions)
+
+    vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+    np.add.at(vectors, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), 1.0)
+    np.log1p(vectors, out=vectors)  # a word repeated ten times doesn't weigh ten times more
+    return _normalise(vectors)
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class PreGrader:
+    """This class triages the answers: the ones which get 0 locally, blank or unrelated, and the ones left to the LLM"""
+
+    def __init__(self, mode: str = DEFAULT_MODE, batch_size: int = BATCH_SIZE, threshold: Optional[float] = None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown pre-grading mode '{mode}', expected one of {', '.join(MODES)}")
+        if mode in SIMILARITY_MODES and threshold is None:
+            raise ValueError(f"Pre-grading mode '{mode}' needs a zero threshold checked against a graded cohort "
+                             f"(PRE_GRADING_THRESHOLD)")
+        self.mode = mode
+        self.batch_size = batch_size
+        self.threshold = threshold
+        self._references = {}  # (mode, question id, reference answer) -> unit vector
+        self._embeddings = None
+        self.stats = {"answers": 0, "blank": 0, "unrelated": 0, "ambiguous": 0, "batches": 0, "seconds": 0.0}
+
+    def vectors(self, texts: List[str]) -> np.ndarray:
+        """This function returns the unit vectors of the texts in the current mode"""
+        if self.mode == "embeddings":
+            try:
+                if self._embeddings is None:
+                    from GenAIRequests.RAG_Requests import embeddings_model
+                    self._embeddings = embeddings_model()
+                return _normalise(np.asarray(self._embeddings.embed_documents(list(texts)), dtype=np.float32))
+            except Exception as e:
+                print(f"Embeddings unavailable ({e}), pre-grading with the lexical vectors")
+                self.mode = "lexical"
+        return lexical_vectors(texts)
+
+    def _reference_vectors(self, questions: list) -> np.ndarray:
+        missing = [q for q in questions if (self.mode, q.id, q.reference_answer) not in self._references]
+        if missing:
+            for question, vector in zip(missing, self.vectors([q.reference_answer for q in missing])):
+                self._references[(self.mode, question.id, question.reference_answer)] = vector
+        return np.stack([self._references[(self.mode, q.id, q.reference_answer)] for q in questions])
+
+    def triage(self, answers: list, questions: Dict[int, object]) -> tuple:
+        """This function takes the ungraded answers (with id, question_id and answer_text) and their questions (with
+        id, marks and reference_answer) and returns ({answer id: 'blank' or 'unrelated'} of the answers which get 0,
+        the answers left to the LLM)"""
+        zeros, ambiguous = {}, []
+        if self.mode == "off":
+            self.stats["answers"] += len(answers)
+            self.stats["ambiguous"] += len(answers)
+            return zeros, list(answers)
+
+        gradable = []
+        for answer in answers:
+            if not (answer.answer_text or "").strip():
+                zeros[answer.id] = "blank"
+                self.stats["blank"] += 1
+            elif self.mode not in SIMILARITY_MODES or not questions[answer.question_id].reference_answer:
+                ambiguous.append(answer)
+                self.stats["ambiguous"] += 1
+            else:
+                gradable.append(answer)
+
+        for start in range(0, len(gradable), self.batch_size):
+            batch_start = time.perf_counter()
+            batch = gradable[start:start + self.batch_size]
+            batch_questions = [questions[answer.question_id] for answer in batch]
+            mode = self.mode
+            reference_vectors = self._reference_vectors(batch_questions)
+            answer_vectors = self.vectors([answer.answer_text for answer in batch])
+            if self.mode != mode:
+                # The embeddings failed on the answers, the references are needed as lexical vectors as well
+                reference_vectors = self._reference_vectors(batch_questions)
+            # Row-wise cosine similarity, the vectors are unit vectors
+            similarities = np.einsum("ij,ij->i", answer_vectors, reference_vectors)
+
+            for answer, similarity in zip(batch, similarities.tolist()):
+                if similarity <= self.threshold:
+                    zeros[answer.id] = "unrelated"
+                    self.stats["unrelated"] += 1
+                else:
+                    ambiguous.append(answer)
+                    self.stats["ambiguous"] += 1
+            self.stats["batches"] += 1
+            self.stats["seconds"] += time.perf_counter() - batch_start
+
+        self.stats["answers"] += len(answers)
+        return zeros, ambiguous
+
+
+def pre_grader(mode: Optional[str] = None) -> PreGrader:
+    """This function returns a PreGrader in the given mode, PRE_GRADING by default, with the zero threshold of
+    PRE_GRADING_THRESHOLD"""
+    threshold = os.getenv("PRE_GRADING_THRESHOLD")
+    try:
+        threshold = float(threshold) if threshold else None
+    except ValueError:
+        raise ValueError(f"PRE_GRADING_THRESHOLD must be a number, got '{threshold}'")
+    return PreGrader(mode or os.getenv("PRE_GRADING", DEFAULT_MODE), threshold=threshold)
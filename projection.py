@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from flask import request
+
+from data_models import db
+
+# Column projections for the list endpoints. Instead of loading full ORM objects (identity map, change tracking,
+# relationship state) to emit a handful of their attributes, an endpoint selects only the columns it serializes and
+# gets plain rows back. A projection declares the fields a resource can return, every endpoint has its own default
+# fields and the client can ask for a sparse fieldset with ?fields=id,title,...
+#
+# The id and the timestamp columns are always selected (but only returned when asked for) as the keyset pagination in
+# pagination.py sorts on them.
+
+KEY_COLUMNS = ("id", "created_at", "submitted_at")
+
+
+class FieldsError(ValueError):
+    """This class is raised for a fields parameter naming a field the resource doesn't have"""
+
+
+class Projection:
+    """This class holds the columns a list endpoint can return for a model, by field name"""
+
+    def __init__(self, model, *fields: str):
+        self.model = model
+        self.columns = {name: getattr(model, name) for name in fields}
+        self.key_fields = [name for name in KEY_COLUMNS if hasattr(model, name)]
+
+    def requested(self, default) -> list:
+        """This function returns the fields asked for with ?fields=, or the endpoint's default fields"""
+        raw = request.args.get("fields")
+        if not raw:
+            return list(default)
+
+        fields = list(dict.fromkeys(name.strip() for name in raw.split(",") if name.strip()))
+        unknown = [name for name in fields if name not in self.columns]
+        if unknown or not fields:
+            raise FieldsError(f"Unknown fields {', '.join(unknown) or raw!r}, available fields are "
+                              f"{', '.join(self.columns)}.")
+        return fields
+
+    def query(self, fields):
+        """This function returns a query selecting only the given fields (plus the key columns) as labelled rows"""
+        selected = list(fields) + [name for name in self.key_fields if name not in fields]
+        return db.session.query(*[getattr(self.model, name).label(name) for name in selected])
+
+    @staticmethod
+    def serialize(row, fields) -> dict:
+        """This function turns a projected row into the dict of the given fields, with the datetimes in ISO format"""
+        values = row._mapping
+        return {name: values[name].isoformat() if isinstance(values[name], datetime) else values[name]
+                for name in fields}
+
+    def serializer(self, fields):
+        """This function returns a serialize function bound to the fields, for paginated_response"""
+        return lambda row: self.serialize(row, fields)
@@ -0,0 +1,154 @@
+import csv
+import io
+import json
+from itertools import islice
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from data_models import db, Assignment, Quiz, User
+
+# Streaming parsers for bulk question-bank imports. Rows are read one at a time from the uploaded file object and
+# handed out in batches, so the memory used stays flat whatever the size of the file.
+#
+# JSON Lines, one question per line:
+#   {"question_text": "...", "question_type": "multiple_choice", "marks": 1, "quiz_id": 3,
+#    "options": ["A", "B", "C"], "correct_answer": "B"}
+#   (options may also be dicts: {"option_text": "A", "is_correct": true})
+#
+# CSV with a header row:
+#   question_text,question_type,marks,quiz_id,assignment_id,created_by,options,correct_answer
+#   "What is 2+2?",multiple_choice,1,3,,1,3|4|5,4
+#   (options are separated by "|")
+
+OPTION_SEPARATOR = "|"
+INTEGER_FIELDS = ("marks", "quiz_id", "assignment_id", "created_by")
+# The rows referenced by the ids of a question, checked here as SQLite doesn't enforce the foreign keys
+REFERENCES = {"quiz_id": Quiz, "assignment_id": Assignment, "created_by": User}
+
+
+class RowError(ValueError):
+    """This class is raised for a row which can't be imported, the message is reported back for that row"""
+
+
+def _to_int(value, field: str) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        raise RowError(f"'{field}' must be an integer")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise RowError(f"'{field}' must be an integer")
+
+
+def normalise_row(raw: dict, defaults: dict) -> dict:
+    """This function validates one parsed row and turns it into the question dict taken by insert_questions"""
+    if not isinstance(raw, dict):
+        raise RowError("Row must be a JSON object")
+
+    text = raw.get("question_text")
+    if not isinstance(text, str) or not text.strip():
+        raise RowError("Missing required field 'question_text'")
+
+    question = {
+        "question_text": text,
+        "question_type": raw.get("question_type") or defaults.get("question_type", "text"),
+    }
+    for field in INTEGER_FIELDS:
+        value = raw.get(field)
+        question[field] = _to_int(value, field) if value not in (None, "") else defaults.get(field)
+
+    options = raw.get("options") or []
+    if isinstance(options, str):
+        options = [opt.strip() for opt in options.split(OPTION_SEPARATOR) if opt.strip()]
+    if not isinstance(options, list):
+        raise RowError("'options' must be a list")
+
+    correct_ans = str(raw.get("correct_answer") or "").strip().lower()
+    question["options"] = []
+    for idx, opt in enumerate(options):
+        if isinstance(opt, dict):
+            option_text = opt.get("option_text")
+            is_correct = bool(opt.get("is_correct", False))
+        else:
+            option_text = opt
+            is_correct = False
+        if not isinstance(option_text, str) or not option_text.strip():
+            raise RowError(f"Option {idx + 1} has no text")
+        if correct_ans:
+            is_correct = is_correct or option_text.strip().lower() == correct_ans
+        question["options"].append({"option_text": option_text, "is_correct": is_correct, "order_index": idx})
+
+    if correct_ans and question["options"] and not any(opt["is_correct"] for opt in question["options"]):
+        raise RowError("'correct_answer' does not match any option")
+    # Without options the correct answer is the model answer of a descriptive question
+    question["reference_answer"] = None if question["options"] else (str(raw.get("correct_answer") or "").strip() or None)
+
+    return question
+
+
+def iter_jsonl(stream) -> Iterator[Tuple[int, object]]:
+    """This function yields (line number, parsed object) for every non-blank line, or a RowError for a bad line"""
+    for line_no, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""), start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError as e:
+            yield line_no, RowError(f"Invalid JSON: {e}")
+
+
+def iter_csv(stream) -> Iterator[Tuple[int, object]]:
+    """This function yields (row number, row dict) for every CSV data row, the header being row 1"""
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    try:
+        if not reader.fieldnames or "question_text" not in reader.fieldnames:
+            raise RowError("CSV header must contain a 'question_text' column")
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as e:
+        # The reader can't carry on past a malformed record (e.g. a field over csv.field_size_limit())
+        raise RowError(f"Invalid CSV after line {reader.line_num}: {e}")
+
+
+def iter_rows(stream, file_format: str, defaults: dict) -> Iterator[Tuple[int, object]]:
+    """This function yields (row number, question dict) for valid rows and (row number, RowError) for invalid ones"""
+    parser = iter_csv if file_format == "csv" else iter_jsonl
+    for row_no, raw in parser(stream):
+        if isinstance(raw, RowError):
+            yield row_no, raw
+            continue
+        try:
+            yield row_no, normalise_row(raw, defaults)
+        except RowError as e:
+            yield row_no, e
+
+
+def check_references(rows: List[Tuple[int, dict]]) -> Tuple[list, list]:
+    """This function checks that the quizzes, assignments and users referenced by a batch of (row number, question)
+    exist, with one query per kind of reference, and returns (the valid rows, (row number, RowError) of the others)"""
+    missing = {}
+    for field, model in REFERENCES.items():
+        ids = {row[field] for _, row in rows if row.get(field) is not None}
+        if ids:
+            found = set(db.session.execute(select(model.id).where(model.id.in_(ids))).scalars())
+            missing[field] = ids - found
+
+    valid, invalid = [], []
+    for row_no, row in rows:
+        unknown = [f"{field} {row[field]}" for field in REFERENCES if row.get(field) in missing.get(field, ())]
+        if unknown:
+            invalid.append((row_no, RowError(f"Unknown {', '.join(unknown)}")))
+        else:
+            valid.append((row_no, row))
+    return valid, invalid
+
+
+def batched(rows: Iterator, size: int) -> Iterator[List]:
+    """This function groups an iterator into lists of at most `size` items without reading ahead any further"""
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,193 @@
+import gzip
+import json
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select
+
+from data_models import db, Quiz, Question, QuestionOption, QuizGeneration
+from migrations import add_column
+
+# Quiz delivery payloads for the start of an exam. A student taking a quiz needs the quiz with all its questions and
+# their options, without is_correct. Instead of building it for every student (one request for the questions and one
+# per question for the options), GET /quizzes/<id>/delivery serves a payload serialized once per revision of the quiz
+# and kept as bytes, along with its gzip compression, so a whole class starting the quiz at the same time costs one
+# primary key read per student.
+#
+# quizzes.revision is bumped by SQLite triggers on every change of what the payload shows: the quiz itself, its
+# questions and their options (not is_correct, which isn't delivered), whichever code path writes them. A request
+# reads the version of the quiz and is served the cached payload of that version, the first request after a change
+# builds the new one while the other requests for the quiz wait for it instead of building it too.
+#
+# quizzes.id isn't AUTOINCREMENT, so a quiz created after the quiz with the highest id was deleted is given its id and
+# starts again from revision 0. The payloads are therefore cached per (generation, revision) of the quiz, the
+# generation being a single counter bumped by a trigger on every quiz deleted, and it is part of the ETag too: a
+# student holding the payload of the deleted quiz is never told by a 304 that it is still current.
+#
+# The revision triggers and the column are created by migration 8 (migrations.py), the generation and its trigger by
+# migration 12. The cache is per process.
+
+MAX_CACHED_QUIZZES = 256
+
+
+def _bump(quiz_ids: str) -> str:
+    return f"UPDATE quizzes SET revision = revision + 1 WHERE id IN ({quiz_ids});"
+
+
+def _quiz_of(question_ids: str) -> str:
+    return f"SELECT quiz_id FROM questions WHERE id IN ({question_ids})"
+
+
+_TRIGGERS = {
+    "quizzes_revision_au": f"AFTER UPDATE OF title, total_marks, due_date ON quizzes BEGIN {_bump('new.id')} END",
+    "questions_revision_ai": f"AFTER INSERT ON questions BEGIN {_bump('new.quiz_id')} END",
+    "questions_revision_ad": f"AFTER DELETE ON questions BEGIN {_bump('old.quiz_id')} END",
+    "questions_revision_au": "AFTER UPDATE OF quiz_id, question_text, question_type, marks ON questions "
+                             f"BEGIN {_bump('old.quiz_id, new.quiz_id')} END",
+    "question_options_revision_ai": f"AFTER INSERT ON question_options BEGIN {_bump(_quiz_of('new.question_id'))} END",
+    "question_options_revision_ad": f"AFTER DELETE ON question_options BEGIN {_bump(_quiz_of('old.question_id'))} END",
+    "question_options_revision_au": "AFTER UPDATE OF question_id, option_text, order_index ON question_options "
+                                    f"BEGIN {_bump(_quiz_of('old.question_id, new.question_id'))} END",
+}
+
+
+_GENERATION_TRIGGER = ("quizzes_generation_ad",
+                       "AFTER DELETE ON quizzes BEGIN UPDATE quiz_generations SET value = value + 1; END")
+
+
+class Payload:
+    """This class holds the delivery payload of one version, (generation, revision), of a quiz as JSON bytes and
+    gzipped"""
+
+    def __init__(self, quiz_id: int, version: tuple, body: bytes):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=6)
+        self.etag = "quiz-{}-g{}-r{}".format(quiz_id, *version)
+
+
+def _generation():
+    return select(QuizGeneration.value).where(QuizGeneration.id == 1).scalar_subquery()
+
+
+def build_payload(quiz_id: int):
+    """This function reads the quiz with its version, its questions and their options (three queries) and returns its
+    Payload, or None if the quiz doesn't exist"""
+    quiz = db.session.execute(
+        select(Quiz.id, Quiz.title, Quiz.total_marks, Quiz.due_date, Quiz.course_id, Quiz.revision,
+               _generation().label("generation")).where(Quiz.id == quiz_id)
+    ).first()
+    if quiz is None:
+        return None
+
+    questions = db.session.execute(
+        select(Question.id, Question.question_text, Question.question_type, Question.marks)
+        .where(Question.quiz_id == quiz_id).order_by(Question.id)
+    ).all()
+    options = db.session.execute(
+        select(QuestionOption.question_id, QuestionOption.id, QuestionOption.option_text, QuestionOption.order_index)
+        .join(Question, Question.id == QuestionOption.question_id)
+        .where(Question.quiz_id == quiz_id)
+        .order_by(QuestionOption.question_id, QuestionOption.order_index, QuestionOption.id)
+    ).all()
+
+    options_of = {}
+    for option in options:
+        options_of.setdefault(option.question_id, []).append(
+            {"id": option.id, "option_text": option.option_text, "order_index": option.order_index})
+
+    document = {
+        "id": quiz.id,
+        "title": quiz.title,
+        "total_marks": quiz.total_marks,
+        "due_date": quiz.due_date.isoformat() if quiz.due_date else None,
+        "course_id": quiz.course_id,
+        "revision": quiz.revision,
+        "questions": [{
+            "id": q.id,
+            "question_text": q.question_text,
+            "question_type": q.question_type,
+            "marks": q.marks,
+            "options": options_of.get(q.id, []),
+        } for q in questions],
+    }
+    return Payload(quiz_id, (quiz.generation, quiz.revision), json.dumps(document, separators=(",", ":")).encode())
+
+
+class DeliveryCache:
+    """This class keeps the latest payload of the most recently delivered quizzes and builds a payload only once per
+    version, however many requests ask for it at the same time"""
+
+    def __init__(self, max_quizzes: int = MAX_CACHED_QUIZZES):
+        self.max_quizzes = max_quizzes
+        self.payloads = OrderedDict()
+        self.builds = 0
+        self._lock = threading.Lock()
+        self._build_locks = {}
+
+    def _cached(self, quiz_id: int, version: tuple):
+        with self._lock:
+            payload = self.payloads.get(quiz_id)
+            if payload is not None and payload.version == version:
+                self.payloads.move_to_end(quiz_id)
+                return payload
+            return None
+
+    def payload(self, quiz_id: int, version: tuple):
+        """This function returns the payload of the version of the quiz, building it if it isn't cached yet"""
+        payload = self._cached(quiz_id, version)
+        if payload is not None:
+            return payload
+
+        with self._lock:
+            build_lock = self._build_locks.setdefault(quiz_id, threading.Lock())
+        with build_lock:
+            # Built by another request while this one was waiting
+            payload = self._cached(quiz_id, version)
+            if payload is not None:
+                return payload
+
+            # Labelled with the version read along with the quiz, which is the latest if the quiz changed meanwhile
+            payload = build_payload(quiz_id)
+            if payload is None:
+                return None
+            with self._lock:
+                self.builds += 1
+                # A newer version built by a request which read the version later is kept
+                current = self.payloads.get(quiz_id)
+                if current is None or current.version <= payload.version:
+                    self.payloads[quiz_id] = payload
+                    self.payloads.move_to_end(quiz_id)
+                while len(self.payloads) > self.max_quizzes:
+                    evicted, _ = self.payloads.popitem(last=False)
+                    self._build_locks.pop(evicted, None)
+            return payload
+
+    def clear(self):
+        with self._lock:
+            self.payloads.clear()
+
+
+delivery_cache = DeliveryCache()
+
+
+def quiz_version(quiz_id: int):
+    """This function returns the current version of a quiz as (generation, revision), None if it doesn't exist"""
+    row = db.session.execute(select(_generation(), Quiz.revision).where(Quiz.id == quiz_id)).first()
+    return tuple(row) if row is not None else None
+
+
+def create_revision_triggers(conn):
+    """This function adds quizzes.revision and the triggers bumping it, run by migration 8"""
+    add_column(conn, "quizzes", "revision", "INTEGER NOT NULL DEFAULT 0")
+    for name, body in _TRIGGERS.items():
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+
+def create_generation_trigger(conn):
+    """This function creates the quiz_generations row and the trigger bumping it, run by migration 12"""
+    db.metadata.create_all(conn, tables=[QuizGeneration.__table__], checkfirst=True)
+    conn.exec_driver_sql("INSERT OR IGNORE INTO quiz_generations (id, value) VALUES (1, 0)")
+    name, body = _GENERATION_TRIGGER
+    conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
@@ -0,0 +1,82 @@
+from typing import List, Optional
+
+from sqlalchemy import insert
+
+from data_models import db, Quiz, Question, QuestionOption
+
+# Bulk persistence of quizzes and their questions. Instead of adding one ORM object at a time and flushing after each
+# of them to learn its id, the rows are sent as batched (executemany) INSERTs. The question ids come back from
+# INSERT ... RETURNING in the order the rows were given, so the options can be linked to their question without any
+# per-row round trip. Nothing is committed here, the caller owns the transaction and its rollback.
+#
+# A question is passed as a plain dict:
+#   {"question_text": "...", "question_type": "multiple_choice", "marks": 1,
+#    "options": [{"option_text": "...", "is_correct": True}, ...]}
+# or, for a descriptive question, {"question_text": "...", "question_type": "descriptive", "marks": 5,
+#    "reference_answer": "..."}
+
+
+def insert_questions(questions: List[dict], quiz_id: Optional[int] = None, assignment_id: Optional[int] = None,
+                     created_by: Optional[int] = None) -> List[int]:
+    """This function inserts the questions and all of their options in two batched statements and returns the new
+    question ids in the same order as the given questions"""
+    if not questions:
+        return []
+
+    question_rows = [{
+        "quiz_id": q.get("quiz_id", quiz_id),
+        "assignment_id": q.get("assignment_id", assignment_id),
+        "created_by": q.get("created_by", created_by),
+        "question_text": q["question_text"],
+        "question_type": q.get("question_type", "text"),
+        "marks": q.get("marks"),
+        "reference_answer": q.get("reference_answer")
+    } for q in questions]
+
+    # sort_by_parameter_order guarantees the returned ids line up with question_rows even when batched
+    question_ids = db.session.execute(
+        insert(Question).returning(Question.id, sort_by_parameter_order=True),
+        question_rows
+    ).scalars().all()
+
+    # Every row carries the same keys so SQLAlchemy can send all the options as one executemany batch
+    option_rows = [{
+        "question_id": question_id,
+        "option_text": opt.get("option_text"),
+        "is_correct": bool(opt.get("is_correct", False)),
+        "order_index": opt.get("order_index", idx)
+    } for question_id, q in zip(question_ids, questions) for idx, opt in enumerate(q.get("options") or [])]
+
+    if option_rows:
+        db.session.execute(insert(QuestionOption), option_rows)
+
+    return list(question_ids)
+
+
+def insert_quiz(title: str, total_marks: Optional[int], course_id: Optional[int], created_by: Optional[int],
+                questions: List[dict]) -> tuple:
+    """This function inserts a quiz together with its questions and options and returns (quiz id, question ids)"""
+    quiz_id = db.session.execute(
+        insert(Quiz).returning(Quiz.id),
+        {"title": title, "total_marks": total_marks, "course_id": course_id, "created_by": created_by}
+    ).scalar_one()
+
+    return quiz_id, insert_questions(questions, quiz_id=quiz_id, created_by=created_by)
+
+
+def generated_mcq_rows(generated_questions: List[dict], marks: int = 1) -> List[dict]:
+    """This function turns the questions of a generated QuizResponse (question, options, correct_answer) into the
+    question dicts taken by insert_questions, marking an option correct when it matches the correct answer"""
+    rows = []
+    for q_data in generated_questions:
+        correct_ans = (q_data.get("correct_answer") or "").strip().lower()
+        rows.append({
+            "question_text": q_data.get("question"), # Matches Pydantic 'question' field
+            "question_type": "multiple_choice",
+            "marks": marks,
+            "options": [
+                {"option_text": opt_text, "is_correct": opt_text.strip().lower() == correct_ans, "order_index": idx}
+                for idx, opt_text in enumerate(q_data.get("options", []))
+            ]
+        })
+    return rows
@@ -0,0 +1,359 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from functools import wraps
+
+from flask import current_app, request, make_response
+from sqlalchemy import event
+
+from data_models import db
+from counters import COUNTERS
+from GenAIRequests.telemetry import percentile
+
+# Response cache for the read-heavy GET endpoints. A cached view stores the bytes of its 200 responses keyed by
+# endpoint, path and query string, and declares the data its response is built from as tags: a table name for
+# responses reading any row of the table, or table:{view argument} for a response reading one row of it:
+#
+#     @courses_bp.route("/<int:course_id>", methods=["GET"])
+#     @cached("courses:{course_id}", "users")
+#     def get_course(course_id): ...
+#
+# Every tag has a version number. An entry remembers the versions of its tags when it was stored and is only served
+# while they are unchanged. The INSERT/UPDATE/DELETE statements going through the SQLAlchemy engine are noted per
+# connection, whatever wrote them (the POST/PUT/DELETE handlers, the bulk inserts, the migrations...), and once the
+# transaction has committed their tags are bumped: the table, plus table:<id> for the rows written by id (which is how
+# the ORM updates and deletes) or table:* when the rows aren't known, which invalidates every row of the table. Writes
+# made by the counter triggers of counters.py are implied, e.g. a new answer also bumps questions:<its question id>
+# for the answer_count. The counters of ROW_ONLY_COUNTERS only bump the rows, not the table: questions.answer_count
+# changes with every answer submitted, bumping questions would turn the cache off for the question lists, search and
+# count during an exam. The student_answers_count of a cached question list may lag by up to the TTL, the single
+# question view stays exact.
+#
+# Two stores, picked by the RESPONSE_CACHE environment variable (or app config):
+#   memory  (default) an LRU dictionary per process
+#   disk    a SQLite file (RESPONSE_CACHE_PATH, data/response_cache.db by default) shared by all the worker processes
+#           of the machine, entries and table versions included, so a write in one worker invalidates the others
+#   off     no caching
+# With several workers and the memory store a worker only sees its own writes, RESPONSE_CACHE_TTL (seconds, 300 by
+# default) bounds how stale another worker's entries can get. Writes made outside SQLAlchemy (sqlite3 scripts) are
+# only picked up by the TTL too.
+#
+# Hits, misses and latencies are counted per endpoint, see GET /metrics/cache.
+
+DEFAULT_TTL = 300
+MEMORY_MAX_ENTRIES = 5000
+LATENCY_SAMPLES = 1000
+
+# Counters whose writes don't invalidate the responses tagged with their whole table, see above
+ROW_ONLY_COUNTERS = {("questions", "answer_count")}
+
+# Parent rows updated by the counter triggers when a row of the key table is written, as (parent table, foreign key,
+# tags of the whole parent table bumped too)
+IMPLIED_PARENTS = defaultdict(list)
+for _counter in COUNTERS:
+    IMPLIED_PARENTS[_counter.child_table].append(
+        (_counter.table, _counter.foreign_key, (_counter.table, _counter.column) not in ROW_ONLY_COUNTERS))
+
+_TABLE = r'["`\[]?(\w+)["`\]]?'
+_INSERT = re.compile(r'^\s*(INSERT(?:\s+OR\s+(\w+))?|REPLACE)\s+INTO\s+' + _TABLE + r'\s*\(([^)]*)\)', re.I)
+_UPDATE = re.compile(r'^\s*UPDATE(?:\s+OR\s+\w+)?\s+' + _TABLE + r'\s+SET\s+(.*?)(?:\s+WHERE\s+(.*?))?\s*$', re.I | re.S)
+_DELETE = re.compile(r'^\s*DELETE\s+FROM\s+' + _TABLE + r'(?:\s+WHERE\s+(.*?))?\s*$', re.I | re.S)
+_EQUALS_PARAMETER = re.compile(r'(?:\w+\.)?"?(\w+)"?\s*=\s*\?')
+
+# Headers of a page kept with the cached body
+_KEPT_HEADERS = ("Content-Type", "X-Next-Cursor", "Link")
+
+
+class MemoryStore:
+    """This class stores the entries and table versions in a dictionary of the process, dropping the least recently
+    used entries past max_entries"""
+
+    def __init__(self, max_entries: int = MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.table_versions = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def versions(self, tables) -> dict:
+        with self.lock:
+            return {table: self.table_versions[table] for table in tables}
+
+    def bump(self, tables):
+        with self.lock:
+            for table in tables:
+                self.table_versions[table] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DiskStore:
+    """This class stores the entries and table versions in a SQLite file shared by the processes of the machine, with
+    one connection per thread"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS table_versions (name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)  # autocommit, every write is atomic
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")  # a cache lost in a crash is just rebuilt
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT entry FROM entries WHERE key = ?", (key,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def set(self, key, entry):
+        self._conn().execute("INSERT OR REPLACE INTO entries (key, entry) VALUES (?, ?)", (key, _encode(entry)))
+
+    def versions(self, tables) -> dict:
+        tables = list(tables)
+        rows = self._conn().execute(
+            f"SELECT name, version FROM table_versions WHERE name IN ({', '.join('?' * len(tables))})", tables
+        ).fetchall()
+        return {table: 0 for table in tables} | dict(rows)
+
+    def bump(self, tables):
+        self._conn().executemany(
+            "INSERT INTO table_versions (name, version) VALUES (?, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = version + 1", [(table,) for table in tables]
+        )
+
+    def clear(self):
+        self._conn().execute("DELETE FROM entries")
+
+
+def _encode(entry) -> str:
+    status, body, headers, versions, stored_at = entry
+    return json.dumps([status, body.decode("latin-1"), headers, versions, stored_at])
+
+
+def _decode(text: str):
+    status, body, headers, versions, stored_at = json.loads(text)
+    return status, body.encode("latin-1"), headers, versions, stored_at
+
+
+class CacheStats:
+    """This class counts the hits and misses of every endpoint and keeps a window of their latencies"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self.latencies = defaultdict(lambda: {"hit": deque(maxlen=LATENCY_SAMPLES),
+                                              "miss": deque(maxlen=LATENCY_SAMPLES)})
+
+    def record(self, endpoint: str, hit: bool, latency_ms: float):
+        with self.lock:
+            self.counts[endpoint]["hits" if hit else "misses"] += 1
+            self.latencies[endpoint]["hit" if hit else "miss"].append(latency_ms)
+
+    def summary(self) -> list:
+        with self.lock:
+            rows = []
+            for endpoint, counts in sorted(self.counts.items()):
+                total = counts["hits"] + counts["misses"]
+                row = {"endpoint": endpoint, **counts, "hit_ratio": round(counts["hits"] / total, 4) if total else None}
+                for kind, values in self.latencies[endpoint].items():
+                    row[f"p50_{kind}_ms"] = round(percentile(list(values), 50), 3) if values else None
+                    row[f"p95_{kind}_ms"] = round(percentile(list(values), 95), 3) if values else None
+                rows.append(row)
+            return rows
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+            self.latencies.clear()
+
+
+stats = CacheStats()
+
+
+def _store():
+    return current_app.extensions.get("response_cache")
+
+
+def _cache_key() -> str:
+    args = sorted(request.args.items(multi=True))
+    return f"{request.endpoint}|{request.path}|{'&'.join(f'{name}={value}' for name, value in args)}"
+
+
+def cached(*tags: str):
+    """This function returns a decorator caching the 200 responses of a GET view until the data of one of its tags is
+    written to (or the TTL runs out). Streamed responses are never cached"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            store = _store()
+            if store is None:
+                return view(*args, **kwargs)
+
+            start = time.perf_counter()
+            key = _cache_key()
+            view_tags = _view_tags(tags, kwargs)
+            entry = store.get(key)
+            if entry is not None:
+                status, body, headers, versions, stored_at = entry
+                fresh = time.time() - stored_at < current_app.config["RESPONSE_CACHE_TTL"]
+                if fresh and store.versions(view_tags) == versions:
+                    response = current_app.response_class(body, status=status, headers=headers)
+                    response.headers["X-Cache"] = "HIT"
+                    stats.record(request.endpoint, True, (time.perf_counter() - start) * 1000)
+                    return response
+
+            # The versions are read before the view so that a write committed while it runs leaves the entry stale
+            versions = store.versions(view_tags)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                headers = {name: response.headers[name] for name in _KEPT_HEADERS if name in response.headers}
+                store.set(key, (response.status_code, response.get_data(), headers, versions, time.time()))
+            response.headers["X-Cache"] = "MISS"
+            stats.record(request.endpoint, False, (time.perf_counter() - start) * 1000)
+            return response
+        return wrapper
+    return decorator
+
+
+def _view_tags(tags, view_args) -> list:
+    """This function formats the row tags of a view with its arguments, a row tag also depends on table:*"""
+    result = []
+    for tag in tags:
+        if ":" in tag:
+            result += [tag.format(**view_args), f"{tag.split(':')[0]}:*"]
+        else:
+            result.append(tag)
+    return result
+
+
+def _equality_columns(clause: str, first_parameter: int) -> dict:
+    """This function maps the columns of a 'column = ? AND ...' clause to the index of their parameter, or returns an
+    empty dict when the clause is anything more complex"""
+    if not clause:
+        return {}
+    columns = _EQUALS_PARAMETER.findall(clause)
+    if len(columns) != clause.count("?"):
+        return {}
+    return {column.lower(): first_parameter + n for n, column in enumerate(columns)}
+
+
+def _row_tags(table: str, column_index: dict, column: str, rows) -> set:
+    """This function returns the table:<value> tags of the rows for the column (table:* if its value isn't known)"""
+    if column not in column_index:
+        return {f"{table}:*"}
+    return {f"{table}:{row[column_index[column]]}" for row in rows}
+
+
+def tags_of_write(statement: str, parameters, executemany: bool) -> set:
+    """This function returns the tags invalidated by an INSERT, UPDATE or DELETE statement (an empty set for any other
+    statement)"""
+    rows = parameters if executemany else [parameters]
+    if not all(isinstance(row, (tuple, list)) for row in rows):
+        rows = []  # named parameters, the rows can't be told apart
+
+    insert, update, delete = _INSERT.match(statement), _UPDATE.match(statement), _DELETE.match(statement)
+    if insert:
+        table = insert.group(3).lower()
+        columns = {name.strip(' "`[]').lower(): n for n, name in enumerate(insert.group(4).split(","))}
+        # A new row has no cached response yet, unless it replaces an existing one
+        replacing = insert.group(1).upper() == "REPLACE" or (insert.group(2) or "").upper() == "REPLACE"
+        tags = {table, f"{table}:*"} if replacing else {table}
+        for parent, foreign_key, whole_table in IMPLIED_PARENTS[table]:
+            tags |= ({parent} if whole_table else set()) | _row_tags(parent, columns, foreign_key.lower(), rows)
+        return tags
+
+    if update:
+        table, assignments, where = update.group(1).lower(), update.group(2), update.group(3)
+        set_columns = _equality_columns(assignments.replace(",", " AND "), 0)
+        where_columns = _equality_columns(where, assignments.count("?"))
+        tags = {table} | _row_tags(table, where_columns, "id", rows)
+        for parent, foreign_key, whole_table in IMPLIED_PARENTS[table]:
+            if foreign_key.lower() in set_columns or not set_columns:
+                # Moved to another parent, the old one isn't known
+                tags |= ({parent} if whole_table else set()) | {f"{parent}:*"}
+        return tags
+
+    if delete:
+        table, where = delete.group(1).lower(), delete.group(2)
+        where_columns = _equality_columns(where, 0)
+        tags = {table} | _row_tags(table, where_columns, "id", rows)
+        for parent, foreign_key, whole_table in IMPLIED_PARENTS[table]:
+            tags |= ({parent} if whole_table else set()) | _row_tags(parent, where_columns, foreign_key.lower(), rows)
+        return tags
+
+    return set()
+
+
+def _note_write(conn, cursor, statement, parameters, context, executemany):
+    tags = tags_of_write(statement, parameters, executemany)
+    if tags:
+        conn.info.setdefault("written_tables", set()).update(tags)
+
+
+def _note_commit(conn):
+    conn.info.setdefault("committed_tables", set()).update(conn.info.pop("written_tables", ()))
+
+
+def _forget_on_rollback(conn):
+    conn.info.pop("written_tables", None)
+
+
+def _bump_on_checkin(store):
+    # Bumping once the connection is back in the pool, after the COMMIT itself, so a request reading the versions
+    # can't see the new ones before the data (the session hands its connection back as soon as it commits).
+    # Connection.info is the info of the pool record, the same dictionary is found here
+    def bump(dbapi_connection, connection_record):
+        connection_record.info.pop("written_tables", None)  # never committed, rolled back by the pool
+        tables = connection_record.info.pop("committed_tables", None)
+        if tables:
+            store.bump(tables)
+    return bump
+
+
+def init_app(app):
+    """This function sets up the store picked by the config and the listeners invalidating it, run by create_app once
+    the migrations have been applied"""
+    mode = app.config.setdefault("RESPONSE_CACHE", os.getenv("RESPONSE_CACHE", "memory"))
+    app.config.setdefault("RESPONSE_CACHE_TTL", float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL)))
+    if mode == "off":
+        return
+
+    if mode == "disk":
+        default_path = os.path.join(app.root_path, "data", "response_cache.db")
+        store = DiskStore(app.config.setdefault("RESPONSE_CACHE_PATH", os.getenv("RESPONSE_CACHE_PATH", default_path)))
+        store.clear()  # entries written by an older version of the code may not match its responses
+    else:
+        store = MemoryStore()
+    app.extensions["response_cache"] = store
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "after_cursor_execute", _note_write)
+    event.listen(engine, "commit", _note_commit)
+    event.listen(engine, "rollback", _forget_on_rollback)
+    event.listen(engine.pool, "checkin", _bump_on_checkin(store))
@@ -2,30 +2,33 @@ from flask import request, Blueprint
 from sqlalchemy.exc import SQLAlchemyError
 
 from data_models import db, Assignment, Course, User
-from sqlalchemy import func
+from pagination import paginated_response
+from projection import Projection, FieldsError
+from search_index import SEARCH_INDEXES, SearchError, search_request, with_snippet
+from conditional import conditional, rows
 
 # Defining blueprint to be used in the app later
 assignments_bp = Blueprint("assignments",__name__)
 
+# The assignment columns the list endpoints select, any of them can be asked for with ?fields=
+assignment_fields = Projection(Assignment, "id", "title", "total_marks", "due_date", "course_id", "created_by",
+                               "created_at")
+
 # Getting a list of all assignments using GET
 @assignments_bp.route("/", methods=["GET"])
+@conditional(Assignment)
 def get_assignments():
-    """This function gets a list of all the assignments in the database"""
-    assignments = Assignment.query.all()
-    if not assignments:
-        return {"message": "No assignments found"}, 404
+    """This function gets a page of the assignments in the database, see pagination.py for the limit, cursor, sort (id
+    or created_at) and stream parameters and projection.py for fields"""
+    try:
+        fields = assignment_fields.requested(
+            default=("id", "title", "total_marks", "course_id", "created_by", "created_at"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
 
-    return [
-        {
-            "id": a.id,
-            "title": a.title,
-            "total_marks": a.total_marks,
-            "course_id": a.course_id,
-            "created_by": a.created_by,
-            "created_at": a.created_at.isoformat() if a.created_at else None
-        }
-        for a in assignments
-    ], 200
+    return paginated_response(assignment_fields.query(fields), Assignment, assignment_fields.serializer(fields),
+                              sortable={"created_at": Assignment.created_at},
+                              empty=({"message": "No assignments found"}, 404))
 
 
 # Creating a new assignment using POST
@@ -65,6 +68,7 @@ def create_assignment():
 
 # Getting a specific assignment by ID using GET
 @assignments_bp.route("/<int:assignment_id>", methods=["GET"])
+@conditional(rows(Assignment, id="assignment_id"))
 def get_assignment(assignment_id):
     """This function returns a specific assignment by its ID"""
     assignment = Assignment.query.get(assignment_id)
@@ -126,53 +130,62 @@ def delete_assignment(assignment_id):
 
 # Getting all assignments for a specific course using GET
 @assignments_bp.route("/course/<int:course_id>", methods=["GET"])
+@conditional(rows(Assignment, course_id="course_id"))
 def get_assignments_by_course(course_id):
     """This function returns a list of all the assignments of a specific course using its ID."""
 
+    try:
+        fields = assignment_fields.requested(default=("id", "title", "total_marks"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
+
     # Filtering through the assignment database using the condition where course.id is course_id
-    assignments = Assignment.query.filter(Assignment.course_id == course_id).all()
+    assignments = assignment_fields.query(fields).filter(Assignment.course_id == course_id).all()
     if not assignments:
         return {"message": f"No assignments found for course ID {course_id}"}, 404
 
-    return [
-        {"id": a.id, "title": a.title, "total_marks": a.total_marks}
-        for a in assignments
-    ], 200
+    return [assignment_fields.serialize(a, fields) for a in assignments], 200
 
 
 # Searching assignments by keyword using GET
 @assignments_bp.route("/search", methods=["GET"])
 def search_assignments():
-    """This function searches the database for a particular assignment using its title."""
+    """This function searches the database for a particular assignment using its title, best matches first with a
+    highlighted snippet."""
 
     # Assigning default value of empty string("") to avoid crashing in case keyword isn't provided
     keyword = request.args.get("keyword", "")
     if not keyword:
         return {"error": "Please provide a search keyword"}, 400
 
-    # Searching through the database using the case-insensitive .ilike()
-    assignments = Assignment.query.filter(Assignment.title.ilike(f"%{keyword}%")).all()
+    try:
+        fields = assignment_fields.requested(default=("id", "title", "course_id"))
+        terms, limit = search_request(keyword)
+    except (FieldsError, SearchError) as e:
+        return {"error": str(e)}, 400
+
+    # Searching through the full-text index of the titles
+    assignments = SEARCH_INDEXES["assignments"].search(assignment_fields.query(fields), terms).limit(limit).all()
     if not assignments:
         return {"message": f"No assignments found matching '{keyword}'"}, 404
 
-    return [
-        {"id": a.id, "title": a.title, "course_id": a.course_id}
-        for a in assignments
-    ], 200
+    return [with_snippet(assignment_fields.serialize(a, fields), a) for a in assignments], 200
 
 
 # Getting all assignments created by a specific teacher
 @assignments_bp.route("/created-by/<int:user_id>", methods=["GET"])
 def get_assignments_by_creator(user_id):
     """This function gets a list of all the assignments created by a specific teacher"""
-    assignments = Assignment.query.filter(Assignment.created_by == user_id).all()
+    try:
+        fields = assignment_fields.requested(default=("id", "title", "course_id"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
+
+    assignments = assignment_fields.query(fields).filter(Assignment.created_by == user_id).all()
     if not assignments:
         return {"message": f"No assignments created by user ID {user_id}"}, 404
 
-    return [
-        {"id": a.id, "title": a.title, "course_id": a.course_id}
-        for a in assignments
-    ], 200
+    return [assignment_fields.serialize(a, fields) for a in assignments], 200
 
 
 # Getting count of assignments per course using GET
@@ -180,11 +193,11 @@ def get_assignments_by_creator(user_id):
 def assignments_per_course():
     """This function returns count of assignments per course"""
 
-    # A list of tuples which first extracts the Course ID, then counts the assignments after grouping by course IDs
+    # A list of (course ID, count) tuples read from the counter column of the courses which have assignments
     results = db.session.query(
-        Assignment.course_id,
-        func.count(Assignment.id)
-    ).group_by(Assignment.course_id).all()
+        Course.id,
+        Course.assignment_count
+    ).filter(Course.assignment_count > 0).order_by(Course.id).all()
 
     return {
         "assignments_per_course": [
@@ -2,33 +2,46 @@ from flask import request, Blueprint
 from sqlalchemy.exc import SQLAlchemyError
 
 from data_models import db, Course, Program, User
+from pagination import paginated_response
+from projection import Projection, FieldsError
+from search_index import SEARCH_INDEXES, SearchError, search_request, with_snippet
+from loader_profiles import with_profile
+from response_cache import cached
+from conditional import conditional, rows
 
 # Defining blueprint to be used in the app later
 courses_bp = Blueprint("courses",__name__)
 
+# The course columns the search endpoint selects, any of them can be asked for with ?fields=
+course_fields = Projection(Course, "id", "name", "code", "credit_hours", "program_id", "created_by", "created_at",
+                           "teacher_count", "student_count", "quiz_count", "assignment_count")
+
+def serialize_course(c):
+    """This function returns the dictionary of a course as listed by get_courses"""
+    return {
+        "id": c.id,
+        "name": c.name,
+        "code": c.code,
+        "credit_hours": c.credit_hours,
+        "program_id": c.program_id,
+        "created_by": c.created_by,
+        "teachers": [{"id": t.id, "name": t.name, "email": t.email} for t in c.teachers],
+        "students": [{"id": s.id, "name": s.name, "email": s.email} for s in c.students]
+    }
+
+
 # Getting a list of courses using GET
 @courses_bp.route("/", methods=["GET"])
+@conditional(Course, User)
+@cached("courses", "teacher_course", "student_course", "users")
 def get_courses():
-    """This function returns a list of all the available courses"""
-    courses = Course.query.all()
+    """This function returns a page of the available courses, see pagination.py for the limit, cursor, sort (id or
+    created_at) and stream parameters"""
+    courses = with_profile(Course.query, "courses.list")
 
     # Error handling in case of no courses in the database
-    if not courses:
-        return {"message": "No courses found"}, 200 # Used for GET(Successful fetch)
-
-    return [
-        {
-            "id": c.id,
-            "name": c.name,
-            "code": c.code,
-            "credit_hours": c.credit_hours,
-            "program_id": c.program_id,
-            "created_by": c.created_by,
-            "teachers": [{"id": t.id, "name": t.name, "email": t.email} for t in c.teachers],
-            "students": [{"id": s.id, "name": s.name, "email": s.email} for s in c.students]
-        }
-        for c in courses
-    ], 200
+    return paginated_response(courses, Course, serialize_course, sortable={"created_at": Course.created_at},
+                              empty=({"message": "No courses found"}, 200)) # Used for GET(Successful fetch)
 
 
 # Creating a new course using POST
@@ -69,6 +82,8 @@ def create_course():
 
 # Getting a course by its ID using GET
 @courses_bp.route("/<int:course_id>", methods=["GET"])
+@conditional(rows(Course, id="course_id"), User)
+@cached("courses:{course_id}", "users")
 def get_course(course_id):
     """This function returns a specific course based on its ID"""
     course = Course.query.get_or_404(course_id) # Using got_or_404() for automatic error handling
@@ -227,34 +242,50 @@ def remove_student(course_id, student_id):
 
 # Searching for a course by keyword using GET
 @courses_bp.route("/search", methods=["GET"])
+@cached("courses")
 def search_courses():
-    """This function searches for a course by its name or code"""
+    """This function searches for a course by its name or code, best matches first with a highlighted snippet"""
 
     # Assigning default value of empty string("") to avoid crashing in case keyword isn't provided
     keyword = request.args.get("keyword", "")
+    try:
+        fields = course_fields.requested(default=("id", "name", "code"))
+        terms, limit = search_request(keyword, required=False)
+    except (FieldsError, SearchError) as e:
+        return {"error": str(e)}, 400
 
-    # Searching through the database using the case-insensitive .ilike() and | operator
-    courses = Course.query.filter(
-        (Course.name.ilike(f"%{keyword}%")) | (Course.code.ilike(f"%{keyword}%"))
-    ).all()
+    # Searching through the full-text index of the names and codes, without a keyword every course is listed
+    query = course_fields.query(fields)
+    if terms:
+        query = SEARCH_INDEXES["courses"].search(query, terms)
+    courses = query.limit(limit).all()
 
     if not courses:
         return {"message": "No matching courses found"}, 200
 
-    return [{"id": c.id, "name": c.name, "code": c.code} for c in courses], 200
+    return [with_snippet(course_fields.serialize(c, fields), c) for c in courses], 200
 
 # Getting course statistics using GET
 @courses_bp.route("/<int:course_id>/stats", methods=["GET"])
+@cached("courses:{course_id}")
 def course_stats(course_id):
-    """This function gets the basic course statistics"""
-    course = Course.query.get(course_id)
-    if not course:
+    """This function gets the basic course statistics, read from the counter columns of the course row (see
+    counters.py)"""
+    stats = db.session.query(
+        Course.name,
+        Course.teacher_count.label("total_teachers"),
+        Course.student_count.label("total_students"),
+        Course.quiz_count.label("total_quizzes"),
+        Course.assignment_count.label("total_assignments")
+    ).filter(Course.id == course_id).first()
+
+    if not stats:
         return {"error": "Course not found"}, 404
 
     return {
-        "course": course.name,
-        "total_teachers": len(course.teachers),
-        "total_students": len(course.students),
-        "total_quizzes": len(course.quizzes),
-        "total_assignments": len(course.assignments),
+        "course": stats.name,
+        "total_teachers": stats.total_teachers,
+        "total_students": stats.total_students,
+        "total_quizzes": stats.total_quizzes,
+        "total_assignments": stats.total_assignments,
     }, 200
\ No newline at end of file
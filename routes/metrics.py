@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, request, current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from data_models import db, LLMCall, LLMCallStage
+from GenAIRequests.telemetry import percentile, cost_info_metrics
+import response_cache
+
+# Defining blueprint to be used in the app later
+metrics_bp = Blueprint("metrics", __name__)
+
+
+def record_llm_call(request_id, kind, cost_info, stages=None, total_latency_ms=None, cache_hit=False):
+    """This function stores the numeric telemetry of a generation request. It commits on its own and never raises, so a
+    telemetry failure can't fail the request that produced it"""
+    metrics = cost_info_metrics(cost_info)
+
+    call = LLMCall(
+        request_id=request_id,
+        kind=kind,
+        model_name=metrics["model_name"] or "unknown",
+        input_tokens=metrics["input_tokens"],
+        output_tokens=metrics["output_tokens"],
+        total_tokens=metrics["total_tokens"],
+        cached_tokens=metrics["cached_tokens"],
+        cost_usd=metrics["cost_usd"],
+        latency_ms=metrics["latency_s"] * 1000,
+        total_latency_ms=total_latency_ms,
+        cache_hit=bool(cache_hit),
+        stages=[LLMCallStage(stage=name, duration_ms=duration) for name, duration in (stages or {}).items()]
+    )
+
+    try:
+        db.session.add(call)
+        db.session.commit()
+    except SQLAlchemyError as err:
+        db.session.rollback()
+        print(f"Failed to record LLM telemetry: {err}")
+
+
+def _pct(values, pct):
+    """This function returns a percentile rounded to microseconds, or None for an empty list"""
+    value = percentile(values, pct)
+    return round(value, 3) if value is not None else None
+
+
+def _summarise(rows, window_hours):
+    """This function turns (latency_ms, total_latency_ms, cost_usd, total_tokens, output_tokens) rows into percentiles
+    and throughput figures"""
+    latencies = [r[0] for r in rows if r[0] is not None]
+    totals = [r[1] for r in rows if r[1] is not None]
+    llm_seconds = sum(latencies) / 1000
+
+    return {
+        "calls": len(rows),
+        "calls_per_hour": round(len(rows) / window_hours, 3) if window_hours else None,
+        "p50_latency_ms": _pct(latencies, 50),
+        "p95_latency_ms": _pct(latencies, 95),
+        "p99_latency_ms": _pct(latencies, 99),
+        "p50_total_latency_ms": _pct(totals, 50),
+        "p95_total_latency_ms": _pct(totals, 95),
+        "total_cost_usd": round(sum(r[2] or 0 for r in rows), 6),
+        "avg_cost_usd": round(sum(r[2] or 0 for r in rows) / len(rows), 6) if rows else None,
+        "total_tokens": sum(r[3] or 0 for r in rows),
+        "output_tokens_per_second": round(sum(r[4] or 0 for r in rows) / llm_seconds, 2) if llm_seconds else None,
+    }
+
+
+# Getting the aggregate latency, cost and throughput of the AI generation calls using GET
+@metrics_bp.route("/llm", methods=["GET"])
+def llm_metrics():
+    """This function returns latency percentiles, cost and throughput per model and per day, plus the percentiles of
+    every pipeline stage, for the last `days` days (default 7), optionally restricted to one model or kind"""
+    days = request.args.get("days", 7, type=int)
+    model_name = request.args.get("model")
+    kind = request.args.get("kind")
+
+    # created_at is filled by SQLite's CURRENT_TIMESTAMP which is a naive UTC time
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).replace(tzinfo=None)
+
+    filters = [LLMCall.created_at >= since]
+    if model_name:
+        filters.append(LLMCall.model_name == model_name)
+    if kind:
+        filters.append(LLMCall.kind == kind)
+
+    query = db.session.query(
+        LLMCall.model_name,
+        db.func.date(LLMCall.created_at),
+        LLMCall.latency_ms,
+        LLMCall.total_latency_ms,
+        LLMCall.cost_usd,
+        LLMCall.total_tokens,
+        LLMCall.output_tokens
+    ).filter(*filters)
+
+    per_model = defaultdict(list)
+    per_day = defaultdict(list)
+    for model, day, *values in query.yield_per(1000):
+        per_model[model].append(values)
+        per_day[(day, model)].append(values)
+
+    # Per-stage durations so a regression can be pinned to retrieval, prompt assembly, an LLM call, persistence...
+    stage_query = db.session.query(
+        LLMCall.model_name,
+        LLMCallStage.stage,
+        LLMCallStage.duration_ms
+    ).join(LLMCall, LLMCallStage.call_id == LLMCall.id).filter(*filters)
+
+    per_stage = defaultdict(list)
+    for model, stage, duration in stage_query.yield_per(1000):
+        per_stage[(model, stage)].append(duration)
+
+    return {
+        "window_days": days,
+        "per_model": [
+            {"model_name": model, **_summarise(rows, days * 24)}
+            for model, rows in sorted(per_model.items())
+        ],
+        "per_day": [
+            {"day": day, "model_name": model, **_summarise(rows, 24)}
+            for (day, model), rows in sorted(per_day.items())
+        ],
+        "per_stage": [
+            {
+                "model_name": model,
+                "stage": stage,
+                "calls": len(durations),
+                "avg_ms": round(sum(durations) / len(durations), 3),
+                "p50_ms": _pct(durations, 50),
+                "p95_ms": _pct(durations, 95),
+                "p99_ms": _pct(durations, 99)
+            }
+            for (model, stage), durations in sorted(per_stage.items())
+        ]
+    }, 200
+
+
+# Getting the hit ratio and latencies of the response cache using GET
+@metrics_bp.route("/cache", methods=["GET"])
+def cache_metrics():
+    """This function returns the hits, misses, hit ratio and hit/miss latency percentiles of every cached endpoint
+    since the process started (or the last reset=1)"""
+    summary = response_cache.stats.summary()
+    if request.args.get("reset", "").lower() in ("1", "true", "yes"):
+        response_cache.stats.reset()
+
+    return {"store": current_app.config.get("RESPONSE_CACHE"), "endpoints": summary}, 200
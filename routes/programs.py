@@ -2,32 +2,46 @@ from flask import request, Blueprint
 from sqlalchemy.exc import SQLAlchemyError
 
 from data_models import db, Program, User
+from loader_profiles import with_profile
+from pagination import paginated_response
+from projection import Projection, FieldsError
+from search_index import SEARCH_INDEXES, SearchError, search_request, with_snippet
+from response_cache import cached
+from conditional import conditional, rows
 
 # Defining blueprint to be used in the app later
 programs_bp = Blueprint("programs",__name__)
 
+# The program columns the search endpoint selects, any of them can be asked for with ?fields=
+program_fields = Projection(Program, "id", "name", "description", "created_by", "created_at", "course_count")
+
 # Getting a list of all programs using GET
 @programs_bp.route("/", methods=["GET"])
+@conditional(Program, User)
+@cached("programs", "teacher_program", "student_program", "users")
 def get_programs():
-    """This function returns a list of dictionaries of all programs showing their ID, Name and small description"""
-    programs = Program.query.all()
-
-    if not programs:
-        return  {"error": "Sorry no programs have been added to the database"}
-    else:
-        return [
-            {
-                "id": prog.id, 
-                "name": prog.name, 
-                "description": prog.description,
-                "teachers": [{"id": t.id, "name": t.name, "email": t.email} for t in prog.teachers],
-                "students": [{"id": s.id, "name": s.name, "email": s.email} for s in prog.students]
-            }
-            for prog in programs
-        ], 200
+    """This function returns a page of dictionaries of the programs showing their ID, Name and small description, see
+    pagination.py for the limit, cursor, sort (id or created_at) and stream parameters"""
+    programs = with_profile(Program.query, "programs.list")
+
+    return paginated_response(programs, Program, serialize_program, sortable={"created_at": Program.created_at},
+                              empty={"error": "Sorry no programs have been added to the database"})
+
+
+def serialize_program(prog):
+    """This function returns the dictionary of a program as listed by get_programs"""
+    return {
+        "id": prog.id,
+        "name": prog.name,
+        "description": prog.description,
+        "teachers": [{"id": t.id, "name": t.name, "email": t.email} for t in prog.teachers],
+        "students": [{"id": s.id, "name": s.name, "email": s.email} for s in prog.students]
+    }
 
 # Getting a program by its ID using GET
 @programs_bp.route("/<int:program_id>")
+@conditional(rows(Program, id="program_id"), User)
+@cached("programs:{program_id}", "teacher_program", "student_program", "users")
 def get_program(program_id):
     """This function gets a program by its ID"""
     program = Program.query.get_or_404(program_id) # Using got_or_404() for automatic error handling
@@ -184,30 +198,41 @@ def delete_program(program_id):
 
 # Searching for a specific program by name using GET
 @programs_bp.route("/search", methods=["GET"])
+@cached("programs")
 def search_program():
-    """This function searches for a program by its name"""
+    """This function searches for a program by its name or description, best matches first with a highlighted
+    snippet"""
 
     # Assigning default value of empty string("") to avoid crashing in case keyword isn't provided
     keyword = request.args.get("keyword", "")
+    try:
+        fields = program_fields.requested(default=("id", "name", "description"))
+        terms, limit = search_request(keyword, required=False)
+    except (FieldsError, SearchError) as e:
+        return {"error": str(e)}, 400
 
-    # Searching through the database using the case-insensitive .ilike()
-    programs = Program.query.filter(Program.name.ilike(f"%{keyword}%")).all()
-    return [
-        {"id": p.id, "name": p.name, "description": p.description}
-        for p in programs
-    ], 200
+    # Searching through the full-text index of the names and descriptions, without a keyword every program is listed
+    query = program_fields.query(fields)
+    if terms:
+        query = SEARCH_INDEXES["programs"].search(query, terms)
+    programs = query.limit(limit).all()
+    return [with_snippet(program_fields.serialize(p, fields), p) for p in programs], 200
 
 
 # Course count in each program fetched using GET
 @programs_bp.route("/program-course-counts", methods=["GET"])
+@cached("programs")
 def programs_with_course_counts():
-    programs = Program.query.all()
+    """This function returns every program with its number of courses, read from its counter column (see
+    counters.py)"""
+    programs = db.session.query(Program.id, Program.name, Program.description, Program.course_count).all()
+
     return [
         {
             "id": p.id,
             "name": p.name,
             "description": p.description,
-            "course_count": len(p.courses)
+            "course_count": p.course_count
         }
         for p in programs
     ], 200
\ No newline at end of file
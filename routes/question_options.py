@@ -2,28 +2,29 @@ from flask import Blueprint, request
 from sqlalchemy.exc import SQLAlchemyError
 
 from data_models import db, QuestionOption, Question
+from pagination import paginated_response
+from projection import Projection, FieldsError
+from conditional import conditional, rows
 
 # Defining blueprint to be used in the app later
 question_options_bp = Blueprint("question_options", __name__)
 
+# The option columns the list endpoints select, any of them can be asked for with ?fields=
+option_fields = Projection(QuestionOption, "id", "question_id", "option_text", "is_correct", "order_index")
+
 # Getting all options using GET
 @question_options_bp.route("/", methods=["GET"])
+@conditional(QuestionOption)
 def get_all_options():
-    """This function returns a list of all the options available for all the questions"""
-    options = QuestionOption.query.all()
-    if not options:
-        return {"message": "No question options found"}, 404
+    """This function returns a page of the options available for all the questions, see pagination.py for the limit,
+    cursor, sort and stream parameters and projection.py for fields"""
+    try:
+        fields = option_fields.requested(default=("id", "question_id", "option_text", "is_correct", "order_index"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
 
-    return [
-        {
-            "id": opt.id,
-            "question_id": opt.question_id,
-            "option_text": opt.option_text,
-            "is_correct": opt.is_correct,
-            "order_index": opt.order_index
-        }
-        for opt in options
-    ], 200
+    return paginated_response(option_fields.query(fields), QuestionOption, option_fields.serializer(fields),
+                              empty=({"message": "No question options found"}, 404))
 
 
 # Creating a new option in the Database
@@ -53,6 +54,7 @@ def create_option():
 
 # Getting an option by ID using GET
 @question_options_bp.route("/<int:option_id>", methods=["GET"])
+@conditional(rows(QuestionOption, id="option_id"))
 def get_option(option_id):
     """This function returns a specific option using its ID"""
     opt = QuestionOption.query.get(option_id)
@@ -110,19 +112,17 @@ def delete_option(option_id):
 
 # Getting all options for a question using GET
 @question_options_bp.route("/question/<int:question_id>", methods=["GET"])
+@conditional(rows(QuestionOption, question_id="question_id"))
 def get_options_by_question(question_id):
     """This function returns all the available options for a question using the question_id as a list"""
 
-    options = QuestionOption.query.filter_by(question_id=question_id).all()
+    try:
+        fields = option_fields.requested(default=("id", "option_text", "is_correct", "order_index"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
+
+    options = option_fields.query(fields).filter(QuestionOption.question_id == question_id).all()
     if not options:
         return {"message": f"No options found for question ID {question_id}"}, 404
 
-    return [
-        {
-            "id": opt.id,
-            "option_text": opt.option_text,
-            "is_correct": opt.is_correct,
-            "order_index": opt.order_index
-        }
-        for opt in options
-    ], 200
+    return [option_fields.serialize(opt, fields) for opt in options], 200
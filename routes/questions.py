@@ -2,16 +2,25 @@ from flask import Blueprint, request
 from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
 
-from data_models import db, Question, Quiz, Assignment, User, QuestionOption
+from data_models import db, Question, QuestionOption, Quiz, Assignment, User
+from quiz_persistence import insert_questions
+from question_import import RowError, iter_rows, batched, check_references
+from pagination import paginated_response
+from response_cache import cached
+from search_index import SEARCH_INDEXES, SearchError, match_query, search_request
+from conditional import conditional, rows
 
 # Defining blueprint to be used in the app later
 questions_bp = Blueprint("questions",__name__)
 
 # Getting a list of all questions using GET
 @questions_bp.route('/', methods=['GET'])
+@conditional(Question)
+@cached("questions")
 def get_questions():
-    """This function gets a list of all the questions with optional filters based on quiz_id, assignment_id, created_by,
-    question_type, min or max marks and keywords"""
+    """This function gets a page of the questions with optional filters based on quiz_id, assignment_id, created_by,
+    question_type, min or max marks and keywords, see pagination.py for the limit, cursor, sort (id or created_at) and
+    stream parameters"""
 
     quiz_id = request.args.get("quiz_id")
     assignment_id = request.args.get("assignment_id")
@@ -22,6 +31,8 @@ def get_questions():
     max_marks = request.args.get("max_marks", type=int)
 
 
+    # The option and answer counts are counter columns of the question (see counters.py), the options and answers
+    # themselves are never loaded
     query = Question.query
 
     if quiz_id:
@@ -37,7 +48,11 @@ def get_questions():
         query = query.filter(Question.question_type.ilike(question_type))
 
     if contains:
-        query = query.filter(Question.question_text.ilike(f"%{contains}%"))
+        # Full-text lookup of the matching ids (see search_index.py), the page keeps its id or created_at order
+        terms = match_query(contains)
+        if terms is None:
+            return {"error": "The contains filter has no word to search for."}, 400
+        query = query.filter(Question.id.in_(SEARCH_INDEXES["questions"].matching_ids(terms)))
 
     if min_marks is not None:
         query = query.filter(Question.marks >= min_marks)
@@ -45,9 +60,12 @@ def get_questions():
     if max_marks is not None:
         query = query.filter(Question.marks <= max_marks)
 
-    questions = query.all()
+    return paginated_response(query, Question, serialize_question, sortable={"created_at": Question.created_at})
 
-    return [{
+
+def serialize_question(q):
+    """This function returns the dictionary of a question as listed by get_questions"""
+    return {
         "id": q.id,
         "question_text": q.question_text,
         "question_type": q.question_type,
@@ -56,9 +74,9 @@ def get_questions():
         "assignment_id": q.assignment_id,
         "created_by": q.created_by,
         "created_at": q.created_at.isoformat() if q.created_at else None,
-        "options_count": len(q.options),
-        "student_answers_count": len(q.student_answers)
-    } for q in questions], 200
+        "options_count": q.option_count,
+        "student_answers_count": q.answer_count
+    }
 
 
 # Creating a new question using POST
@@ -71,41 +89,110 @@ def create_question():
     if not data or "question_text" not in data:
         return {"error": "Missing required field 'question_text'."}, 400
 
-    new_question = Question(
-        question_text=data["question_text"],
-        question_type=data.get("question_type", "text"),
-        marks=data.get("marks"),
-        quiz_id=data.get("quiz_id"),
-        assignment_id=data.get("assignment_id"),
-        created_by=data.get("created_by")
-    )
+    # The question and its MCQ options (if any) go in as batched inserts within one transaction
+    new_question = {
+        "question_text": data["question_text"],
+        "question_type": data.get("question_type", "text"),
+        "marks": data.get("marks"),
+        "quiz_id": data.get("quiz_id"),
+        "assignment_id": data.get("assignment_id"),
+        "created_by": data.get("created_by"),
+        "reference_answer": data.get("reference_answer"),
+        "options": data.get("options", [])
+    }
 
     try:
-        db.session.add(new_question)
-        db.session.flush() # creates the new_question ID but not commiting yet as we have to check if it has the MCQ options
-
+        new_question_id = insert_questions([new_question])[0]
+        db.session.commit()
+        return {"message": "Question created successfully", "id": new_question_id}, 201
     except SQLAlchemyError:
         db.session.rollback()
         return {"error": "Database conflict occurred while creating the question."}, 409
 
 
-    # If the question is an MCQ type
-    options = data.get("options", [])
-    for idx, opt in enumerate(options):
-        option = QuestionOption(
-            question_id=new_question.id,
-            option_text=opt.get("option_text"),
-            is_correct=opt.get("is_correct", False),
-            order_index=idx
-        )
-        db.session.add(option)
+# Importing a question bank in bulk using POST
+@questions_bp.route("/import", methods=["POST"])
+def import_questions():
+    """This function imports questions and their options from a JSON Lines or CSV upload, sent either as the raw request
+    body or as a multipart 'file'. Rows are parsed as a stream and inserted in batched transactions, an invalid row is
+    reported back by its row number without stopping the rest of the import. Optional query parameters are format
+    (jsonl or csv), batch_size, max_errors and quiz_id, assignment_id, created_by, question_type as row defaults"""
+
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    filename = (upload.filename or "") if upload else ""
+    content_type = (upload.mimetype if upload else request.mimetype) or ""
+
+    file_format = (request.args.get("format") or "").lower()
+    if not file_format:
+        file_format = "csv" if filename.lower().endswith(".csv") or "csv" in content_type else "jsonl"
+    if file_format not in ("jsonl", "csv"):
+        return {"error": "format must be 'jsonl' or 'csv'."}, 400
+
+    batch_size = min(max(request.args.get("batch_size", 500, type=int), 1), 5000)
+    max_errors = max(request.args.get("max_errors", 100, type=int), 0)
+    defaults = {
+        "quiz_id": request.args.get("quiz_id", type=int),
+        "assignment_id": request.args.get("assignment_id", type=int),
+        "created_by": request.args.get("created_by", type=int),
+        "question_type": request.args.get("question_type", "text")
+    }
+
+    imported = 0
+    failed = 0
+    batches = 0
+    errors = []
+
+    def report(row_no, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < max_errors:
+            errors.append({"row": row_no, "error": message})
 
     try:
-        db.session.commit()
-        return {"message": "Question created successfully", "id": new_question.id}, 201
-    except SQLAlchemyError:
-        db.session.rollback()
-        return {"error": "Database conflict occurred while creating the question."}, 409
+        for batch in batched(iter_rows(stream, file_format, defaults), batch_size):
+            valid = []
+            for row_no, row in batch:
+                if isinstance(row, RowError):
+                    report(row_no, str(row))
+                else:
+                    valid.append((row_no, row))
+            valid, invalid = check_references(valid)
+            for row_no, error in invalid:
+                report(row_no, str(error))
+            if not valid:
+                continue
+
+            batches += 1
+            try:
+                insert_questions([row for _, row in valid])
+                db.session.commit()
+                imported += len(valid)
+            except SQLAlchemyError:
+                db.session.rollback()
+                # Retrying the batch one row at a time so only the offending rows are rejected
+                for row_no, row in valid:
+                    try:
+                        insert_questions([row])
+                        db.session.commit()
+                        imported += 1
+                    except SQLAlchemyError:
+                        db.session.rollback()
+                        report(row_no, "Database conflict occurred while importing the row.")
+
+    except RowError as e:
+        return {"error": str(e), "imported": imported}, 400
+    except UnicodeDecodeError:
+        return {"error": "The upload must be UTF-8 encoded.", "imported": imported}, 400
+
+    return {
+        "message": f"Imported {imported} questions, {failed} rows failed",
+        "imported": imported,
+        "failed": failed,
+        "batches": batches,
+        "errors": errors,
+        "errors_truncated": failed > len(errors)
+    }, 200
 
 
 # Updating a question using PUT
@@ -119,6 +206,7 @@ def update_question(question_id):
     question.question_text = data.get("question_text", question.question_text)
     question.question_type = data.get("question_type", question.question_type)
     question.marks = data.get("marks", question.marks)
+    question.reference_answer = data.get("reference_answer", question.reference_answer)
     question.quiz_id = data.get("quiz_id", question.quiz_id)
     question.assignment_id = data.get("assignment_id", question.assignment_id)
 
@@ -149,6 +237,8 @@ def delete_question(question_id):
 
 # Getting a question using GET
 @questions_bp.route("/<int:question_id>", methods=["GET"])
+@conditional(rows(Question, id="question_id"), rows(QuestionOption, question_id="question_id"))
+@cached("questions:{question_id}", "question_options")
 def get_question_by_id(question_id):
     """This function returns a question based on its ID along with its question fields, list of options and count of answers"""
 
@@ -159,6 +249,7 @@ def get_question_by_id(question_id):
         "question_text": q.question_text,
         "question_type": q.question_type,
         "marks": q.marks,
+        "reference_answer": q.reference_answer,
         "quiz_id": q.quiz_id,
         "assignment_id": q.assignment_id,
         "created_by": q.created_by,
@@ -172,15 +263,16 @@ def get_question_by_id(question_id):
             }
             for opt in q.options
         ],
-        "student_answers_count": len(q.student_answers)
+        "student_answers_count": q.answer_count
     }, 200
 
 
 # Searching for a questions using GET
 @questions_bp.route("/search", methods=["GET"])
+@cached("questions")
 def search_questions():
-    """This function searches inside the question_text parameter, optional filters can be question_type, min_marks or
-    max_marks"""
+    """This function searches inside the question_text parameter through its full-text index, best matches first with
+    a highlighted snippet, optional filters can be question_type, min_marks or max_marks"""
 
     keyword = request.args.get("q")
     q_type = request.args.get("type")
@@ -190,9 +282,12 @@ def search_questions():
     if not keyword:
         return {"error": "Missing search query 'q'."}, 400
 
-    query = Question.query.filter(
-        Question.question_text.ilike(f"%{keyword}%")
-    )
+    try:
+        terms, limit = search_request(keyword)
+    except SearchError as e:
+        return {"error": str(e)}, 400
+
+    query = SEARCH_INDEXES["questions"].search(Question.query, terms)
 
     if q_type:
         query = query.filter(Question.question_type.ilike(q_type))
@@ -203,7 +298,7 @@ def search_questions():
     if max_marks is not None:
         query = query.filter(Question.marks <= max_marks)
 
-    results = query.all()
+    results = query.limit(limit).all()
 
     if not results:
         return {"message": "No questions found"}, 404
@@ -212,12 +307,14 @@ def search_questions():
         "id": q.id,
         "question_text": q.question_text,
         "question_type": q.question_type,
-        "marks": q.marks
-    } for q in results], 200
+        "marks": q.marks,
+        "snippet": snippet
+    } for q, snippet in results], 200
 
 
 # Counting the questions using GET
 @questions_bp.route("/count", methods=["GET"])
+@cached("questions")
 def count_questions():
     """This function returns count of questions grouped by question_type"""
 
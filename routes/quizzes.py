@@ -1,10 +1,22 @@
-from flask import request, Blueprint, jsonify
+from flask import request, Blueprint, jsonify, current_app
 from sqlalchemy.exc import SQLAlchemyError
+from langchain_community.callbacks import get_openai_callback
 import os
+import uuid
 
-from data_models import db, Quiz, Course, User, Question, QuestionOption
-from GenAIRequests.RAG_Requests import generate_quiz_with_rag, setup_rag_components
+from data_models import db, Quiz, Course, User
+from GenAIRequests.RAG_Requests import generate_quiz_with_rag, setup_rag_components, callback_cost
 from GenAIRequests.quiz_ai_requests import QuizRequest, QuizResponse, generate_quiz
+from GenAIRequests.model_router import ModelRouter
+from GenAIRequests.telemetry import StageTimer
+from routes.metrics import record_llm_call
+from quiz_persistence import insert_quiz, generated_mcq_rows
+from pagination import paginated_response
+from projection import Projection, FieldsError
+from search_index import SEARCH_INDEXES, SearchError, search_request, with_snippet
+from response_cache import cached
+from conditional import conditional, rows
+from quiz_delivery import delivery_cache, quiz_version
 
 # Defining blueprint to be used in the app later
 quizzes_bp = Blueprint("quizzes",__name__)
@@ -15,6 +27,13 @@ rag_model = None
 current_rag_model_name = None
 current_rag_temperature = None
 
+# Router which learns the latency and cost of every model from the cost_info of each generation call
+model_router = ModelRouter()
+
+# The quiz columns the list endpoints select, any of them can be asked for with ?fields=
+quiz_fields = Projection(Quiz, "id", "title", "total_marks", "due_date", "course_id", "created_by", "created_at",
+                         "question_count")
+
 @quizzes_bp.route("/generate-ai", methods=["POST"])
 def generate_ai_quiz():
     """This function uses AI (RAG or standard LLM) to generate a quiz"""
@@ -27,10 +46,20 @@ def generate_ai_quiz():
     use_rag = data.get("use_rag", False)
     model_name = data.get("model_name", "gpt-4.1-mini")
     temperature = float(data.get("temperature", 0.3))
+
+    # With model_name "auto" the router picks the model within the optional latency (seconds) and cost (USD) SLO
+    auto_route = model_name == "auto"
+    max_latency = float(data["max_latency"]) if data.get("max_latency") is not None else None
+    max_cost = float(data["max_cost"]) if data.get("max_cost") is not None else None
+    if auto_route and use_rag:
+        model_name = model_router.choose(max_latency, max_cost)
     
     # Start tracking TOTAL latency for the whole request
     import time
     total_start = time.perf_counter()
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    timer = StageTimer() # per-stage durations in milliseconds, returned in costs and stored in the telemetry table
+    cache_hit = False
     
     try:
         req = QuizRequest(
@@ -43,117 +72,135 @@ def generate_ai_quiz():
         
         if use_rag:
             # Initialize RAG components
+            cache_hit = True
             if (rag_retriever is None or rag_model is None or 
                 current_rag_model_name != model_name or current_rag_temperature != temperature):
+                cache_hit = False
                 try:
-                    rag_retriever, rag_model = setup_rag_components(model_name, temperature)
+                    rag_retriever, rag_model = setup_rag_components(model_name, temperature, timer)
                     current_rag_model_name = model_name
                     current_rag_temperature = temperature
                 except Exception as e:
                     return {"error": f"Failed to initialize RAG: {str(e)}"}, 500
 
             model_with_structure = rag_model.with_structured_output(QuizResponse)
-            quiz_raw, costs = generate_quiz_with_rag(req, rag_retriever, rag_model)
+            quiz_raw, costs = generate_quiz_with_rag(req, rag_retriever, rag_model, timer)
+            model_router.record(costs, model_name)
             
             # Convert to structured output
             # Passing quiz_raw.content to ensure we only send the text
-            response = model_with_structure.invoke(f"Convert the following quiz into the structured QuizResponse format:\n\n{quiz_raw.content}")
-            result = response.model_dump()
+            with timer.span("llm_structuring"), get_openai_callback() as cb:
+                response = model_with_structure.invoke(f"Convert the following quiz into the structured QuizResponse format:\n\n{quiz_raw.content}")
+            with timer.span("validation"):
+                result = response.model_dump()
             
             # Use the latency from the GenAIRequests file as requested
             result["costs"] = costs
+
+            # The telemetry row covers both LLM calls of the RAG path
+            spans = timer.as_dict()
+            telemetry_costs = dict(
+                costs,
+                prompt_tokens=costs["prompt_tokens"] + cb.prompt_tokens,
+                completion_tokens=costs["completion_tokens"] + cb.completion_tokens,
+                total_tokens=costs["total_tokens"] + cb.total_tokens,
+                cached_tokens=costs.get("cached_tokens", 0) + getattr(cb, "prompt_tokens_cached", 0),
+                cost_usd=float(costs["cost_usd"]) + callback_cost(cb, rag_model.model_name),
+                latency_ms=spans["llm"] + spans["llm_structuring"]
+            )
             
         else:
             # Standard LLM Generation
-            quiz_obj, costs = generate_quiz(req, model_name, temperature)
-            result = quiz_obj.model_dump()
+            if auto_route:
+                # Every attempt times itself, only the stages of the call which won are kept (a hedged request runs
+                # two calls and the losing one may still be running)
+                quiz_obj, costs = model_router.call(
+                    lambda name: generate_quiz(req, name, temperature, StageTimer()),
+                    max_latency_s=max_latency,
+                    max_cost_usd=max_cost,
+                    hedge=bool(data.get("hedge", False))
+                )
+                timer.merge(costs["stages"])
+            else:
+                quiz_obj, costs = generate_quiz(req, model_name, temperature, timer)
+                model_router.record(costs, model_name)
+            with timer.span("validation"):
+                result = quiz_obj.model_dump()
             
             # Use the costs (including latency) from the GenAIRequests file
             result["costs"] = costs
+            telemetry_costs = costs
 
         # Ensure we are using the "latency" key specifically from the costs dict
         # The user specifically asked to take the value from the latency parameter in those files
         # We already updated those files to use the key "latency"
         
         # --- SAVE TO DB START ---
+        persistence_start = time.perf_counter()
         try:
             # Defaulting to first course and admin user if not provided
             course_id = data.get('course_id', 1) 
             created_by = data.get('created_by', 1)
             
-            # Create Quiz
-            new_quiz = Quiz(
-                title=result.get('title', data['topic']),
+            # Create the Quiz, its Questions and their Options in batched inserts, no flush per row
+            quiz_title = result.get('title', data['topic'])
+            new_quiz_id, _ = insert_quiz(
+                title=quiz_title,
                 total_marks=result.get('total_marks', int(data.get('total_marks', 10))),
                 course_id=course_id,
-                created_by=created_by
+                created_by=created_by,
+                questions=generated_mcq_rows(result.get('questions', []))
             )
-            db.session.add(new_quiz)
-            db.session.flush() # To get new_quiz.id
-            
-            # Create Questions
-            for q_data in result.get('questions', []):
-                new_question = Question(
-                    quiz_id=new_quiz.id,
-                    question_text=q_data.get('question'), # Matches Pydantic 'question' field
-                    question_type='multiple_choice', # Default for this generator
-                    marks=1, # Default 1 mark per question
-                    created_by=created_by
-                )
-                db.session.add(new_question)
-                db.session.flush()
-                
-                # Create Options
-                correct_ans = q_data.get('correct_answer', '').strip().lower()
-                
-                for opt_text in q_data.get('options', []):
-                    # Simple string comparison for correctness
-                    is_correct = (opt_text.strip().lower() == correct_ans)
-                    
-                    new_option = QuestionOption(
-                        question_id=new_question.id,
-                        option_text=opt_text,
-                        is_correct=is_correct
-                    )
-                    db.session.add(new_option)
             
             db.session.commit()
-            print(f"Quiz '{new_quiz.title}' saved to DB with ID: {new_quiz.id}")
-            result["saved_id"] = new_quiz.id
+            print(f"Quiz '{quiz_title}' saved to DB with ID: {new_quiz_id}")
+            result["saved_id"] = new_quiz_id
             
         except Exception as db_err:
             print(f"Failed to save generated quiz to DB: {db_err}")
             db.session.rollback()
             result["db_error"] = str(db_err)
+        timer.add("persistence", (time.perf_counter() - persistence_start) * 1000)
         # --- SAVE TO DB END ---
+
+        total_latency_ms = (time.perf_counter() - total_start) * 1000
+        result["costs"]["request_id"] = request_id
+        result["costs"]["stages"] = timer.as_dict()
+        record_llm_call(request_id, "quiz_rag" if use_rag else "quiz", telemetry_costs, timer.as_dict(),
+                        total_latency_ms, cache_hit)
         
         return jsonify(result), 200
     except Exception as e:
         return {"error": str(e)}, 500
 
+# Getting the rolling latency and cost stats the model router uses using GET
+@quizzes_bp.route("/model-router", methods=["GET"])
+def get_model_router_stats():
+    """This function returns the rolling p50/p95 latency and average cost per model as seen by the router"""
+    return model_router.snapshot(), 200
+
+
 # Getting all quizzes using GET
 @quizzes_bp.route("/", methods=["GET"])
+@conditional(Quiz)
+@cached("quizzes")
 def get_quizzes():
-    """This function returns a list of all quizzes"""
-    quizzes = Quiz.query.all()
-    if not quizzes:
-        return {"message": "No quizzes found"}, 404
+    """This function returns a page of quizzes, see pagination.py for the limit, cursor, sort (id or created_at) and
+    stream parameters and projection.py for fields"""
+    try:
+        fields = quiz_fields.requested(default=("id", "title", "total_marks", "course_id", "created_by", "created_at"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
 
-    return [
-        {
-            "id": q.id,
-            "title": q.title,
-            "total_marks": q.total_marks,
-            "course_id": q.course_id,
-            "created_by": q.created_by,
-            "created_at": q.created_at.isoformat() if q.created_at else None # returning a standardized ISO Format of date and time
-        }
-        for q in quizzes
-    ], 200
+    # created_at is returned in the standardized ISO Format of date and time
+    return paginated_response(quiz_fields.query(fields), Quiz, quiz_fields.serializer(fields),
+                              sortable={"created_at": Quiz.created_at}, empty=({"message": "No quizzes found"}, 404))
 
 
 # Getting a specific quiz using its IT and GET
 @quizzes_bp.route("/<int:quiz_id>", methods=["GET"])
+@conditional(rows(Quiz, id="quiz_id"))
+@cached("quizzes:{quiz_id}")
 def get_quiz(quiz_id):
     """This function returns a specific quiz by its ID"""
     quiz = Quiz.query.get(quiz_id)
@@ -166,10 +213,32 @@ def get_quiz(quiz_id):
         "total_marks": quiz.total_marks,
         "course_id": quiz.course_id,
         "created_by": quiz.created_by,
-        "created_at": quiz.created_at.isoformat() if quiz.created_at else None
+        "created_at": quiz.created_at.isoformat() if quiz.created_at else None,
+        "question_count": quiz.question_count
     }, 200
 
 
+# Delivering a quiz to the students taking it using GET
+@quizzes_bp.route("/<int:quiz_id>/delivery", methods=["GET"])
+def deliver_quiz(quiz_id):
+    """This function returns the quiz with all its questions and their options, without the correct answers, from the
+    payload cached for the current version of the quiz (see quiz_delivery.py)"""
+    version = quiz_version(quiz_id)
+    payload = delivery_cache.payload(quiz_id, version) if version is not None else None
+    if payload is None:
+        return {"error": "Quiz not found"}, 404
+
+    # The students keep the payload and revalidate it with its ETag, which changes with the version
+    headers = {"ETag": f'"{payload.etag}"', "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(payload.etag):
+        return current_app.response_class(status=304, headers=headers)
+
+    if "gzip" in request.accept_encodings:
+        headers["Content-Encoding"] = "gzip"
+        return current_app.response_class(payload.gzipped, mimetype="application/json", headers=headers)
+    return current_app.response_class(payload.body, mimetype="application/json", headers=headers)
+
+
 # Creating a new quiz using POST
 @quizzes_bp.route("/", methods=["POST"])
 def create_quiz():
@@ -247,36 +316,47 @@ def delete_quiz(quiz_id):
 
 
 @quizzes_bp.route("/search", methods=["GET"])
+@cached("quizzes")
 def search_quizzes():
-    """This function searches the database for a particular quiz using its title."""
+    """This function searches the database for a particular quiz using its title, best matches first with a
+    highlighted snippet."""
 
     # Assigning default value of empty string("") to avoid crashing in case keyword isn't provided
     keyword = request.args.get("keyword", "")
+    try:
+        fields = quiz_fields.requested(default=("id", "title", "total_marks"))
+        terms, limit = search_request(keyword, required=False)
+    except (FieldsError, SearchError) as e:
+        return {"error": str(e)}, 400
 
-    # Searching through the database using the case-insensitive .ilike()
-    quizzes = Quiz.query.filter(Quiz.title.ilike(f"%{keyword}%")).all()
+    # Searching through the full-text index of the titles, without a keyword every quiz is listed
+    query = quiz_fields.query(fields)
+    if terms:
+        query = SEARCH_INDEXES["quizzes"].search(query, terms)
+    quizzes = query.limit(limit).all()
 
     if not quizzes:
         return {"message": "No quizzes found for the given keyword"}, 404
 
-    return [
-        {"id": q.id, "title": q.title, "total_marks": q.total_marks}
-        for q in quizzes
-    ], 200
+    return [with_snippet(quiz_fields.serialize(q, fields), q) for q in quizzes], 200
 
 
 # Getting all quizzes for a specific course using GET
 @quizzes_bp.route("/course/<int:course_id>", methods=["GET"])
+@conditional(rows(Quiz, course_id="course_id"))
+@cached("quizzes")
 def get_quizzes_by_course(course_id):
     """This function returns a list of all the quizzes of a specific course using its ID."""
 
+    try:
+        fields = quiz_fields.requested(default=("id", "title", "total_marks"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
+
     # Filtering through the quiz database using the condition where course.id is course_id
-    quizzes = Quiz.query.filter(Quiz.course_id == course_id).all()
+    quizzes = quiz_fields.query(fields).filter(Quiz.course_id == course_id).all()
 
     if not quizzes:
         return {"message": "No quizzes found for this course"}, 404
 
-    return [
-        {"id": q.id, "title": q.title, "total_marks": q.total_marks}
-        for q in quizzes
-    ], 200
+    return [quiz_fields.serialize(q, fields) for q in quizzes], 200
@@ -0,0 +1,54 @@
+from flask import request, Blueprint
+
+from data_models import db
+from search_index import DOCUMENT_SOURCES, SearchError, search_documents, search_request
+
+# Defining blueprint to be used in the app later
+search_bp = Blueprint("search", __name__)
+
+
+# Searching every entity at once using GET
+@search_bp.route("/", methods=["GET"], strict_slashes=False)
+def search_everything():
+    """This function searches the questions, quizzes, assignments, courses, programs and users together through the
+    unified full-text index (see search_index.py). It returns the hits of all the types ranked together, best first,
+    with the number of hits of every type as facets. Optional parameters are type (a comma separated list of types to
+    return), limit and offset"""
+
+    keyword = request.args.get("q")
+    if not keyword:
+        return {"error": "Missing search query 'q'."}, 400
+
+    types = [name.strip() for name in request.args.get("type", "").split(",") if name.strip()]
+    unknown = [name for name in types if name not in DOCUMENT_SOURCES]
+    if unknown:
+        return {"error": f"Unknown type {', '.join(unknown)}, the types are {', '.join(DOCUMENT_SOURCES)}."}, 400
+
+    offset = request.args.get("offset", 0, type=int)
+    if offset < 0:
+        return {"error": "offset can't be negative."}, 400
+
+    try:
+        terms, limit = search_request(keyword)
+    except SearchError as e:
+        return {"error": str(e)}, 400
+
+    hits, facets = search_documents(db.session, terms, types, limit, offset)
+
+    # The facets count every type, the total only the types asked for
+    total = sum(count for name, count in facets.items() if not types or name in types)
+    next_offset = offset + len(hits) if offset + len(hits) < total else None
+
+    return {
+        "query": keyword,
+        "total": total,
+        "facets": facets,
+        "results": [{
+            "type": hit.type,
+            "id": hit.id,
+            "title": hit.title,
+            "snippet": hit.snippet,
+            "score": round(-hit.rank, 4)  # bm25 ranks are negative, the better the match the lower
+        } for hit in hits],
+        "next_offset": next_offset
+    }, 200
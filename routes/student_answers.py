@@ -1,35 +1,43 @@
+import json
+
 from flask import Blueprint, request
 from sqlalchemy.exc import SQLAlchemyError
 
-from data_models import db, StudentAnswer, Question, User, QuestionOption, Quiz, Assignment
+from data_models import db, StudentAnswer, Question, User, QuestionOption, Quiz, Assignment, Submission
+from pagination import paginated_response
+from projection import Projection, FieldsError
+from conditional import conditional, rows
+from attempts import AttemptError, validate_attempt, insert_attempt
+from grading import grade_mcq_answers, ungraded_mcq_count
+from dashboard import record_submission
+import ai_grading
+import similarity
+import write_behind
 
 # Defining blueprint to be used in the app later
 student_answers_bp = Blueprint("student_answers", __name__)
 
+# The answer columns the list endpoints select, any of them can be asked for with ?fields=
+answer_fields = Projection(StudentAnswer, "id", "question_id", "student_id", "quiz_id", "assignment_id",
+                           "selected_option_id", "answer_text", "marks_awarded", "evaluated_by_ai",
+                           "evaluated_by_teacher", "graded_locally", "feedback", "attempt_number", "submitted_at")
+
 # Getting all answers using GET
 @student_answers_bp.route("/", methods=["GET"])
+@conditional(StudentAnswer)
 def get_all_answers():
-    """This function gets all the answers in the database submitted by the students"""
+    """This function gets a page of the answers in the database submitted by the students, see pagination.py for the
+    limit, cursor, sort (id or submitted_at) and stream parameters and projection.py for fields"""
+    try:
+        fields = answer_fields.requested(default=(
+            "id", "question_id", "student_id", "selected_option_id", "answer_text", "marks_awarded", "evaluated_by_ai",
+            "evaluated_by_teacher", "attempt_number", "submitted_at"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
 
-    answers = StudentAnswer.query.all()
-    if not answers:
-        return {"message": "No student answers found"}, 404
-
-    return [
-        {
-            "id": ans.id,
-            "question_id": ans.question_id,
-            "student_id": ans.student_id,
-            "selected_option_id": ans.selected_option_id,
-            "answer_text": ans.answer_text,
-            "marks_awarded": ans.marks_awarded,
-            "evaluated_by_ai": ans.evaluated_by_ai,
-            "evaluated_by_teacher": ans.evaluated_by_teacher,
-            "attempt_number": ans.attempt_number,
-            "submitted_at": ans.submitted_at.isoformat() if ans.submitted_at else None
-        }
-        for ans in answers
-    ], 200
+    return paginated_response(answer_fields.query(fields), StudentAnswer, answer_fields.serializer(fields),
+                              sortable={"submitted_at": StudentAnswer.submitted_at},
+                              empty=({"message": "No student answers found"}, 404))
 
 
 # Creating an answer using POST
@@ -40,6 +48,22 @@ def create_answer():
 
     if not data.get("question_id") or not data.get("student_id"):
         return {"error": "question_id and student_id are required"}, 400
+    # Checked before anything is logged, a submission the writer can't bind would only fail later
+    integer_fields = ("question_id", "student_id", "selected_option_id", "quiz_id", "assignment_id", "attempt_number")
+    for name in integer_fields:
+        value = data.get(name)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return {"error": f"{name} must be an integer"}, 400
+    if not isinstance(data.get("answer_text") or "", str):
+        return {"error": "answer_text must be a string"}, 400
+
+    # During an exam the answer is only logged here and written to the database by the write-behind writer
+    pending = write_behind.buffer()
+    if pending is not None:
+        row = {name: data.get(name) for name in ("question_id", "student_id", "selected_option_id", "answer_text",
+                                                 "quiz_id", "assignment_id")}
+        row["attempt_number"] = data.get("attempt_number", 1)
+        return accepted(*pending.submit("answer", row, write_behind.submission_id_of(data)))
 
     new_answer = StudentAnswer(
         question_id=data["question_id"],
@@ -53,6 +77,8 @@ def create_answer():
 
     db.session.add(new_answer)
     try:
+        db.session.flush()
+        record_submission(new_answer.id)
         db.session.commit()
         return {"message": "Student answer submitted successfully", "id": new_answer.id}, 201
     except SQLAlchemyError:
@@ -60,8 +86,195 @@ def create_answer():
         return {"error": "Database conflict occurred while submitting the answer."}, 409
 
 
+# Submitting a whole attempt using POST
+@student_answers_bp.route("/attempts", methods=["POST"])
+def submit_attempt():
+    """This function submits every answer of an attempt of a quiz or assignment in one transaction, as the student's
+    next attempt (see attempts.py)"""
+    data = request.get_json()
+
+    student_id = data.get("student_id")
+    if not student_id:
+        return {"error": "student_id is required"}, 400
+    if not isinstance(student_id, int) or isinstance(student_id, bool):
+        return {"error": "student_id must be an integer"}, 400
+    try:
+        validate_attempt(data.get("answers"), data.get("quiz_id"), data.get("assignment_id"))
+    except AttemptError as e:
+        return {"error": str(e)}, 400
+    if not User.query.get(student_id):
+        return {"error": "Student not found"}, 404
+
+    pending = write_behind.buffer()
+    if pending is not None:
+        attempt = {"student_id": student_id, "quiz_id": data.get("quiz_id"), "assignment_id": data.get("assignment_id"),
+                   "answers": data["answers"]}
+        return accepted(*pending.submit("attempt", attempt, write_behind.submission_id_of(data)))
+
+    try:
+        attempt_number, answer_ids = insert_attempt(student_id, data["answers"], data.get("quiz_id"),
+                                                    data.get("assignment_id"))
+        record_submission(answer_ids[0])  # one feed event for the whole attempt
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return {"error": "Database conflict occurred while submitting the attempt."}, 409
+
+    return {
+        "message": "Attempt submitted successfully",
+        "attempt_number": attempt_number,
+        "answer_ids": answer_ids
+    }, 201
+
+
+# Grading the MCQ answers using POST
+@student_answers_bp.route("/grading/mcq", methods=["POST"])
+def grade_mcq():
+    """This function grades the ungraded MCQ answers of a quiz, or of everything without a quiz_id, with a set-based
+    UPDATE (see grading.py)"""
+    data = request.get_json(silent=True) or {}
+    quiz_id = data.get("quiz_id")
+    if quiz_id is not None and not isinstance(quiz_id, int):
+        return {"error": "quiz_id must be an integer"}, 400
+    if quiz_id is not None and not db.session.get(Quiz, quiz_id):
+        return {"error": "Quiz not found"}, 404
+
+    # The submissions acknowledged by the write-behind buffer are graded too
+    pending = write_behind.buffer()
+    if pending is not None:
+        pending.flush(write_behind.READ_YOUR_WRITES_TIMEOUT)
+
+    try:
+        graded = grade_mcq_answers(quiz_id, bool(data.get("regrade")))
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return {"error": "Database conflict occurred while grading the answers."}, 409
+
+    return {
+        "message": "MCQ answers graded successfully",
+        "quiz_id": quiz_id,
+        "graded": graded,
+        "ungraded": ungraded_mcq_count(quiz_id)
+    }, 200
+
+
+# Grading the descriptive answers with the LLM using POST
+@student_answers_bp.route("/grading/descriptive", methods=["POST"])
+def grade_descriptive():
+    """This function grades the ungraded descriptive answers of a quiz or an assignment with batched LLM calls, giving 0
+    locally to the blank ones first when pre_grading is asked for (see ai_grading.py and pre_grading.py). Calling it
+    again resumes an interrupted grading"""
+    data = request.get_json(silent=True) or {}
+    quiz_id, assignment_id = data.get("quiz_id"), data.get("assignment_id")
+    if (quiz_id is None) == (assignment_id is None):
+        return {"error": "Exactly one of quiz_id and assignment_id is required."}, 400
+    if not all(isinstance(value, int) for value in (quiz_id or 0, assignment_id or 0)):
+        return {"error": "quiz_id and assignment_id must be integers"}, 400
+    if quiz_id is not None and not db.session.get(Quiz, quiz_id):
+        return {"error": "Quiz not found"}, 404
+    if assignment_id is not None and not db.session.get(Assignment, assignment_id):
+        return {"error": "Assignment not found"}, 404
+    if data.get("pre_grading") not in (None, *ai_grading.PRE_GRADING_MODES):
+        return {"error": f"pre_grading must be one of {', '.join(ai_grading.PRE_GRADING_MODES)}"}, 400
+    try:
+        ai_grading.pre_grader(data.get("pre_grading"))  # a similarity mode without its zero threshold
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    pending = write_behind.buffer()
+    if pending is not None:
+        pending.flush(write_behind.READ_YOUR_WRITES_TIMEOUT)
+
+    try:
+        summary = ai_grading.grade_descriptive_answers(quiz_id, assignment_id,
+                                                       data.get("model_name", ai_grading.DEFAULT_MODEL),
+                                                       pre_grading=data.get("pre_grading"))
+    except SQLAlchemyError:
+        db.session.rollback()
+        return {"error": "Database conflict occurred while grading the answers."}, 409
+
+    return {"message": "Descriptive answers graded", "quiz_id": quiz_id, "assignment_id": assignment_id,
+            **summary}, 200
+
+
+# Listing the clusters of near-duplicate answers using GET
+@student_answers_bp.route("/similarity", methods=["GET"])
+def get_similar_answers():
+    """This function lists the clusters of near-duplicate descriptive answers of different students to a question, or
+    to every question of a quiz or an assignment, found with MinHash and LSH (see similarity.py). The answers which
+    arrived since the last check are hashed first"""
+    scopes = {name: request.args.get(name, type=int) for name in ("question_id", "quiz_id", "assignment_id")}
+    if sum(value is not None for value in scopes.values()) != 1:
+        return {"error": "Exactly one of question_id, quiz_id and assignment_id is required."}, 400
+    threshold = request.args.get("threshold", similarity.SIMILARITY_THRESHOLD, type=float)
+    if not 0 < threshold <= 1:
+        return {"error": "threshold must be greater than 0 and at most 1."}, 400
+
+    if scopes["question_id"] is not None:
+        if not db.session.get(Question, scopes["question_id"]):
+            return {"error": "Question not found"}, 404
+        question_ids = [scopes["question_id"]]
+    elif scopes["quiz_id"] is not None:
+        if not db.session.get(Quiz, scopes["quiz_id"]):
+            return {"error": "Quiz not found"}, 404
+        question_ids = [question.id for question in Question.query.filter_by(quiz_id=scopes["quiz_id"])
+                        .with_entities(Question.id).order_by(Question.id)]
+    else:
+        if not db.session.get(Assignment, scopes["assignment_id"]):
+            return {"error": "Assignment not found"}, 404
+        question_ids = [question.id for question in Question.query.filter_by(assignment_id=scopes["assignment_id"])
+                        .with_entities(Question.id).order_by(Question.id)]
+
+    # The answers acknowledged by the write-behind buffer are checked too
+    pending = write_behind.buffer()
+    if pending is not None:
+        pending.flush(write_behind.READ_YOUR_WRITES_TIMEOUT)
+
+    try:
+        result = similarity.find_similar_answers(question_ids, threshold)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        return {"error": "Database conflict occurred while checking the answers."}, 409
+
+    return {**{name: value for name, value in scopes.items() if value is not None}, **result}, 200
+
+
+def accepted(submission_id, duplicate):
+    """This function returns the response of a submission queued by the write-behind buffer"""
+    return {
+        "message": "Submission already received" if duplicate else "Submission accepted",
+        "submission_id": submission_id,
+        "status_url": f"/student_answers/submissions/{submission_id}"
+    }, 202
+
+
+# Getting the status of a write-behind submission using GET
+@student_answers_bp.route("/submissions/<submission_id>", methods=["GET"])
+def get_submission(submission_id):
+    """This function returns whether a submission accepted by the write-behind buffer is still pending, has been
+    applied (with its attempt number and answer ids) or has failed"""
+    submission = db.session.get(Submission, submission_id)
+    if submission is None:
+        pending = write_behind.buffer()
+        if pending is not None and submission_id in pending.pending_ids:
+            return {"submission_id": submission_id, "status": "pending"}, 200
+        return {"error": "Submission not found"}, 404
+
+    return {
+        "submission_id": submission.submission_id,
+        "status": submission.status,
+        "attempt_number": submission.attempt_number,
+        "answer_ids": json.loads(submission.answer_ids) if submission.answer_ids else [],
+        "error": submission.error,
+        "applied_at": submission.applied_at.isoformat() if submission.applied_at else None
+    }, 200
+
+
 # Getting a specific answer using GET
 @student_answers_bp.route("/<int:answer_id>", methods=["GET"])
+@conditional(rows(StudentAnswer, id="answer_id"))
 def get_answer(answer_id):
     """This function gets a specific answer based on its ID"""
     answer = StudentAnswer.query.get(answer_id)
@@ -76,7 +289,8 @@ def get_answer(answer_id):
         "answer_text": answer.answer_text,
         "marks_awarded": answer.marks_awarded,
         "evaluated_by_ai": answer.evaluated_by_ai,
-        "evaluated_by_teacher": answer.evaluated_by_teacher
+        "evaluated_by_teacher": answer.evaluated_by_teacher,
+        "graded_locally": answer.graded_locally
     }, 200
 
 
@@ -123,28 +337,35 @@ def delete_answer(answer_id):
 
 # Getting all answers for a student using GET
 @student_answers_bp.route("/student/<int:student_id>", methods=["GET"])
+@write_behind.read_your_writes("student_id")
+@conditional(rows(StudentAnswer, student_id="student_id"))
 def get_answers_by_student(student_id):
     """This function returns a list of all students using the student_id"""
 
-    answers = StudentAnswer.query.filter_by(student_id=student_id).all()
+    try:
+        fields = answer_fields.requested(default=("id", "question_id", "marks_awarded"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
+
+    answers = answer_fields.query(fields).filter(StudentAnswer.student_id == student_id).all()
     if not answers:
         return {"message": f"No answers found for student {student_id}"}, 404
 
-    return [
-        {"id": ans.id, "question_id": ans.question_id, "marks_awarded": ans.marks_awarded}
-        for ans in answers
-    ], 200
+    return [answer_fields.serialize(ans, fields) for ans in answers], 200
 
 
 # Getting all answers for a question using GET
 @student_answers_bp.route("/question/<int:question_id>", methods=["GET"])
+@conditional(rows(StudentAnswer, question_id="question_id"))
 def get_answers_by_question(question_id):
     """This function returns a list of all answers submitted for a specific question using its ID"""
-    answers = StudentAnswer.query.filter_by(question_id=question_id).all()
+    try:
+        fields = answer_fields.requested(default=("id", "student_id", "answer_text"))
+    except FieldsError as e:
+        return {"error": str(e)}, 400
+
+    answers = answer_fields.query(fields).filter(StudentAnswer.question_id == question_id).all()
     if not answers:
         return {"message": f"No answers found for question {question_id}"}, 404
 
-    return [
-        {"id": ans.id, "student_id": ans.student_id, "answer_text": ans.answer_text}
-        for ans in answers
-    ], 200
+    return [answer_fields.serialize(ans, fields) for ans in answers], 200
@@ -1,9 +1,13 @@
 from flask import request, Blueprint, session, jsonify
 from sqlalchemy.exc import SQLAlchemyError
-from data_models import db, User, UserRole
+from data_models import db, User, UserRole, Program
 from sqlalchemy import func
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
+from loader_profiles import with_profile
+from pagination import paginated_response
+from search_index import SEARCH_INDEXES, SearchError, search_request
+from conditional import conditional, rows
 
 # Defining blueprint to be used in the app later
 users_bp = Blueprint("users",__name__)
@@ -45,33 +49,39 @@ def logout():
     session.clear()
     return jsonify({"message": "Logged out successfully"}), 200
 
+def serialize_user(user):
+    """This function returns the dictionary of a user as listed by get_users"""
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "role": user.role.value,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        "enrolled_programs": [{"id": p.id, "name": p.name} for p in user.enrolled_programs],
+        "teaching_programs": [{"id": p.id, "name": p.name} for p in user.teaching_programs]
+    }
+
+
 # Creating a route for getting a list for the users from the database
 @users_bp.route("/", methods=["GET"])
+@conditional(User)
 def get_users():
-    """This function fetches all users with optional filters by role or name."""
+    """This function fetches a page of users with optional filters by role or name, see pagination.py for the limit,
+    cursor, sort (id or created_at) and stream parameters"""
 
     role = request.args.get("role")
     name = request.args.get("name")
 
-    query = User.query
+    query = with_profile(User.query, "users.list")
     if role:
         try:
-            query = query.filter(User.role == User(role))
+            query = query.filter(User.role == UserRole(role))
         except ValueError:
             return {"error": "Invalid role filter"}, 400
     if name:
         query = query.filter(User.name.ilike(f"%{name}%"))
 
-    users = query.all()
-    return [{
-        "id": user.id,
-        "name": user.name,
-        "email": user.email,
-        "role": user.role.value,
-        "created_at": user.created_at.isoformat() if user.created_at else None,
-        "enrolled_programs": [{"id": p.id, "name": p.name} for p in user.enrolled_programs],
-        "teaching_programs": [{"id": p.id, "name": p.name} for p in user.teaching_programs]
-    } for user in users], 200
+    return paginated_response(query, User, serialize_user, sortable={"created_at": User.created_at})
 
 
 # Adding a new User to the database
@@ -165,15 +175,18 @@ def delete_user(user_id):
 # Searching the database based on the provided name or email
 @users_bp.route("/search", methods=["GET"])
 def search_users():
-    """This function searches users by name or email."""
+    """This function searches users by name or email, best matches first with a highlighted snippet."""
     keyword = request.args.get("q")
     if not keyword:
         return {"error": "Missing search query 'q'"}, 400
 
-    # Searching through the database using the case-insensitive .ilike() and | operator
-    users = User.query.filter(
-        (User.name.ilike(f"%{keyword}%")) | (User.email.ilike(f"%{keyword}%"))
-    ).all()
+    try:
+        terms, limit = search_request(keyword)
+    except SearchError as e:
+        return {"error": str(e)}, 400
+
+    # Searching through the full-text index of the names and emails
+    users = SEARCH_INDEXES["users"].search(with_profile(User.query, "users.search"), terms).limit(limit).all()
 
     # Considering the case if the no users match the input query
     if not users:
@@ -188,12 +201,14 @@ def search_users():
         "enrolled_courses": [{"code": c.code} for c in u.enrolled_courses],
         "teaching_courses": [{"code": c.code} for c in u.teaching_courses],
         "enrolled_programs": [{"name": p.name} for p in u.enrolled_programs],
-        "teaching_programs": [{"name": p.name} for p in u.teaching_programs]
-    } for u in users], 200
+        "teaching_programs": [{"name": p.name} for p in u.teaching_programs],
+        "snippet": snippet
+    } for u, snippet in users], 200
 
 
 # Finding a user based on it's ID
 @users_bp.route("/<int:user_id>", methods=["GET"])
+@conditional(rows(User, id="user_id"), Program)
 def get_user_by_id(user_id):
     """This function fetches a specific user by it's ID."""
     user = User.query.get_or_404(user_id) # Using got_or_404() for automatic error handling
@@ -0,0 +1,231 @@
+import re
+
+from flask import request
+from sqlalchemy import Integer, column, func, literal_column, select, table
+
+from data_models import Question, Quiz, Assignment, Course, Program, User
+
+# Full-text search over the text columns of the searchable tables, backed by SQLite FTS5. Every table gets an
+# external content FTS5 index (<table>_fts) which stores only the inverted index and reads the text back from the table
+# itself, kept in sync by AFTER INSERT/UPDATE/DELETE triggers. A search is then an index lookup instead of the full
+# table scan of ilike('%keyword%'), and comes with the bm25 rank and a highlighted snippet of the matching text.
+#
+# The search words are turned into prefix terms ANDed together, 'prog log' matches 'Programming Logic'. Words are
+# split on anything which isn't a letter or a digit, like the unicode61 tokenizer does, so FTS5 query syntax (quotes,
+# NEAR, OR, column filters...) typed by a user is never interpreted.
+#
+# The indexes are created and backfilled by migration 3 (migrations.py). To index another table add a SearchIndex to
+# SEARCH_INDEXES and a migration calling its create().
+#
+# The unified search (GET /search, routes/search.py) reads one more FTS5 table, search_documents, holding a document
+# (type, title, body) for every row of every searchable table, so a single MATCH ranks the hits of all the types
+# together. It stores its own copy of the text and is kept in sync by its own triggers, created by migration 4. The
+# rowid of a document is row id * DOCUMENT_TYPES + the type code, which lets the triggers find the document of a row
+# without a scan.
+
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 1000
+SNIPPET_START, SNIPPET_END, SNIPPET_ELLIPSIS = "<mark>", "</mark>", "…"
+SNIPPET_TOKENS = 12
+
+
+class SearchError(ValueError):
+    """This class is raised for a search query without any word to search for or an invalid limit"""
+
+
+class SearchIndex:
+    """This class describes the FTS5 index of a table: the model and the text columns indexed"""
+
+    def __init__(self, model, *columns: str):
+        self.model = model
+        self.table = model.__tablename__
+        self.name = f"{self.table}_fts"
+        self.columns = columns
+        # Lightweight table construct to use the virtual table in SQLAlchemy queries, rank is the hidden bm25 column
+        self.fts = table(self.name, column("rowid"), column("rank"), *[column(name) for name in columns])
+
+    def create(self, conn):
+        """This function creates the FTS5 table and its triggers if they don't exist and (re)builds the index from the
+        rows already in the table"""
+        names = ", ".join(self.columns)
+        new_values = ", ".join(f"new.{name}" for name in self.columns)
+        old_values = ", ".join(f"old.{name}" for name in self.columns)
+
+        # prefix='2 3' keeps extra indexes of the 2 and 3 character prefixes so short prefix searches stay fast
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} USING fts5({names}, content='{self.table}', "
+            f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_ai AFTER INSERT ON {self.table} BEGIN "
+            f"INSERT INTO {self.name} (rowid, {names}) VALUES (new.id, {new_values}); END"
+        )
+        # An external content index is told the old values to remove them, then gets the new ones
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_ad AFTER DELETE ON {self.table} BEGIN "
+            f"INSERT INTO {self.name} ({self.name}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"
+        )
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {self.name}_au AFTER UPDATE OF {names} ON {self.table} BEGIN "
+            f"INSERT INTO {self.name} ({self.name}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {self.name} (rowid, {names}) VALUES (new.id, {new_values}); END"
+        )
+        # Backfilling the rows which existed before the triggers
+        conn.exec_driver_sql(f"INSERT INTO {self.name} ({self.name}) VALUES ('rebuild')")
+
+    def matches(self, terms: str):
+        """This function returns the MATCH condition of the FTS5 table for a query built by match_query"""
+        return literal_column(self.name).op("MATCH")(terms)
+
+    def matching_ids(self, terms: str):
+        """This function returns a SELECT of the ids of the matching rows, for filters like Model.id.in_(...)"""
+        return select(self.fts.c.rowid).where(self.matches(terms))
+
+    def snippet(self):
+        """This function returns the highlighted snippet of the best matching column of a row"""
+        return func.snippet(literal_column(self.name), -1, SNIPPET_START, SNIPPET_END, SNIPPET_ELLIPSIS,
+                            SNIPPET_TOKENS)
+
+    def search(self, query, terms: str):
+        """This function restricts a query over the model to the matching rows, best first, and adds the snippet as a
+        last column of every row"""
+        return (query.join(self.fts, self.fts.c.rowid == self.model.id)
+                .filter(self.matches(terms))
+                .add_columns(self.snippet().label("snippet"))
+                .order_by(self.fts.c.rank, self.model.id))
+
+
+SEARCH_INDEXES = {
+    "questions": SearchIndex(Question, "question_text"),
+    "quizzes": SearchIndex(Quiz, "title"),
+    "assignments": SearchIndex(Assignment, "title"),
+    "courses": SearchIndex(Course, "name", "code"),
+    "programs": SearchIndex(Program, "name", "description"),
+    "users": SearchIndex(User, "name", "email"),
+}
+
+
+def match_query(keyword: str):
+    """This function turns the words typed by a user into an FTS5 query of prefix terms, 'prog log' gives
+    '"prog"* "log"*', or None when there is no word to search for"""
+    words = re.findall(r"[^\W_]+", keyword or "")
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class DocumentSource:
+    """This class describes how the rows of a table become documents of the unified index: the SQL expressions of the
+    title and the body, written over {row} which the triggers replace by new or old"""
+
+    def __init__(self, type_name: str, code: int, model, columns: tuple, title: str, body: str = "''"):
+        self.type = type_name
+        self.code = code
+        self.table = model.__tablename__
+        self.columns = columns  # the columns the title and body are built from, their updates refresh the document
+        self.title = title
+        self.body = body
+
+    def values(self, row: str) -> str:
+        """This function returns the rowid, type, title, body values of the document of a row"""
+        return (f"{row}.id * {DOCUMENT_TYPES} + {self.code}, '{self.type}', {self.title.format(row=row)}, "
+                f"{self.body.format(row=row)}")
+
+    def create(self, conn):
+        """This function creates the triggers of the table and (re)writes the documents of its rows"""
+        delete = f"DELETE FROM {DOCUMENTS} WHERE rowid = old.id * {DOCUMENT_TYPES} + {self.code};"
+        insert = f"INSERT INTO {DOCUMENTS} (rowid, type, title, body) VALUES ({self.values('new')});"
+        prefix = f"{DOCUMENTS}_{self.table}"
+
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {prefix}_ai AFTER INSERT ON {self.table} BEGIN {insert} END")
+        conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS {prefix}_ad AFTER DELETE ON {self.table} BEGIN {delete} END")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS {prefix}_au AFTER UPDATE OF {', '.join(self.columns)} ON {self.table} "
+            f"BEGIN {delete} {insert} END"
+        )
+
+        conn.exec_driver_sql(f"DELETE FROM {DOCUMENTS} WHERE rowid % {DOCUMENT_TYPES} = {self.code}")
+        conn.exec_driver_sql(f"INSERT INTO {DOCUMENTS} (rowid, type, title, body) "
+                             f"SELECT {self.values(self.table)} FROM {self.table}")
+
+
+DOCUMENTS = "search_documents"
+DOCUMENT_TYPES = 8  # room for the type codes of DOCUMENT_SOURCES, changing it means rebuilding the documents
+
+DOCUMENT_SOURCES = {
+    source.type: source for source in (
+        DocumentSource("questions", 1, Question, ("question_text",), "{row}.question_text"),
+        DocumentSource("quizzes", 2, Quiz, ("title",), "{row}.title"),
+        DocumentSource("assignments", 3, Assignment, ("title",), "{row}.title"),
+        DocumentSource("courses", 4, Course, ("name", "code"), "{row}.name", "{row}.code"),
+        DocumentSource("programs", 5, Program, ("name", "description"), "{row}.name",
+                       "coalesce({row}.description, '')"),
+        DocumentSource("users", 6, User, ("name", "email"), "{row}.name", "{row}.email"),
+    )
+}
+
+documents = table(DOCUMENTS, column("rowid", Integer), column("rank"), column("type"), column("title"), column("body"))
+
+
+def search_documents(session, terms: str, types=None, limit: int = DEFAULT_SEARCH_LIMIT, offset: int = 0):
+    """This function returns a page of the documents matching an FTS5 query, best first, optionally only of the given
+    types, and the number of matches of every type (whatever the types asked for)"""
+    match = literal_column(DOCUMENTS).op("MATCH")(terms)
+
+    hits = select(
+        documents.c.type,
+        (documents.c.rowid // DOCUMENT_TYPES).label("id"),
+        documents.c.title,
+        func.snippet(literal_column(DOCUMENTS), -1, SNIPPET_START, SNIPPET_END, SNIPPET_ELLIPSIS,
+                     SNIPPET_TOKENS).label("snippet"),
+        documents.c.rank,
+    ).where(match)
+    if types:
+        hits = hits.where(documents.c.type.in_(types))
+    hits = session.execute(hits.order_by(documents.c.rank, documents.c.rowid).limit(limit).offset(offset)).all()
+
+    facets = dict.fromkeys(DOCUMENT_SOURCES, 0)
+    facets.update(session.execute(
+        select(documents.c.type, func.count()).where(match).group_by(documents.c.type)
+    ).all())
+    return hits, facets
+
+
+def create_document_index(conn):
+    """This function creates the unified search_documents index, its triggers and documents, run by migration 4"""
+    # The type is stored with the document but not indexed, searching for 'users' doesn't match every user
+    conn.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {DOCUMENTS} USING fts5(type UNINDEXED, title, body, "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    )
+    for source in DOCUMENT_SOURCES.values():
+        source.create(conn)
+
+
+def search_request(keyword: str, required: bool = True):
+    """This function returns the FTS5 query of the keyword and the limit (?limit=, DEFAULT_SEARCH_LIMIT by default) of
+    the current request. An empty keyword which isn't required gives None, to list the rows unfiltered"""
+    limit = request.args.get("limit", DEFAULT_SEARCH_LIMIT, type=int)
+    if not 1 <= limit <= MAX_SEARCH_LIMIT:
+        raise SearchError(f"limit must be between 1 and {MAX_SEARCH_LIMIT}.")
+
+    if not keyword and not required:
+        return None, limit
+    terms = match_query(keyword)
+    if terms is None:
+        raise SearchError("The search query has no word to search for.")
+    return terms, limit
+
+
+def with_snippet(item: dict, row) -> dict:
+    """This function adds the snippet of a row returned by SearchIndex.search to its dictionary, rows listed without a
+    keyword have none"""
+    if "snippet" in row._fields:
+        item["snippet"] = row.snippet
+    return item
+
+
+def create_search_indexes(conn):
+    """This function creates (or rebuilds) every search index, run by migration 3"""
+    for index in SEARCH_INDEXES.values():
+        index.create(conn)
@@ -0,0 +1,248 @@
+import re
+import zlib
+from typing import Dict, List, Optional
+
+import click
+import numpy as np
+from flask.cli import with_appcontext
+from sqlalchemy import and_, insert, select
+
+from data_models import db, AnswerSignature, Question, StudentAnswer
+
+# Near-duplicate detection of the descriptive answers of a question, to find the answers copied between students.
+# Comparing every answer with every other one is O(n²), 100,000 answers make 5 billion pairs. Instead:
+#
+#   shingles   an answer is the set of its runs of SHINGLE_WORDS consecutive words (lower case, punctuation dropped),
+#              two answers are as similar as the Jaccard similarity of their sets
+#   MinHash    the set is summarised by its minimum under NUM_HASHES random hash functions, the signature. Two answers
+#              agree on one minimum with a probability equal to their Jaccard similarity, so the share of the positions
+#              where their signatures agree estimates it
+#   LSH        the signature is cut into BANDS bands of ROWS minimums. Answers with one identical band land in the same
+#              bucket and become a candidate pair, answers with a similarity s do so with a probability of
+#              1 - (1 - s^ROWS)^BANDS: 99% at 0.6, 87% at 0.5, 7% at 0.2. That holds for the buckets of up to
+#              BUCKET_PAIRS + 1 answers, where every pair is compared. In a larger bucket (a text handed in by
+#              hundreds of students) every answer is only compared with the BUCKET_PAIRS next ones in that band, which
+#              keeps the pairs linear in the answers, the clusters join them back together
+#
+# Only the candidate pairs are compared, on their signatures, and the pairs of different students at or above the
+# threshold are merged into clusters. Every band is one NumPy sort of the question's signatures, the whole search is
+# roughly linear in the number of answers.
+#
+# The signatures are kept in answer_signatures (data_models.AnswerSignature) so every answer is hashed once: a check
+# first hashes the answers which arrived since the last one, then searches the stored signatures. The triggers created
+# by migration 11 drop the signature of an answer whose text changes or which is deleted, it is hashed again on the
+# next check. Changing SHINGLE_WORDS, NUM_HASHES or SEED means emptying answer_signatures.
+#
+# Answers of fewer than MIN_WORDS words aren't compared, short answers to the same question are alike anyway. It is run
+# by GET /student_answers/similarity and by the CLI: flask --app app find-similar-answers --quiz-id 3
+
+SHINGLE_WORDS = 3
+NUM_HASHES = 128
+BANDS, ROWS = 32, 4  # BANDS * ROWS == NUM_HASHES
+MIN_WORDS = 8
+SIMILARITY_THRESHOLD = 0.6
+INDEX_BATCH_SIZE = 500  # answers hashed together, the batch holds a (shingles x NUM_HASHES) uint64 matrix
+VERIFY_BATCH_SIZE = 100_000  # candidate pairs compared together
+BUCKET_PAIRS = 32  # answers of a bucket every answer is compared with in a band, all of them in a smaller bucket
+SEED = 50
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_rng = np.random.default_rng(SEED)
+_SHINGLE_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=SHINGLE_WORDS, dtype=np.uint64) | np.uint64(1)
+# Multiply-shift hash functions: the high 32 bits of (a * shingle + b) modulo 2^64, a odd
+_HASH_A = _rng.integers(1, 2 ** 63, size=NUM_HASHES, dtype=np.uint64) | np.uint64(1)
+_HASH_B = _rng.integers(0, 2 ** 63, size=NUM_HASHES, dtype=np.uint64)
+_BAND_MULTIPLIERS = _rng.integers(1, 2 ** 63, size=ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def signatures(texts: List[Optional[str]]) -> tuple:
+    """This function returns the MinHash signatures (one row of NUM_HASHES uint32 per text) of the texts of at least
+    MIN_WORDS words and the mask of those texts"""
+    words = [_WORD.findall((text or "").lower()) for text in texts]
+    lengths = np.array([len(text_words) for text_words in words], dtype=np.int64)
+    comparable = lengths >= MIN_WORDS
+    lengths = lengths[comparable]
+    if not len(lengths):
+        return np.empty((0, NUM_HASHES), dtype=np.uint32), comparable
+
+    word_hashes = np.fromiter((zlib.crc32(word.encode()) for text_words, keep in zip(words, comparable) if keep
+                               for word in text_words), dtype=np.uint64, count=int(lengths.sum()))
+
+    # Position of the first word of every shingle in word_hashes, the shingles never straddle two answers
+    shingle_counts = lengths - SHINGLE_WORDS + 1
+    first_shingles = np.concatenate(([0], np.cumsum(shingle_counts)[:-1]))
+    first_words = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    positions = np.arange(shingle_counts.sum()) + np.repeat(first_words - first_shingles, shingle_counts)
+
+    shingles = np.zeros(len(positions), dtype=np.uint64)
+    for offset, multiplier in enumerate(_SHINGLE_MULTIPLIERS):
+        shingles += word_hashes[positions + offset] * multiplier  # wraps around modulo 2^64
+    shingles = (shingles ^ (shingles >> np.uint64(32))) & np.uint64(0xFFFFFFFF)
+
+    hashed = ((shingles[:, None] * _HASH_A + _HASH_B) >> np.uint64(32)).astype(np.uint32)
+    return np.minimum.reduceat(hashed, first_shingles, axis=0), comparable
+
+
+def band_keys(signature_rows: np.ndarray) -> np.ndarray:
+    """This function returns the bucket of every band of the signatures, an (answers x BANDS) array"""
+    bands = signature_rows.reshape(len(signature_rows), BANDS, ROWS).astype(np.uint64)
+    return (bands * _BAND_MULTIPLIERS).sum(axis=2, dtype=np.uint64)
+
+
+def index_answers(question_ids: Optional[List[int]] = None) -> int:
+    """This function stores the signatures of the descriptive answers of the questions (of every question if
+    question_ids is None) which don't have one yet and returns how many answers were hashed. Nothing is committed
+    here, the caller owns the transaction"""
+    query = (select(StudentAnswer.id, StudentAnswer.question_id, StudentAnswer.student_id, StudentAnswer.answer_text)
+             .outerjoin(AnswerSignature, and_(AnswerSignature.question_id == StudentAnswer.question_id,
+                                              AnswerSignature.answer_id == StudentAnswer.id))
+             .where(AnswerSignature.answer_id.is_(None), StudentAnswer.answer_text.isnot(None)))
+    if question_ids is not None:
+        query = query.where(StudentAnswer.question_id.in_(question_ids))
+    answers = db.session.execute(query).all()
+
+    for start in range(0, len(answers), INDEX_BATCH_SIZE):
+        batch = answers[start:start + INDEX_BATCH_SIZE]
+        batch_signatures, comparable = signatures([answer.answer_text for answer in batch])
+        batch_signatures = iter(batch_signatures)
+        db.session.execute(insert(AnswerSignature), [{
+            "question_id": answer.question_id, "answer_id": answer.id, "student_id": answer.student_id,
+            # An answer too short to compare is stored without a signature so it isn't read again
+            "signature": next(batch_signatures).tobytes() if keep else None
+        } for answer, keep in zip(batch, comparable)])
+    return len(answers)
+
+
+def candidate_pairs(keys: np.ndarray) -> np.ndarray:
+    """This function returns the (first, second) row numbers of the answers sharing the bucket of at least one band.
+    Within a bucket every answer is paired with the BUCKET_PAIRS answers after it in the band's sort order, every pair
+    of the bucket when it holds at most BUCKET_PAIRS + 1 answers"""
+    pairs = [np.empty((0, 2), dtype=np.intp)]
+    for band in range(keys.shape[1]):
+        order = np.argsort(keys[:, band], kind="stable")
+        sorted_keys = keys[order, band]
+        # The keys are sorted, two answers `distance` apart with the same key have every answer between them in their
+        # bucket too, so no pair at a distance means no bucket as large
+        for distance in range(1, min(BUCKET_PAIRS, len(order) - 1) + 1):
+            same = sorted_keys[distance:] == sorted_keys[:-distance]
+            if not same.any():
+                break
+            pairs.append(np.stack((order[:-distance][same], order[distance:][same]), axis=1))
+    pairs = np.sort(np.concatenate(pairs), axis=1).astype(np.int64)
+    # A pair found in several bands is compared once, deduplicated as one int64 per pair (much faster than rows)
+    codes = np.unique(pairs[:, 0] * len(keys) + pairs[:, 1])
+    return np.stack((codes // len(keys), codes % len(keys)), axis=1)
+
+
+def question_clusters(question_id: int, threshold: float = SIMILARITY_THRESHOLD) -> List[dict]:
+    """This function returns the clusters of near-duplicate answers of different students to a question, from its
+    stored signatures, largest first"""
+    rows = db.session.execute(
+        select(AnswerSignature.answer_id, AnswerSignature.student_id, AnswerSignature.signature)
+        .where(AnswerSignature.question_id == question_id, AnswerSignature.signature.isnot(None))
+        .order_by(AnswerSignature.answer_id)
+    ).all()
+    if len(rows) < 2:
+        return []
+
+    answer_ids = [row.answer_id for row in rows]
+    student_ids = np.array([row.student_id for row in rows])
+    signature_rows = np.frombuffer(b"".join(row.signature for row in rows), dtype=np.uint32).reshape(-1, NUM_HASHES)
+
+    pairs = candidate_pairs(band_keys(signature_rows))
+    similar, scores = [], []
+    for start in range(0, len(pairs), VERIFY_BATCH_SIZE):
+        batch = pairs[start:start + VERIFY_BATCH_SIZE]
+        estimates = (signature_rows[batch[:, 0]] == signature_rows[batch[:, 1]]).mean(axis=1)
+        keep = (estimates >= threshold) & (student_ids[batch[:, 0]] != student_ids[batch[:, 1]])
+        similar.append(batch[keep])
+        scores.append(estimates[keep])
+    if not similar or not sum(len(batch) for batch in similar):
+        return []
+
+    # Union-find over the similar pairs
+    parent = {}
+
+    def root(row):
+        parent.setdefault(row, row)
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+
+    similar, scores = np.concatenate(similar).tolist(), np.concatenate(scores).tolist()
+    for first, second in similar:
+        parent[root(first)] = root(second)
+
+    clusters: Dict[int, dict] = {}
+    for row in parent:
+        cluster = clusters.setdefault(root(row), {"rows": [], "similarity": 0.0})
+        cluster["rows"].append(row)
+    for (first, _), score in zip(similar, scores):
+        cluster = clusters[root(first)]
+        cluster["similarity"] = max(cluster["similarity"], score)
+
+    result = []
+    for cluster in clusters.values():
+        members = sorted(cluster["rows"])
+        result.append({
+            "size": len(members),
+            "answer_ids": [answer_ids[row] for row in members],
+            "student_ids": sorted({int(student_ids[row]) for row in members}),
+            "similarity": round(cluster["similarity"], 3)  # highest estimated similarity of two of its answers
+        })
+    return sorted(result, key=lambda cluster: (-cluster["size"], cluster["answer_ids"][0]))
+
+
+def find_similar_answers(question_ids: List[int], threshold: float = SIMILARITY_THRESHOLD) -> dict:
+    """This function hashes the new answers of the questions and returns the clusters of near-duplicate answers of
+    every question having some. Nothing is committed here"""
+    indexed = index_answers(question_ids)
+    questions = []
+    for question_id in question_ids:
+        clusters = question_clusters(question_id, threshold)
+        if clusters:
+            questions.append({"question_id": question_id, "clusters": clusters})
+    return {
+        "threshold": threshold,
+        "indexed": indexed,
+        "suspicious_answers": sum(cluster["size"] for question in questions for cluster in question["clusters"]),
+        "questions": questions
+    }
+
+
+def create_signature_triggers(conn):
+    """This function creates the triggers dropping the signature of an answer whose text changes or which is deleted,
+    run by migration 11"""
+    drop = "DELETE FROM answer_signatures WHERE question_id = old.question_id AND answer_id = old.id;"
+    conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS answer_signatures_au AFTER UPDATE OF answer_text, question_id "
+                         f"ON student_answers BEGIN {drop} END")
+    conn.exec_driver_sql(f"CREATE TRIGGER IF NOT EXISTS answer_signatures_ad AFTER DELETE ON student_answers "
+                         f"BEGIN {drop} END")
+
+
+@click.command("find-similar-answers")
+@click.option("--quiz-id", type=int, default=None, help="Only check the answers of this quiz.")
+@click.option("--assignment-id", type=int, default=None, help="Only check the answers of this assignment.")
+@click.option("--question-id", type=int, default=None, help="Only check the answers of this question.")
+@click.option("--threshold", type=click.FloatRange(0, 1, min_open=True), default=SIMILARITY_THRESHOLD,
+              show_default=True, help="Estimated Jaccard similarity of two answers to be reported.")
+@with_appcontext
+def find_similar_answers_command(quiz_id, assignment_id, question_id, threshold):
+    """Lists the clusters of near-duplicate descriptive answers of different students."""
+    query = select(Question.id).order_by(Question.id)
+    if question_id is not None:
+        query = query.where(Question.id == question_id)
+    if quiz_id is not None:
+        query = query.where(Question.quiz_id == quiz_id)
+    if assignment_id is not None:
+        query = query.where(Question.assignment_id == assignment_id)
+    result = find_similar_answers(db.session.scalars(query).all(), threshold)
+    db.session.commit()
+
+    click.echo(f"Hashed {result['indexed']} new answers, {result['suspicious_answers']} answers in clusters.")
+    for question in result["questions"]:
+        for cluster in question["clusters"]:
+            click.echo(f"Question {question['question_id']}: answers {cluster['answer_ids']} of students "
+                       f"{cluster['student_ids']}, similarity {cluster['similarity']}")
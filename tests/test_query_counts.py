@@ -0,0 +1,41 @@
+"""The number of SQL queries of the list endpoints, on a seeded copy of the database and again with the data doubled
+(see benchmarks/check_query_counts.py). A count growing with the rows is an N+1, a count above EXPECTED_QUERIES is a
+query added to the endpoint: update EXPECTED_QUERIES when that is intended."""
+import os
+
+import pytest
+
+from benchmarks.bench_utils import use_database_copy
+from benchmarks.check_query_counts import DEFAULT_SCALE, ENDPOINTS, measure_endpoints
+
+EXPECTED_QUERIES = {
+    "/courses/": 7,
+    "/programs/": 7,
+    "/programs/program-course-counts": 1,
+    "/users/": 5,
+    "/users/?role=student": 5,
+    "/users/search?q=e": 5,
+    "/questions/?type=descriptive": 3,
+    "/": 2,
+    "/ui/courses": 2,
+    "/ui/users": 5,
+    "/ui/programs": 2,
+}
+
+
+@pytest.fixture(scope="module")
+def query_counts():
+    path = use_database_copy()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-test")  # the OpenAI clients are built at import, never called here
+    os.environ["RESPONSE_CACHE"] = "off"  # counting the queries, the data is seeded behind the cache's back
+
+    from app import create_app
+    return measure_endpoints(create_app(), path, DEFAULT_SCALE)
+
+
+@pytest.mark.parametrize("url", ENDPOINTS)
+def test_query_count(query_counts, url):
+    (small, status_small), (large, status_large) = query_counts[url]
+    assert status_small == status_large == 200
+    assert small == large, f"{url} runs {small} queries on the seeded data and {large} on twice the data"
+    assert small == EXPECTED_QUERIES[url]
@@ -0,0 +1,346 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+
+from attempts import insert_attempt
+from dashboard import record_submission
+from data_models import db, StudentAnswer, Submission
+
+# Write-behind path for the answer submissions, to absorb the spikes of quiz deadlines. With WRITE_BEHIND=on,
+# POST /student_answers/ and POST /student_answers/attempts don't write to SQLite: the submission is appended to a local
+# append-only log (data/submissions.log, one JSON line per submission), the log is fsynced and the request answers
+# 202 Accepted with the submission_id straight away. A background writer takes the submissions from the queue in log
+# order and applies them to student_answers in large batches, one transaction (one commit) per batch.
+#
+# Guarantees:
+#   durability      a submission is acknowledged once its line is fsynced. Concurrent requests share the fsyncs: the
+#                   request doing one syncs every line written before it (group commit of the log)
+#   ordering        submissions are applied in the order of their seq, the order they were written to the log, so the
+#                   attempts of a student are numbered in the order they were submitted
+#   idempotency     every submission has a submission_id (the client's, from the body or the Idempotency-Key header,
+#                   otherwise a new uuid). The submissions table records the applied ones in the same transaction as
+#                   their answers, a duplicate is acknowledged without being queued again and a replayed one is skipped
+#   recovery        at startup the submissions of the log which aren't in the submissions table are queued again, the
+#                   log is truncated once everything in it has been applied
+#   read-your-writes  the reads of a student's answers (@read_your_writes) first wait for the student's pending
+#                   submissions to be applied, and are answered 503 with Retry-After if they still aren't after
+#                   READ_YOUR_WRITES_TIMEOUT rather than with a list missing them
+#
+# A submission which can't be applied (e.g. a NOT NULL column missing) fails on its own: the batch is retried one
+# submission at a time and the failing one is recorded with status 'failed' and its error, see GET
+# /student_answers/submissions/<submission_id>. The routes check the types of the ids before a submission is logged,
+# and whatever goes wrong with a batch the writer carries on with the next one.
+#
+# The buffer belongs to one process: with several workers every worker needs its own WRITE_BEHIND_LOG.
+
+DEFAULT_BATCH_SIZE = 500
+FLUSH_INTERVAL = 0.05  # seconds the writer waits for more submissions before applying a partial batch
+READ_YOUR_WRITES_TIMEOUT = 5.0
+RETRY_AFTER = 1  # seconds a read which timed out waiting for the student's submissions is told to wait
+
+
+class SubmissionLog:
+    """This class is the append-only log of the submissions, one JSON line each"""
+
+    def __init__(self, path: str, fsync: bool = True):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.fsync = fsync
+        self._file = open(path, "a+b")
+        self._written = self._synced = self._file.tell()
+        self._sync_lock = threading.Lock()
+
+    def records(self) -> list:
+        """This function reads back every complete record of the log (a line cut by a crash is ignored)"""
+        self._file.seek(0)
+        records = []
+        for line in self._file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        self._file.seek(0, os.SEEK_END)
+        return records
+
+    def write(self, record: dict) -> int:
+        """This function writes a record (the caller serializes the writes) and returns the log position after it"""
+        self._file.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        self._file.flush()
+        self._written = self._file.tell()
+        return self._written
+
+    def sync(self, position: int):
+        """This function makes the log durable up to the position, one fsync covering every line written so far"""
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= position:
+                return  # synced by another request in the meantime
+            target = self._written
+            os.fsync(self._file.fileno())
+            self._synced = target
+
+    def truncate(self):
+        self._file.truncate(0)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._written = self._synced = 0
+
+    def close(self):
+        self._file.close()
+
+
+class WriteBehindBuffer:
+    """This class queues the submissions written to the log and runs the writer applying them in batches"""
+
+    def __init__(self, app, log_path: str, batch_size: int = DEFAULT_BATCH_SIZE, fsync: bool = True):
+        self.app = app
+        self.log = SubmissionLog(log_path, fsync)
+        self.batch_size = batch_size
+        self.queue = deque()
+        self.pending_ids = set()
+        self.pending_students = {}  # student id (as text, whatever JSON type it was sent as) -> pending submissions
+        self.stats = {"submitted": 0, "duplicates": 0, "applied": 0, "failed": 0, "batches": 0}
+        self._lock = threading.Lock()  # serializes the log writes with the queue so both stay in seq order
+        self._applied = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._recover()
+        self._writer = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._writer.start()
+
+    def _recover(self):
+        """This function queues again the submissions of the log which were never applied"""
+        records = self.log.records()
+        ids = [record["submission_id"] for record in records]
+        applied = set()
+        with self.app.app_context():
+            last_seq = db.session.execute(select(db.func.max(Submission.seq))).scalar() or 0
+            for start in range(0, len(ids), DEFAULT_BATCH_SIZE):
+                applied.update(db.session.execute(select(Submission.submission_id).where(
+                    Submission.submission_id.in_(ids[start:start + DEFAULT_BATCH_SIZE]))).scalars())
+            db.session.remove()
+        self.next_seq = max([last_seq] + [record["seq"] for record in records]) + 1
+        for record in records:
+            if record["submission_id"] not in applied and record["submission_id"] not in self.pending_ids:
+                self._enqueue(record)
+        if not self.queue:
+            self.log.truncate()
+
+    def _enqueue(self, record: dict):
+        self.queue.append(record)
+        self.pending_ids.add(record["submission_id"])
+        student_id = str(record["data"].get("student_id"))
+        self.pending_students[student_id] = self.pending_students.get(student_id, 0) + 1
+
+    def submit(self, kind: str, data: dict, submission_id: str = None) -> tuple:
+        """This function writes a submission to the log and queues it, and returns (submission_id, duplicate). A
+        submission_id already pending or applied isn't queued again"""
+        submission_id = submission_id or uuid.uuid4().hex
+        applied = db.session.get(Submission, submission_id) is not None
+
+        with self._lock:
+            if applied or submission_id in self.pending_ids:
+                self.stats["duplicates"] += 1
+                return submission_id, True
+            record = {"seq": self.next_seq, "submission_id": submission_id, "kind": kind, "data": data}
+            self.next_seq += 1
+            position = self.log.write(record)
+            self._enqueue(record)
+            self.stats["submitted"] += 1
+        self.log.sync(position)
+        self._wake.set()
+        return submission_id, False
+
+    def wait_for_student(self, student_id, timeout: float = READ_YOUR_WRITES_TIMEOUT) -> bool:
+        """This function waits until the pending submissions of the student are applied, False on timeout"""
+        student_id = str(student_id)
+        with self._lock:
+            if not self.pending_students.get(student_id):
+                return True
+            self._wake.set()
+            return self._applied.wait_for(lambda: not self.pending_students.get(student_id), timeout)
+
+    def flush(self, timeout: float = None) -> bool:
+        """This function waits until every queued submission is applied"""
+        with self._lock:
+            self._wake.set()
+            return self._applied.wait_for(lambda: not self.pending_ids, timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(FLUSH_INTERVAL)  # lets a burst of submissions build a batch
+            self._wake.clear()
+            while True:
+                with self._lock:
+                    batch = [self.queue[n] for n in range(min(self.batch_size, len(self.queue)))]
+                if not batch:
+                    break
+                try:
+                    with self.app.app_context():
+                        try:
+                            results = self._apply(batch)
+                        finally:
+                            db.session.remove()
+                except OperationalError:
+                    time.sleep(0.5)  # database locked or unavailable, the batch stays queued and is retried
+                    continue
+                except Exception as e:
+                    # Never lets one batch stop the writer, its submissions are given up as failed
+                    print(f"Write-behind batch of {len(batch)} submissions failed: {e!r}")
+                    results = ["failed"] * len(batch)
+                self._done(batch, results)
+
+    def _apply(self, batch: list) -> list:
+        """This function applies a batch in one transaction, or one submission at a time if the batch fails, and
+        returns the status of every submission"""
+        try:
+            results = self._apply_in_transaction(batch)
+            db.session.commit()
+            return results
+        except OperationalError:
+            db.session.rollback()
+            raise
+        except Exception:
+            db.session.rollback()
+
+        results = []
+        for record in batch:
+            try:
+                results += self._apply_in_transaction([record])
+                db.session.commit()
+            except OperationalError:
+                db.session.rollback()
+                raise
+            except Exception as e:
+                db.session.rollback()
+                results.append(self._failed(record, e))
+        return results
+
+    @staticmethod
+    def _failed(record: dict, error: Exception) -> str:
+        # Only the submission id and the error are recorded, the data which failed could fail this INSERT too
+        try:
+            db.session.execute(insert(Submission), {
+                "submission_id": record["submission_id"], "seq": record["seq"], "kind": record["kind"],
+                "status": "failed", "error": str(getattr(error, "orig", error))[:500],
+            })
+            db.session.commit()
+        except OperationalError:
+            db.session.rollback()
+            raise
+        except Exception as e:
+            db.session.rollback()
+            print(f"Write-behind submission {record['submission_id']} failed and couldn't be recorded: {e!r}")
+        return "failed"
+
+    def _apply_in_transaction(self, batch: list) -> list:
+        ids = [record["submission_id"] for record in batch]
+        already_applied = set(db.session.execute(
+            select(Submission.submission_id).where(Submission.submission_id.in_(ids))).scalars())
+
+        results, submissions, answers, answer_ids_of_batch = [], [], [], []
+
+        def insert_answers():
+            # Consecutive single answers go in one executemany INSERT
+            if answers:
+                answer_ids = db.session.execute(
+                    insert(StudentAnswer).returning(StudentAnswer.id, sort_by_parameter_order=True),
+                    [row for _, row in answers]
+                ).scalars().all()
+                for (submission, row), answer_id in zip(answers, answer_ids):
+                    submission.update(attempt_number=row["attempt_number"], answer_ids=json.dumps([answer_id]))
+                answer_ids_of_batch.extend(answer_ids)
+                answers.clear()
+
+        for record in batch:
+            if record["submission_id"] in already_applied:
+                results.append("duplicate")
+                continue
+            data = record["data"]
+            submission = {"submission_id": record["submission_id"], "seq": record["seq"], "kind": record["kind"],
+                          "student_id": data.get("student_id"), "status": "applied"}
+            submissions.append(submission)
+            if record["kind"] == "answer":
+                answers.append((submission, data))
+            else:
+                insert_answers()
+                attempt_number, answer_ids = insert_attempt(data["student_id"], data["answers"], data.get("quiz_id"),
+                                                            data.get("assignment_id"))
+                submission.update(attempt_number=attempt_number, answer_ids=json.dumps(answer_ids))
+                answer_ids_of_batch.extend(answer_ids)
+            results.append("applied")
+        insert_answers()
+
+        if submissions:
+            db.session.execute(insert(Submission), [{"error": None, **submission} for submission in submissions])
+        if answer_ids_of_batch:
+            record_submission(answer_ids_of_batch[0])  # one feed event for the whole batch
+        return results
+
+    def _done(self, batch: list, results: list):
+        with self._lock:
+            for record, status in zip(batch, results):
+                self.queue.popleft()
+                self.pending_ids.discard(record["submission_id"])
+                student_id = str(record["data"].get("student_id"))
+                self.pending_students[student_id] -= 1
+                if not self.pending_students[student_id]:
+                    del self.pending_students[student_id]
+                self.stats["failed" if status == "failed" else "applied"] += 1
+            self.stats["batches"] += 1
+            # Everything written to the log has been applied, it can start over
+            if not self.queue:
+                self.log.truncate()
+            self._applied.notify_all()
+
+
+def buffer():
+    """This function returns the write-behind buffer of the current app, None when it is off"""
+    return current_app.extensions.get("write_behind")
+
+
+def submission_id_of(data: dict):
+    """This function returns the client's submission_id of the current request, from the body or the Idempotency-Key
+    header"""
+    submission_id = data.get("submission_id") or request.headers.get("Idempotency-Key")
+    return str(submission_id)[:64] if submission_id else None
+
+
+def read_your_writes(student_arg: str):
+    """This function returns a decorator making a view wait for the pending submissions of the student given by the
+    view argument, so a student reading their answers sees the ones they have just submitted. When they aren't applied
+    in time the view isn't run and the read is answered 503"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            pending = buffer()
+            if pending is not None and not pending.wait_for_student(kwargs[student_arg]):
+                return ({"error": "The student's latest submissions are still being saved, try again shortly."},
+                        503, {"Retry-After": str(RETRY_AFTER)})
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    """This function starts the write-behind buffer when WRITE_BEHIND is on, run by create_app once the migrations have
+    been applied"""
+    if app.config.setdefault("WRITE_BEHIND", os.getenv("WRITE_BEHIND", "off")) != "on":
+        return
+    default_path = os.path.join(app.root_path, "data", "submissions.log")
+    app.extensions["write_behind"] = WriteBehindBuffer(
+        app,
+        app.config.setdefault("WRITE_BEHIND_LOG", os.getenv("WRITE_BEHIND_LOG", default_path)),
+        batch_size=int(app.config.setdefault("WRITE_BEHIND_BATCH", os.getenv("WRITE_BEHIND_BATCH", DEFAULT_BATCH_SIZE))),
+        fsync=app.config.setdefault("WRITE_BEHIND_FSYNC", os.getenv("WRITE_BEHIND_FSYNC", "on")) == "on",
+    )